@@ -1,6 +1,7 @@
 import pathlib
 import sys
 
+import drymass
 import matplotlib.pylab as plt
 import numpy as np
 
@@ -29,15 +30,16 @@ def dot_boxplot(ax, data, colors, labels, **kwargs):
 
 def plot_comparison(path):
     """Comparison plot of analysis results"""
+    stat = drymass.anasphere.load_statistics(path)
     ri_data = [
-        np.loadtxt(path / "sphere_image_rytov-sc_statistics.txt",
-                   usecols=(1,)),
-        np.loadtxt(path / "sphere_image_rytov_statistics.txt",
-                   usecols=(1,)),
-        np.loadtxt(path / "sphere_image_projection_statistics.txt",
-                   usecols=(1,)),
-        np.loadtxt(path / "sphere_edge_projection_statistics.txt",
-                   usecols=(1,)),
+        stat["index"][(stat["method"] == "image")
+                      & (stat["model"] == "rytov-sc")],
+        stat["index"][(stat["method"] == "image")
+                      & (stat["model"] == "rytov")],
+        stat["index"][(stat["method"] == "image")
+                      & (stat["model"] == "projection")],
+        stat["index"][(stat["method"] == "edge")
+                      & (stat["model"] == "projection")],
     ]
     colors = ["#E48620", "#DE2400", "#6e559d", "#048E00"]
     labels = ["image rytov-sc", "image rytov",
@@ -1,15 +1,66 @@
+import ast
+import hashlib
+import os
 import pathlib
+import re
+import shutil
+import traceback
 
+import h5py
 import numpy as np
 import qpimage
 import qpsphere
 
+from .extractroi import get_roi_meta, is_edge_fit_compatible
+from .fitworker import SphereFitTimeoutError, SphereFitWorker
+from .quality import check_roi_quality, compute_roi_quality
 from . import util
 
 #: Output sphere analysis qpimage.QPSeries data
 FILE_SPHERE_DATA = "sphere_{}_{}_data.h5"
+#: Journal directory of completed fits (for resuming interrupted runs)
+DIR_SPHERE_JOURNAL = "sphere_{}_{}_journal"
+#: Output report of failed sphere fits (see `isolate_failures`)
+FILE_SPHERE_FAILURES = "sphere_{}_{}_failures.txt"
 #: Output sphere analysis statistics
 FILE_SPHERE_STAT = "sphere_{}_{}_statistics.txt"
+#: Output sphere analysis statistics (NumPy structured array)
+FILE_SPHERE_STAT_NPY = "sphere_{}_{}_statistics.npy"
+#: Columns and data types of `FILE_SPHERE_STAT_NPY`; the lengths of
+#: the string columns ("U") are determined when writing the data.
+SPHERE_STAT_DTYPE = [("identifier", "U"),
+                     ("index", np.float64),
+                     ("radius_um", np.float64),
+                     ("rel_dry_mass_pg", np.float64),
+                     ("abs_dry_mass_pg", np.float64),
+                     ("time", np.float64),
+                     ("medium", np.float64),
+                     ("center_x_px", np.float64),
+                     ("center_y_px", np.float64),
+                     ("wavelength_nm", np.float64),
+                     ("pixel_size_um", np.float64),
+                     ("refraction_increment", np.float64),
+                     ("radial_inclusion_factor", np.float64),
+                     ("method", "U"),
+                     ("model", "U"),
+                     ("status", "U"),
+                     ]
+#: Order of the computational cost of the sphere models (used for
+#: warm starts when several models are analyzed in a single pass)
+MODEL_COST = {"projection": 0,
+              "rytov": 1,
+              "rytov-sc": 2,
+              "mie-avg": 3,
+              "mie": 4,
+              }
+#: Minimum sphere radius [px] for coarse-to-fine image fitting levels
+COARSE_MIN_RADIUS_PX = 8
+#: HDF5 group in `FILE_SPHERE_DATA` holding the sphere fit parameters
+H5_SPHERE_PARAMS = "sphere_params"
+#: Sphere fit parameters (see :func:`get_sim_params`)
+SPHERE_PARAMS = ["identifier", "sim index", "sim radius", "sim center",
+                 "sim model", "medium index", "wavelength", "pixel size",
+                 "shape", "phase offset", "status"]
 
 
 class EdgeDetectionFailedWarning(UserWarning):
@@ -18,8 +69,14 @@ class EdgeDetectionFailedWarning(UserWarning):
 
 def analyze_sphere(h5roi, dir_out, r0=10e-6, method="edge",
                    model="projection", edgekw={}, imagekw={},
-                   alpha=.18, rad_fact=1.2, ret_changed=False,
-                   ret_reused=False, count=None, max_count=None):
+                   alpha=.18, rad_fact=1.2, fit_cache=None,
+                   store_sim=True, fit_timeout=None, timeout_fallback="edge",
+                   warm_start=True, coarse_levels=0, sim_library=None,
+                   search_init=False, quality_gate=None,
+                   isolate_failures=False, phase_only=False,
+                   float32=False, h5_compression=None, ret_changed=False,
+                   ret_reused=False, ret_failed=False, count=None,
+                   max_count=None):
     """Perform sphere analysis
 
     Parameters
@@ -30,10 +87,11 @@ def analyze_sphere(h5roi, dir_out, r0=10e-6, method="edge",
         Path to output directory
     r0: float
         Initial radius
-    method: str
+    method: str or list of str
         Either "edge" or "image"; see :ref:`config_sphere` for
-        more information.
-    model: str
+        more information. A list of methods (paired with `model`)
+        performs several sphere analyses in a single pass.
+    model: str or list of str
         Propagation model to use; see :ref:`config_sphere` for
         more information.
     edgekw: dict
@@ -44,159 +102,1120 @@ def analyze_sphere(h5roi, dir_out, r0=10e-6, method="edge",
         Refraction increment [mL/g]
     rad_fact: float
         Radial inclusion factor for dry mass computation
+    fit_cache: drymass.fitcache.SphereFitCache or None
+        Persistent cache for sphere fits; If set, fits of ROIs that
+        have been fitted before with the same parameters (e.g. in
+        other datasets or with other ROI extraction parameters)
+        are taken from the cache.
+    store_sim: bool
+        Store the simulated phase and amplitude data of each ROI in
+        the output file. If set to False, only the fit parameters are
+        stored (see :func:`load_sphere_params`) and the simulated data
+        can be recomputed on demand with :func:`simulate_sphere`.
+    fit_timeout: float or None
+        Maximum wall-clock time of a sphere fit [s]. If set, the
+        fits are performed in a separate worker process which is
+        terminated when a fit takes longer
+        (see :class:`drymass.fitworker.SphereFitWorker`).
+    timeout_fallback: str
+        What to do with ROIs whose fit timed out: "edge" uses the
+        (fast) edge-detection method with the projection model
+        instead; "skip" only records "skipped-timeout" in the
+        statistics. Timed-out ROIs are fitted again when
+        :func:`analyze_sphere` is called again.
+    warm_start: bool
+        If several methods/models are given, use the result of the
+        preceding (cheaper, see :const:`MODEL_COST`) analysis of an
+        ROI as the initial guess for the image fit of the next one.
+    coarse_levels: int
+        Number of coarse-to-fine levels for the image fit
+        (see :func:`fit_sphere`)
+    sim_library: drymass.simlib.SphereSimLibrary or None
+        If set, the initial parameters of the image fit are obtained
+        from this library of precomputed sphere simulations instead
+        of from edge detection (unless there is a warm start or an
+        edge detection result from the ROI extraction). ROIs that
+        do not match the library (e.g. objects with negative
+        contrast) are initialized by edge detection.
+    search_init: bool
+        Use the radius and center of each object found in the ROI
+        search (see :func:`drymass.extractroi.get_search_meta`) as
+        initial parameters instead of `r0` and the ROI center
+        (ROIs without search geometry, e.g. if the ROI location
+        was forced, are fitted with `r0`).
+    quality_gate: dict or None
+        Lower limits of cheap ROI quality metrics (keyword arguments
+        to :func:`drymass.quality.check_roi_quality`, e.g.
+        ``{"min_symmetry": .8, "min_border_margin": 0}``). ROIs that
+        do not pass are not fitted and "rejected-<metrics>" is
+        recorded as their status in the statistics. The metrics are
+        only computed for ROIs that are about to be fitted, i.e.
+        fits reused from a previous run or from `fit_cache` are
+        not checked.
+    isolate_failures: bool
+        If set, exceptions raised while fitting an ROI do not abort
+        the analysis. The ROI is recorded with the status
+        "failed-<exception name>" in the statistics, the traceback
+        is written to `dir_out/FILE_SPHERE_FAILURES`, and the fit is
+        attempted again when :func:`analyze_sphere` is called again.
+    phase_only: bool
+        Only store the simulated phase data (if `store_sim` is set);
+        The amplitude of the simulations is not stored
+        (see :func:`drymass.util.write_amplitude_placeholder`).
+    float32: bool
+        Compute the dry mass in single precision (see
+        :func:`dry_mass_sphere`); The sphere fits are always
+        performed in double precision.
+    h5_compression: dict or None
+        HDF5 compression of the simulated data (see
+        :func:`drymass.util.get_h5_compression`); defaults to
+        :const:`drymass.util.H5_COMPRESSION`
     ret_changed: bool
         Return boolean indicating whether the sphere data on disk was
         created/updated (True) or whether only previously created ROI
-        data was used (False).
+        data was used (False). Changing only `alpha` or `rad_fact`
+        does not change the sphere data (only the statistics).
     ret_reused: bool
         Return integer indicating how many previous fits
-        were reused.
+        were reused (including fits from `fit_cache`).
+    ret_failed: bool
+        Return list of the identifiers of the ROIs whose fit failed
+        (see `isolate_failures`).
     count, max_count: multiprocessing.Value
         Can be used to monitor the progress of the algorithm.
         Initially, the value of `max_count.value` is incremented
         by the total number of steps. At each step, the value
         of `count.value` is incremented.
+
+    Returns
+    -------
+    h5out: pathlib.Path or list of pathlib.Path
+        Output file(s) `dir_out/FILE_SPHERE_DATA`
+    changed: bool or list of bool
+        See `ret_changed`
+    reused: int or list of int
+        See `ret_reused`
+    failed: list of str or list of lists of str
+        See `ret_failed`
+
+    If lists of methods or models are given, the return values are
+    lists in the same order.
+
+    Notes
+    -----
+    If the ROIs were background-corrected with a sphere mask
+    (see :func:`drymass.extractroi.extract_roi`), the edge detection
+    results stored in `h5roi` are reused (see :func:`fit_sphere`),
+    provided they were computed with the same `r0` and `edgekw`.
+
+    The output file `dir_out/FILE_SPHERE_DATA` is a
+    :class:`qpimage.QPSeries` file containing the simulated data
+    (if `store_sim` is set) and a table of the fit parameters of
+    all ROIs (group :const:`H5_SPHERE_PARAMS`). The statistics are
+    written as tab-separated text (`dir_out/FILE_SPHERE_STAT`) and as
+    a NumPy structured array (`dir_out/FILE_SPHERE_STAT_NPY`, see
+    :func:`load_statistics`).
+
+    The sphere analysis can be resumed after an interruption (e.g.
+    on preemptible compute nodes): Every completed image fit is
+    atomically written to a journal (`dir_out/DIR_SPHERE_JOURNAL`)
+    and reused in the next run; Edge fits are not journaled, because
+    they are faster to repeat. The output file is written to a temporary file
+    (`.part.h5`) which replaces `FILE_SPHERE_DATA` (and the journal)
+    only when all ROIs have been analyzed.
     """
+    multi = isinstance(method, (list, tuple)) or isinstance(model,
+                                                            (list, tuple))
+    methods = [method] if isinstance(method, str) else list(method)
+    models = [model] if isinstance(model, str) else list(model)
+    if len(methods) == 1:
+        methods *= len(models)
+    elif len(models) == 1:
+        models *= len(methods)
+    if len(methods) != len(models):
+        raise ValueError("Got {} methods, but {} models!".format(
+            len(methods), len(models)))
+    combinations = list(zip(methods, models))
+    if len(set(combinations)) != len(combinations):
+        raise ValueError("Duplicate method/model combinations: {}".format(
+            combinations))
+    if timeout_fallback not in ["edge", "skip"]:
+        raise ValueError("`timeout_fallback` must be 'edge' or 'skip', "
+                         + "got '{}'!".format(timeout_fallback))
+
     dir_out = pathlib.Path(dir_out).resolve()
+    qps_in = qpimage.QPSeries(h5file=h5roi, h5mode="r")
+    # edge detection results from ROI background correction
+    roi_meta = get_roi_meta(qps_in)
 
-    h5out = dir_out / FILE_SPHERE_DATA.format(method, model)
-    statout = dir_out / FILE_SPHERE_STAT.format(method, model)
-
-    with qpimage.QPSeries(h5file=h5roi, h5mode="r") as qps:
-        dataid, roiparid, roiexclid = qps.identifier.split(":")
-        cfgid = util.hash_object([r0,
-                                  method,
-                                  model,
-                                  edgekw,
-                                  imagekw if method == "image" else None,
-                                  alpha,
-                                  rad_fact])
-    # Previous reference dataset may contain valuable fitting results
-    h5ref = None
-    changed = True
-    reused = 0
-    if util.is_series_file(h5out):
-        with qpimage.QPSeries(h5file=h5out, h5mode="r") as qps_ref:
-            refids = qps_ref.identifier.split(":")
-            refids.pop(2)  # remove roiexclid from identifier
-        if [dataid, roiparid, cfgid] == refids:
-            # reuse (rename to temporary file)
-            h5ref = h5out.with_suffix(".ref.h5")
-            h5out.rename(h5ref)
-            changed = False
-
-    ids_ref = []
-    if h5ref is not None:
-        with qpimage.QPSeries(h5file=h5ref, h5mode="r") as qps_ref:
-            ids_ref = [qpi["identifier"] for qpi in qps_ref]
-
-    # initialize output file with identifier
-    identifier = ":".join([dataid, roiparid, roiexclid, cfgid])
-    with qpimage.QPSeries(h5file=h5out, h5mode="w",
-                          identifier=identifier) as qps_out:
-        pass
-
-    with qpimage.QPSeries(h5file=h5roi, h5mode="r") as qps_in, \
-            statout.open(mode="w") as fd:
-
-        header = ["identifier",
-                  "index",
-                  "radius_um",
-                  "rel_dry_mass_pg",
-                  "abs_dry_mass_pg",
-                  "time",
-                  "medium",
-                  ]
-        fd.write("#" + "\t".join(header) + "\r\n")
+    # cheap analyses first (warm start)
+    order = sorted(range(len(combinations)),
+                   key=lambda ii: (combinations[ii][0] != "edge",
+                                   MODEL_COST.get(combinations[ii][1],
+                                                  len(MODEL_COST))))
+    analyses = [_SphereAnalysis(dir_out=dir_out,
+                                roi_identifier=qps_in.identifier,
+                                r0=r0,
+                                method=combinations[ii][0],
+                                model=combinations[ii][1],
+                                edgekw=edgekw,
+                                imagekw=imagekw,
+                                alpha=alpha,
+                                rad_fact=rad_fact,
+                                store_sim=store_sim,
+                                timeout_fallback=timeout_fallback,
+                                coarse_levels=coarse_levels,
+                                search_init=search_init,
+                                isolate_failures=isolate_failures,
+                                phase_only=phase_only,
+                                float32=float32,
+                                h5_compression=h5_compression)
+                for ii in order]
 
+    # The output files are kept open until all ROIs are analyzed.
+    with qps_in, SphereFitWorker(timeout=fit_timeout) as fit_worker:
         if max_count is not None:
             with max_count.get_lock():
-                max_count.value += len(qps_in)
-
-        for qpi in qps_in:
-            simident = "{}:{}".format(qpi["identifier"], model)
-            if simident in ids_ref:
-                with qpimage.QPSeries(h5file=h5ref, h5mode="r") as qps_ref:
-                    qpi_sim = qps_ref[simident].copy()
-                n = qpi_sim["sim index"]
-                r = qpi_sim["sim radius"]
-                c = qpi_sim["sim center"]
-                ids_ref.remove(simident)
-                reused += 1
+                max_count.value += len(qps_in) * len(analyses)
+
+        try:
+            for qpi in qps_in:
+                meta = roi_meta.get(qpi["identifier"], {})
+                if quality_gate:
+                    quality_check = _QualityCheck(qpi=qpi,
+                                                  roi_meta=meta,
+                                                  r0=r0,
+                                                  edgekw=edgekw,
+                                                  search_init=search_init,
+                                                  quality_gate=quality_gate)
+                else:
+                    quality_check = None
+                init = None
+                for ana in analyses:
+                    res = ana.analyze(qpi=qpi,
+                                      roi_meta=meta,
+                                      fit_worker=fit_worker,
+                                      fit_cache=fit_cache,
+                                      init=init if warm_start else None,
+                                      sim_library=sim_library,
+                                      quality_check=quality_check)
+                    if res is not None:
+                        init = res
+                    if count is not None:
+                        with count.get_lock():
+                            count.value += 1
+        except BaseException:
+            for ana in analyses:
+                ana.close()
+            raise
+        for ana in analyses:
+            ana.finalize()
+
+    rets = []
+    for ii in range(len(combinations)):
+        ana = analyses[order.index(ii)]
+        ret = [ana.h5out]
+        if ret_changed:
+            ret.append(ana.changed)
+        if ret_reused:
+            ret.append(ana.reused)
+        if ret_failed:
+            ret.append([ff[0] for ff in ana.failures])
+        rets.append(ret)
+
+    if multi:
+        ret = [list(rr) for rr in zip(*rets)]
+    else:
+        ret = rets[0]
+    if len(ret) == 1:
+        ret = ret[0]
+    return ret
+
+
+class _SphereAnalysis(object):
+    def __init__(self, dir_out, roi_identifier, r0, method, model, edgekw,
+                 imagekw, alpha, rad_fact, store_sim, timeout_fallback,
+                 coarse_levels=0, search_init=False,
+                 isolate_failures=False, phase_only=False,
+                 float32=False, h5_compression=None):
+        """Sphere analysis of individual ROIs with one method and model
+
+        Writes the output files of :func:`analyze_sphere` and
+        reuses the fits of previous runs.
+        """
+        self.r0 = r0
+        self.method = method
+        self.model = model
+        self.edgekw = edgekw
+        self.imagekw = imagekw
+        self.alpha = alpha
+        self.rad_fact = rad_fact
+        self.store_sim = store_sim
+        self.timeout_fallback = timeout_fallback
+        self.coarse_levels = coarse_levels if method == "image" else 0
+        self.search_init = search_init
+        self.isolate_failures = isolate_failures
+        self.phase_only = phase_only
+        self.float32 = float32
+        self.h5_compression = h5_compression
+        self.failures = []
+
+        self.h5out = dir_out / FILE_SPHERE_DATA.format(method, model)
+        # written during the run and renamed in `finalize`
+        self.h5part = self.h5out.with_suffix(".part.h5")
+        self.statout = dir_out / FILE_SPHERE_STAT.format(method, model)
+        self.failout = dir_out / FILE_SPHERE_FAILURES.format(method, model)
+        self.statnpy = dir_out / FILE_SPHERE_STAT_NPY.format(method, model)
+
+        dataid, roiparid, roiexclid = roi_identifier.split(":")
+        # Only parameters that affect the fit are used here; `alpha`
+        # and `rad_fact` are only used for the statistics, which are
+        # always recomputed.
+        cfgparms = [r0,
+                    method,
+                    model,
+                    edgekw,
+                    imagekw if method == "image" else None,
+                    ]
+        if self.coarse_levels:
+            # (only if set, so that previous results can be reused)
+            cfgparms.append(self.coarse_levels)
+        if search_init:
+            cfgparms.append("search init")
+        if phase_only and store_sim:
+            cfgparms.append("phase only")
+        cfgid = util.hash_object(cfgparms)
+        # Previous reference dataset may contain valuable fitting results
+        self.h5ref = None
+        self.changed = True
+        self.reused = 0
+        h5ref_old = self.h5out.with_suffix(".ref.h5")
+        if h5ref_old.exists():
+            # interrupted run of DryMass < 0.13.0
+            h5ref_old.replace(self.h5out)
+        if is_sphere_file(self.h5out):
+            with qpimage.QPSeries(h5file=self.h5out, h5mode="r") as qps_ref:
+                refids = qps_ref.identifier.split(":")
+                refids.pop(2)  # remove roiexclid from identifier
+            if [dataid, roiparid, cfgid] == refids:
+                # reuse (replaced by `self.h5part` in `finalize`)
+                self.h5ref = self.h5out
+                self.changed = False
+
+        # Journal of the fits completed in previous (interrupted) runs
+        # with the same ROI data and fit parameters; Only the expensive
+        # image fits are journaled (edge fits are faster to repeat than
+        # to write to a journal entry).
+        self.journal_enabled = method == "image"
+        journal_dir = dir_out / DIR_SPHERE_JOURNAL.format(method, model)
+        self.journal = journal_dir / util.hash_object([dataid, roiparid,
+                                                       cfgid])
+        if journal_dir.exists():
+            for pp in journal_dir.iterdir():
+                if pp != self.journal or not self.journal_enabled:
+                    # different ROI data or fit parameters
+                    shutil.rmtree(pp, ignore_errors=True)
+        if self.journal_enabled:
+            self.journal.mkdir(parents=True, exist_ok=True)
+        self.journal_index = {}
+        for pp in self.journal.glob("*.h5"):
+            try:
+                params = load_sphere_params(pp)
+            except (OSError, KeyError):
+                # incomplete entry
+                continue
+            for simident in params:
+                self.journal_index[simident] = pp, params[simident]
+
+        self.params_ref = {}
+        self.qps_ref = None
+        self.ref_index = {}
+        if self.h5ref is not None:
+            self.qps_ref = qpimage.QPSeries(h5file=self.h5ref, h5mode="r")
+            self.params_ref = load_sphere_params(self.qps_ref)
+            self.ref_index = util.get_identifier_index(self.qps_ref)
+        self.params_out = []
+        self.stat_out = []
+
+        # initialize output file with identifier
+        identifier = ":".join([dataid, roiparid, roiexclid, cfgid])
+        self.qps_out = qpimage.QPSeries(h5file=self.h5part, h5mode="w",
+                                        identifier=identifier)
+        self.num_out = 0
+
+        self.header = ["identifier",
+                       "index",
+                       "radius_um",
+                       "rel_dry_mass_pg",
+                       "abs_dry_mass_pg",
+                       "time",
+                       "medium",
+                       "status",
+                       ]
+        self.fd = self.statout.open(mode="w")
+        self.fd.write("#" + "\t".join(self.header) + "\r\n")
+
+    def analyze(self, qpi, roi_meta, fit_worker, fit_cache=None, init=None,
+                sim_library=None, quality_check=None):
+        """Analyze one ROI and write the results
+
+        Parameters
+        ----------
+        qpi: qpimage.QPImage
+            ROI data
+        roi_meta: dict
+            ROI metadata (see :func:`drymass.extractroi.get_roi_meta`)
+        fit_worker: drymass.fitworker.SphereFitWorker
+            Performs the sphere fits
+        fit_cache: drymass.fitcache.SphereFitCache or None
+            Persistent sphere-fit cache
+        init: dict or None
+            Initial guess for the image fit (see :func:`fit_sphere`)
+        sim_library: drymass.simlib.SphereSimLibrary or None
+            Library for the initial guess of the image fit if
+            `init` is not set
+        quality_check: callable or None
+            Returns the reason for rejecting the ROI without fitting
+            or None (see :class:`_QualityCheck`); Only called if the
+            ROI is about to be fitted.
+
+        Returns
+        -------
+        result: dict or None
+            Fit result ("index", "radius", "center") or None if
+            the ROI was skipped or rejected
+        """
+        method = self.method
+        model = self.model
+        simident = "{}:{}".format(qpi["identifier"], model)
+        status = "ok"
+        if simident in self.journal_index:
+            # completed in an interrupted run
+            path, params = self.journal_index.pop(simident)
+            n = params["sim index"]
+            r = params["sim radius"]
+            c = params["sim center"]
+            qpi_sim = None
+            if self.store_sim:
+                with h5py.File(path, mode="r") as h5:
+                    if "qpi_0" in h5:
+                        h5.copy("qpi_0", self.qps_out.h5,
+                                name="qpi_{}".format(self.num_out))
+                        self.num_out += 1
+                    else:
+                        qpi_sim = simulate_sphere(params)
+            self.reused += 1
+            self.changed = True
+        elif (simident in self.params_ref
+                # do not reuse timeout fallbacks
+                and self.params_ref[simident]["status"] == "ok"):
+            params = self.params_ref.pop(simident)
+            n = params["sim index"]
+            r = params["sim radius"]
+            c = params["sim center"]
+            if self.store_sim and simident in self.ref_index:
+                # native HDF5 copy (no need to load the data)
+                qpi_sim = None
+                self.qps_ref.h5.copy(
+                    "qpi_{}".format(self.ref_index[simident]),
+                    self.qps_out.h5,
+                    name="qpi_{}".format(self.num_out))
+                self.num_out += 1
+            elif self.store_sim:
+                # reference contains only fit parameters
+                qpi_sim = simulate_sphere(params)
+            self.reused += 1
+        else:
+            if is_edge_fit_compatible(roi_meta, r0=self.r0,
+                                      edgekw=self.edgekw):
+                edge_fit = roi_meta
             else:
-                try:
-                    # fit sphere model
-                    n, r, c, qpi_sim = qpsphere.analyze(qpi,
-                                                        r0=r0,
-                                                        method=method,
-                                                        model=model,
-                                                        edgekw=edgekw,
-                                                        imagekw=imagekw,
-                                                        ret_center=True,
-                                                        ret_qpi=True)
-                except qpsphere.models.excpt.UnsupportedModelParametersError:
-                    print("Skipping object {} ".format(qpi["identifier"])
-                          + "because unsupported model parameters were "
-                          + "encountered.")
-                    continue
-                except BaseException as exc:
+                edge_fit = None
+            r0, c0 = _initial_geometry(roi_meta, self.r0, self.search_init)
+            if method != "image":
+                init = None
+            elif (init is None and edge_fit is None
+                    and sim_library is not None):
+                # (the library is defined by the global `r0`; None
+                # for a poor match, i.e. standard initialization)
+                init = sim_library.initial_guess(qpi=qpi,
+                                                 r0=self.r0,
+                                                 model=model,
+                                                 center=c0)
+            fitkw = {"r0": r0,
+                     "c0": c0,
+                     "method": method,
+                     "model": model,
+                     "edgekw": self.edgekw,
+                     "imagekw": self.imagekw,
+                     "edge_fit": edge_fit,
+                     "init": init,
+                     "coarse_levels": self.coarse_levels}
+            if fit_cache is not None:
+                cache_key = fit_cache.get_key(qpi, **fitkw)
+                cached = fit_cache.get(cache_key)
+            else:
+                cached = None
+            if cached is None and quality_check is not None:
+                # (only ROIs that are about to be fitted are checked)
+                rejected = quality_check()
+            else:
+                rejected = None
+            try:
+                if cached is not None:
+                    n, r, c, qpi_sim = cached
+                    self.reused += 1
+                elif rejected is not None:
+                    status = "rejected-{}".format(rejected)
+                else:
+                    try:
+                        # fit sphere model (with time budget)
+                        n, r, c, qpi_sim = fit_worker.fit_sphere(qpi,
+                                                                 **fitkw)
+                    except SphereFitTimeoutError:
+                        if self.timeout_fallback == "edge":
+                            status = "fallback-timeout"
+                            fitkw.update(method="edge", model="projection",
+                                         init=None)
+                            n, r, c, qpi_sim = fit_sphere(qpi, **fitkw)
+                        else:
+                            status = "skipped-timeout"
+                    else:
+                        if fit_cache is not None:
+                            fit_cache.set(cache_key, qpi_sim)
+            except qpsphere.models.excpt.UnsupportedModelParametersError:
+                print("Skipping object {} ".format(qpi["identifier"])
+                      + "because unsupported model parameters were "
+                      + "encountered.")
+                return None
+            except BaseException as exc:
+                if self.isolate_failures and isinstance(exc, Exception):
+                    # continue with the next ROI
+                    status = "failed-{}".format(exc.__class__.__name__)
+                    self.failures.append((qpi["identifier"],
+                                          traceback.format_exc()))
+                else:
                     # Be more verbose
-                    exc.args = ("ROI {}: ".format(qpi["identifier"])
-                                + exc.args[0],)
+                    if exc.args and isinstance(exc.args[0], str):
+                        exc.args = ("ROI {}: ".format(qpi["identifier"])
+                                    + exc.args[0],) + exc.args[1:]
                     raise
-                else:
-                    changed = True
+            if rejected is None:
+                self.changed = True
+            if not status.startswith(("skipped", "rejected", "failed")):
+                params = get_sim_params(qpi_sim, identifier=simident,
+                                        status=status)
+            if status == "ok" and self.journal_enabled:
+                self.journal_add(params, qpi_sim)
+        if status.startswith(("skipped", "rejected", "failed")):
+            n = r = dm_rel = dm_abs = np.nan
+            c = (np.nan, np.nan)
+        else:
             # write simulation results
-            with qpimage.QPSeries(h5file=h5out, h5mode="a") as qps_out:
-                qps_out.add_qpimage(qpi=qpi_sim, identifier=simident)
-            # finally, update text file
-            if "time" in qpi:
-                qptime = qpi["time"]
+            self.params_out.append(params)
+            if self.store_sim and qpi_sim is not None:
+                util.add_qpimage(self.qps_out, qpi_sim, index=self.num_out,
+                                 identifier=simident,
+                                 phase_only=self.phase_only,
+                                 compression=self.h5_compression)
+                self.num_out += 1
+            dm_rel, dm_abs = dry_mass_sphere(qpi=qpi,
+                                             radius=r,
+                                             center=c,
+                                             alpha=self.alpha,
+                                             rad_fact=self.rad_fact,
+                                             float32=self.float32)
+        # finally, update text file
+        if "time" in qpi:
+            qptime = qpi["time"]
+        else:
+            qptime = np.nan
+        data = {
+            "identifier": qpi["identifier"],
+            "index": n,
+            "radius_um": r * 1e6,
+            "abs_dry_mass_pg": dm_abs * 1e12,
+            "rel_dry_mass_pg": dm_rel * 1e12,
+            "time": qptime,
+            "medium": qpi["medium index"],
+            "status": status,
+        }
+        self.fd.write("\t".join([str(data[k]) for k in self.header])
+                      + "\r\n")
+        data.update({
+            "center_x_px": c[0],
+            "center_y_px": c[1],
+            "wavelength_nm": qpi["wavelength"] * 1e9,
+            "pixel_size_um": qpi["pixel size"] * 1e6,
+            "refraction_increment": self.alpha,
+            "radial_inclusion_factor": self.rad_fact,
+            "method": method,
+            "model": model,
+        })
+        self.stat_out.append(data)
+        if status == "ok":
+            return {"index": n, "radius": r, "center": c}
+        else:
+            return None
+
+    def close(self):
+        """Close all files"""
+        self.fd.close()
+        self.qps_out.h5.close()
+        if self.qps_ref is not None:
+            self.qps_ref.h5.close()
+
+    def finalize(self):
+        """Write fit parameters and statistics and clean up"""
+        # write fit parameters
+        write_sphere_params(self.qps_out.h5, self.params_out)
+        self.close()
+        # write columnar statistics
+        with self.statnpy.open(mode="wb") as fd:
+            np.save(fd, get_statistics_array(self.stat_out))
+
+        if self.params_ref:
+            # leftovers
+            self.changed = True
+        # failure report
+        if self.failures:
+            with self.failout.open(mode="w") as fd:
+                for identifier, tb in self.failures:
+                    fd.write("ROI {}:\n{}\n".format(identifier, tb))
+        elif self.failout.exists():
+            self.failout.unlink()
+        # commit (the journal is not needed anymore afterwards)
+        self.h5part.replace(self.h5out)
+        shutil.rmtree(self.journal.parent, ignore_errors=True)
+
+    def journal_add(self, params, qpi_sim):
+        """Atomically write a completed fit to the journal
+
+        The journal entries are sphere analysis files with a single
+        ROI that are written to a temporary file first. A subsequent
+        run after an interruption reuses these fits.
+        """
+        key = hashlib.sha256(params["identifier"].encode("utf-8"))
+        path = self.journal / "{}.h5".format(key.hexdigest())
+        path_temp = path.with_name(
+            "{}_{}.tmp".format(path.name, os.getpid()))
+        with qpimage.QPSeries(h5file=path_temp, h5mode="w") as qps:
+            if self.store_sim:
+                util.add_qpimage(qps, qpi_sim, index=0,
+                                 identifier=params["identifier"],
+                                 phase_only=self.phase_only,
+                                 compression=self.h5_compression)
+            write_sphere_params(qps.h5, [params])
+        path_temp.replace(path)
+
+
+class _QualityCheck(object):
+    def __init__(self, qpi, roi_meta, r0, edgekw, search_init,
+                 quality_gate):
+        """Quality gate of an ROI (see :func:`analyze_sphere`)
+
+        Calling an instance returns the reason for rejecting the
+        ROI or None (see :func:`drymass.quality.check_roi_quality`).
+        The quality metrics are computed with the first call, such
+        that ROIs whose fits are reused are not checked.
+        """
+        self.qpi = qpi
+        self.roi_meta = roi_meta
+        self.r0 = r0
+        self.edgekw = edgekw
+        self.search_init = search_init
+        self.quality_gate = quality_gate
+        self.metrics = None
+
+    def __call__(self):
+        if self.metrics is None:
+            r0, c0 = _initial_geometry(self.roi_meta, self.r0,
+                                       self.search_init)
+            self.metrics = compute_roi_quality(qpi=self.qpi,
+                                               r0=r0,
+                                               edgekw=self.edgekw,
+                                               c0=c0)
+        return check_roi_quality(self.metrics, **self.quality_gate)
+
+
+def _initial_geometry(roi_meta, r0, search_init):
+    """Return the initial radius and center (or None) of an ROI
+
+    If `search_init` is set and `roi_meta` contains the object
+    geometry from the ROI search, the per-object radius and center
+    are returned (see :func:`drymass.extractroi.get_search_meta`).
+    """
+    if search_init and "search radius" in roi_meta:
+        return roi_meta["search radius"], tuple(roi_meta["search center"])
+    else:
+        return r0, None
+
+
+def fit_sphere(qpi, r0, method="edge", model="projection", edgekw={},
+               imagekw={}, edge_fit=None, init=None, coarse_levels=0,
+               c0=None):
+    """Determine refractive index, radius, and center of a sphere
+
+    This is a wrapper around :func:`qpsphere.cnvnc.analyze` that
+    can make use of a previous edge detection result.
+
+    Parameters
+    ----------
+    qpi: qpimage.QPImage
+        QPI data
+    r0: float
+        Initial radius [m]
+    method: str
+        Either "edge" or "image"
+    model: str
+        Propagation model to use
+    edgekw: dict
+        Keyword arguments to :func:`qpsphere.edgefit.contour_canny`
+    imagekw: dict
+        Keyword arguments to :func:`qpsphere.imagefit.alg.match_phase`
+    edge_fit: dict or None
+        Edge detection result for `qpi` obtained with `r0` and `edgekw`
+        (see :func:`drymass.extractroi.edge_fit_roi`). If given, the
+        edge detection step is skipped; center and radius are taken
+        from `edge_fit` and the refractive index is computed from the
+        phase data of `qpi` (which might have been background-corrected
+        after `edge_fit` was computed).
+    init: dict or None
+        Initial guess for the image fit with the keys "index",
+        "radius" [m], and "center" [px], e.g. the result of a fit
+        with a cheaper model (warm start). If given and `method`
+        is "image", `edge_fit` is ignored.
+    c0: tuple of floats or None
+        Initial center [px], e.g. from the ROI search; If the edge
+        detection of `method="image"` fails, the image fit starts
+        at `c0` (with a refractive index computed from the phase
+        data within `r0`) instead of at the center of `qpi`.
+    coarse_levels: int
+        Number of coarse-to-fine levels for `method="image"`; The
+        image fit is first performed on QPI data binned by
+        2**`coarse_levels`, 2**(`coarse_levels`-1), ..., 2 (see
+        :func:`bin_qpi`), each level starting from the result of the
+        previous level, and finally refined at full resolution with
+        the stopping criteria in `imagekw`. Levels for which the
+        sphere radius is smaller than :const:`COARSE_MIN_RADIUS_PX`
+        binned pixels are skipped.
+
+    Returns
+    -------
+    n: float
+        Refractive index
+    r: float
+        Radius [m]
+    c: tuple of floats
+        Center position [px]
+    qpi_sim: qpimage.QPImage
+        Modeled data
+    """
+    px_m = qpi["pixel size"]
+    if init is not None and method == "image":
+        n = init["index"]
+        r = init["radius"]
+        c = init["center"]
+    elif edge_fit is not None:
+        # same as in :func:`qpsphere.edgefit.analyze`
+        c = edge_fit["edge center"]
+        r = edge_fit["edge radius"]
+        avg_phase = qpsphere.edgefit.average_sphere(qpi.pha, c, r / px_m)
+        n = qpi["medium index"] \
+            + avg_phase / (2 * np.pi * px_m / qpi["wavelength"])
+        if method == "edge":
+            if model != "projection":
+                raise ValueError(
+                    "`method='edge'` requires `model='projection'`!")
+            qpi_sim = qpsphere.simulate(radius=r,
+                                        sphere_index=n,
+                                        medium_index=qpi["medium index"],
+                                        wavelength=qpi["wavelength"],
+                                        grid_size=qpi.shape,
+                                        model="projection",
+                                        pixel_size=px_m,
+                                        center=c)
+            return n, r, c, qpi_sim
+    elif method == "image":
+        # same as in :func:`qpsphere.cnvnc.analyze`
+        try:
+            n, r, c = qpsphere.edgefit.analyze(qpi=qpi,
+                                               r0=r0,
+                                               edgekw=edgekw,
+                                               ret_center=True,
+                                               ret_edge=False)
+        except (qpsphere.edgefit.EdgeDetectionError,
+                qpsphere.edgefit.RadiusExceedsImageSizeError):
+            # proceed with best guess
+            r = r0
+            if c0 is None:
+                c = np.array(qpi.shape) / 2
+                n = qpi["medium index"] + np.sign(np.sum(qpi.pha)) * .01
             else:
-                qptime = np.nan
-            data = {
-                "identifier": qpi["identifier"],
-                "index": n,
-                "radius_um": r * 1e6,
-                "abs_dry_mass_pg": absolute_dry_mass_sphere(
-                    qpi=qpi,
-                    radius=r,
-                    center=c,
-                    alpha=alpha,
-                    rad_fact=rad_fact
-                ) * 1e12,
-                "rel_dry_mass_pg": relative_dry_mass(
-                    qpi=qpi,
-                    radius=r,
-                    center=c,
-                    alpha=alpha,
-                    rad_fact=rad_fact
-                ) * 1e12,
-                "time": qptime,
-                "medium": qpi["medium index"]
-            }
-            fd.write("\t".join([str(data[k]) for k in header]) + "\r\n")
-            fd.flush()
-            if count is not None:
-                with count.get_lock():
-                    count.value += 1
-
-    if ids_ref:
-        # leftovers
-        changed = True
-    # cleanup
-    if h5ref is not None:
-        h5ref.unlink()
-
-    ret = [h5out]
-    if ret_changed:
-        ret.append(changed)
-    if ret_reused:
-        ret.append(reused)
+                c = c0
+                avg_phase = qpsphere.edgefit.average_sphere(qpi.pha, c,
+                                                            r / px_m)
+                n = qpi["medium index"] \
+                    + avg_phase / (2 * np.pi * px_m / qpi["wavelength"])
+    else:
+        return qpsphere.analyze(qpi,
+                                r0=r0,
+                                method=method,
+                                model=model,
+                                edgekw=edgekw,
+                                imagekw=imagekw,
+                                ret_center=True,
+                                ret_qpi=True)
 
-    if len(ret) == 1:
-        ret = ret[0]
-    return ret
+    if method != "image":
+        raise NotImplementedError("`method` must be 'edge' or 'image'!")
+
+    # coarse-to-fine fitting
+    refine = False
+    for level in range(coarse_levels, 0, -1):
+        factor = 2**level
+        if r / (px_m * factor) < COARSE_MIN_RADIUS_PX:
+            # too coarse
+            continue
+        qpi_bin = bin_qpi(qpi, factor)
+        imagekw_bin = _refine_imagekw(imagekw) if refine else dict(imagekw)
+        # same stopping criterion for the position in [m]
+        imagekw_bin["stop_dc"] = imagekw_bin.get("stop_dc", 1) / factor
+        n, r, c_bin = qpsphere.imagefit.analyze(
+            qpi=qpi_bin,
+            model=model,
+            n0=n,
+            r0=r,
+            c0=(np.array(c) + .5) / factor - .5,
+            imagekw=imagekw_bin,
+            ret_center=True)
+        c = (np.array(c_bin) + .5) * factor - .5
+        refine = True
+
+    if refine:
+        imagekw = _refine_imagekw(imagekw)
+    n, r, c, qpi_sim = qpsphere.imagefit.analyze(qpi=qpi,
+                                                 model=model,
+                                                 n0=n,
+                                                 r0=r,
+                                                 c0=c,
+                                                 imagekw=imagekw,
+                                                 ret_center=True,
+                                                 ret_qpi=True)
+    return n, r, c, qpi_sim
+
+
+def _refine_imagekw(imagekw):
+    """Image fit keyword arguments for refining a coarse fit result
+
+    The initial search intervals are halved and the minimum number
+    of iterations is reduced to one; the stopping criteria are kept.
+    """
+    imagekw = dict(imagekw)
+    for key, default in [("crel", .05), ("nrel", .1), ("rrel", .05)]:
+        imagekw[key] = imagekw.get(key, default) / 2
+    imagekw["min_iter"] = 1
+    return imagekw
+
+
+def bin_qpi(qpi, factor):
+    """Bin QPI data to a coarser grid
+
+    Parameters
+    ----------
+    qpi: qpimage.QPImage
+        QPI data
+    factor: int
+        Binning factor; The phase and amplitude data of
+        `factor` x `factor` pixels are averaged (trailing
+        pixels are discarded).
+
+    Returns
+    -------
+    qpi_bin: qpimage.QPImage
+        Binned QPI data with the pixel size multiplied by `factor`
+    """
+    sx, sy = (np.array(qpi.shape) // factor) * factor
+
+    def binned(data):
+        return data[:sx, :sy].reshape(sx // factor, factor,
+                                      sy // factor, factor).mean(axis=(1, 3))
+
+    meta = dict(qpi.meta)
+    meta["pixel size"] = qpi["pixel size"] * factor
+    qpi_bin = qpimage.QPImage(data=(binned(qpi.pha), binned(qpi.amp)),
+                              which_data=("phase", "amplitude"),
+                              meta_data=meta,
+                              proc_phase=False)
+    return qpi_bin
+
+
+def get_statistics_array(rows):
+    """Convert sphere analysis statistics to a NumPy structured array
+
+    Parameters
+    ----------
+    rows: list of dict
+        Statistics of each ROI with the keys defined in
+        :const:`SPHERE_STAT_DTYPE`
+
+    Returns
+    -------
+    stat: np.ndarray
+        Structured array with the dtype :const:`SPHERE_STAT_DTYPE`
+        (string columns are as wide as the longest entry)
+    """
+    dtype = []
+    for name, dt in SPHERE_STAT_DTYPE:
+        if dt == "U":
+            size = max([len(rr[name]) for rr in rows] + [1])
+            dt = "U{}".format(size)
+        dtype.append((name, dt))
+    return np.array([tuple(rr[name] for name, _ in dtype) for rr in rows],
+                    dtype=dtype)
+
+
+def get_sim_params(qpi_sim, identifier=None, status="ok"):
+    """Return the sphere fit parameters of simulated sphere data
+
+    Parameters
+    ----------
+    qpi_sim: qpimage.QPImage
+        Modeled data (e.g. from :func:`fit_sphere`)
+    identifier: str or None
+        Identifier of the simulation; defaults to the identifier
+        of `qpi_sim`
+    status: str
+        Fit status, "ok" or "fallback-timeout" (see
+        :func:`analyze_sphere`)
+
+    Returns
+    -------
+    params: dict
+        Dictionary with the keys defined in :const:`SPHERE_PARAMS`;
+        "phase offset" is the (fitted) background phase of the
+        sphere image.
+    """
+    if identifier is None:
+        identifier = qpi_sim["identifier"]
+    params = {"identifier": identifier,
+              "shape": qpi_sim.shape,
+              # see :func:`qpsphere.imagefit.interp.compute_qpi`
+              "phase offset": -np.mean(qpi_sim.bg_pha),
+              "status": status,
+              }
+    for key in ["sim index", "sim radius", "sim center", "sim model",
+                "medium index", "wavelength", "pixel size"]:
+        params[key] = qpi_sim[key]
+    return params
+
+
+def is_sphere_file(path):
+    """Return True if `path` is a sphere analysis output file
+
+    This is a :class:`qpimage.QPSeries` file with identifier that
+    contains simulated data or sphere fit parameters (see
+    :func:`analyze_sphere`).
+    """
+    valid = False
+    if pathlib.Path(path).exists():
+        try:
+            with qpimage.QPSeries(h5file=path, h5mode="r") as qps:
+                if ((len(qps) or H5_SPHERE_PARAMS in qps.h5)
+                        and qps.identifier is not None):
+                    valid = True
+        except (IOError, OSError):
+            # corrupt file
+            pass
+    return valid
+
+
+def load_statistics(paths, method="*", model="*"):
+    """Load the columnar statistics of many sphere analyses
+
+    Parameters
+    ----------
+    paths: str, pathlib.Path, or list thereof
+        Statistics files (:const:`FILE_SPHERE_STAT_NPY`) or
+        directories that are searched recursively for such files
+    method: str
+        Sphere analysis method (glob pattern) of the statistics files
+        in the directories in `paths`
+    model: str
+        Sphere analysis model (glob pattern) of the statistics files
+        in the directories in `paths`
+
+    Returns
+    -------
+    stat: np.ndarray
+        Structured array (see :const:`SPHERE_STAT_DTYPE`) with the
+        rows of all statistics files and the additional column
+        "path" holding the directory of each file
+
+    Notes
+    -----
+    The files are read in binary form (no text parsing). For the
+    tab-separated statistics files (:const:`FILE_SPHERE_STAT`),
+    use :func:`numpy.loadtxt`.
+    """
+    if isinstance(paths, (str, pathlib.Path)):
+        paths = [paths]
+    pattern = FILE_SPHERE_STAT_NPY.format(method, model)
+    files = []
+    for pp in paths:
+        pp = pathlib.Path(pp)
+        if pp.is_dir():
+            files += sorted(pp.rglob(pattern))
+        else:
+            files.append(pp)
+
+    dtype_cache = {}
+    arrays = [_load_npy_1d(ff, dtype_cache) for ff in files]
+    # common string widths
+    dtype = []
+    for name, dt in SPHERE_STAT_DTYPE:
+        if dt == "U":
+            size = max([ar.dtype[name].itemsize // 4 for ar in arrays] + [1])
+            dt = "U{}".format(size)
+        dtype.append((name, dt))
+    dirs = [str(ff.parent) for ff in files]
+    dtype.append(("path", "U{}".format(max([len(dd) for dd in dirs] + [1]))))
+
+    stat = np.zeros(sum(ar.size for ar in arrays), dtype=dtype)
+    ii = 0
+    for ar, dd in zip(arrays, dirs):
+        sl = slice(ii, ii + ar.size)
+        for name in ar.dtype.names:
+            stat[name][sl] = ar[name]
+        stat["path"][sl] = dd
+        ii += ar.size
+    return stat
+
+
+def _load_npy_1d(path, dtype_cache):
+    """Load a one-dimensional array from a .npy file
+
+    Parsing the header with :func:`numpy.load` takes much longer than
+    reading the data of small files. Since statistics files usually
+    share only a few data types, the data type of each header
+    (without the shape) is cached in the dictionary `dtype_cache`.
+    """
+    with open(path, "rb") as fd:
+        major, _ = np.lib.format.read_magic(fd)
+        hlen = int.from_bytes(fd.read(2 if major == 1 else 4), "little")
+        header = fd.read(hlen).decode("latin1" if major < 3 else "utf-8")
+        match = re.search(r"'shape': \((\d+),\)", header)
+        if match is None:
+            # not a 1D array
+            return np.load(str(path), allow_pickle=False)
+        key = header.replace(match.group(0), "")
+        if key not in dtype_cache:
+            descr = ast.literal_eval(header)["descr"]
+            dtype_cache[key] = np.lib.format.descr_to_dtype(descr)
+        return np.fromfile(fd, dtype=dtype_cache[key],
+                           count=int(match.group(1)))
+
+
+def load_sphere_params(h5sim):
+    """Load the sphere fit parameters from a sphere analysis file
+
+    Parameters
+    ----------
+    h5sim: str, pathlib.Path, or qpimage.QPSeries
+        Output file of :func:`analyze_sphere`
+
+    Returns
+    -------
+    sphere_params: dict
+        Dictionary with the simulation identifiers as keys and the
+        fit parameters as values (see :func:`get_sim_params`)
+
+    Notes
+    -----
+    For files written with DryMass < 0.13.0 (without fit parameter
+    table), the fit parameters are extracted from the simulated data.
+    """
+    if not isinstance(h5sim, qpimage.QPSeries):
+        with qpimage.QPSeries(h5file=h5sim, h5mode="r") as qps:
+            return load_sphere_params(qps)
+    qps = h5sim
+    sphere_params = {}
+    if H5_SPHERE_PARAMS in qps.h5:
+        grp = qps.h5[H5_SPHERE_PARAMS]
+        columns = {}
+        for key in SPHERE_PARAMS:
+            columns[key] = grp[key][:]
+        for key in ["identifier", "sim model", "status"]:
+            columns[key] = [vv.decode("utf-8") if isinstance(vv, bytes)
+                            else vv for vv in columns[key]]
+        for ii, ident in enumerate(columns["identifier"]):
+            params = {}
+            for key in SPHERE_PARAMS:
+                params[key] = columns[key][ii]
+            params["shape"] = tuple(int(ss) for ss in params["shape"])
+            sphere_params[ident] = params
+    else:
+        for qpi_sim in qps:
+            params = get_sim_params(qpi_sim)
+            sphere_params[params["identifier"]] = params
+    return sphere_params
+
+
+def simulate_sphere(params):
+    """Compute simulated sphere data from fit parameters
+
+    Parameters
+    ----------
+    params: dict
+        Sphere fit parameters (see :func:`get_sim_params` and
+        :func:`load_sphere_params`)
+
+    Returns
+    -------
+    qpi_sim: qpimage.QPImage
+        Modeled data (same as returned by :func:`fit_sphere`)
+    """
+    qpi_sim = qpsphere.simulate(radius=params["sim radius"],
+                                sphere_index=params["sim index"],
+                                medium_index=params["medium index"],
+                                wavelength=params["wavelength"],
+                                grid_size=params["shape"],
+                                model=params["sim model"],
+                                pixel_size=params["pixel size"],
+                                center=params["sim center"])
+    if params["phase offset"]:
+        # see :func:`qpsphere.imagefit.interp.compute_qpi`
+        bg_data = np.ones(qpi_sim.shape) * -params["phase offset"]
+        qpi_sim.set_bg_data(bg_data=bg_data, which_data="phase")
+    return qpi_sim
+
+
+def write_sphere_params(h5, params_list):
+    """Write sphere fit parameters to an HDF5 group
+
+    Parameters
+    ----------
+    h5: h5py.Group
+        The group (e.g. of a :class:`qpimage.QPSeries`) in which
+        to create the table :const:`H5_SPHERE_PARAMS` (if it exists,
+        it is replaced)
+    params_list: list of dict
+        Sphere fit parameters (see :func:`get_sim_params`)
+    """
+    if H5_SPHERE_PARAMS in h5:
+        del h5[H5_SPHERE_PARAMS]
+    grp = h5.create_group(H5_SPHERE_PARAMS)
+    for key in SPHERE_PARAMS:
+        values = [pp[key] for pp in params_list]
+        if key in ["identifier", "sim model", "status"]:
+            grp.create_dataset(key, data=values,
+                               dtype=h5py.string_dtype())
+        elif key in ["sim center", "shape"]:
+            dtype = int if key == "shape" else float
+            grp.create_dataset(key, data=np.array(values, dtype=dtype
+                                                  ).reshape(-1, 2))
+        else:
+            grp.create_dataset(key, data=np.array(values, dtype=float))
 
 
 def absolute_dry_mass_sphere(qpi, radius, center, alpha=.18, rad_fact=1.2):
@@ -242,16 +1261,117 @@ def absolute_dry_mass_sphere(qpi, radius, center, alpha=.18, rad_fact=1.2):
     -------
     dry_mass: float
         The absolute dry mass of the sphere [g]
+
+    See Also
+    --------
+    dry_mass_sphere: relative and absolute dry mass for many values
+        of `alpha` and `rad_fact`
     """
-    dm_rel = relative_dry_mass(qpi=qpi,
-                               radius=radius,
+    return dry_mass_sphere(qpi=qpi,
+                           radius=radius,
+                           center=center,
+                           alpha=alpha,
+                           rad_fact=rad_fact)[1]
+
+
+def dry_mass_sphere(qpi, radius, center, alpha=.18, rad_fact=1.2,
+                    float32=False):
+    """Compute relative and absolute dry mass of a spherical phase object
+
+    This is a vectorized combination of :func:`relative_dry_mass`
+    and :func:`absolute_dry_mass_sphere`. The phase data are only
+    summed up once (see :func:`radial_phase_sum`), which makes
+    it efficient to compute the dry mass for many radial inclusion
+    factors and refraction increments.
+
+    Parameters
+    ----------
+    qpi: qpimage.QPImage
+        QPI data
+    center: tuble (x,y)
+        Center of the sphere [px]
+    radius: float
+        Radius of the sphere [m]
+    alpha: float or array_like
+        Refraction increment [mL/g]
+    rad_fact: float or array_like
+        Inclusion factor that scales `radius` to increase
+        the area used for phase summation
+    float32: bool
+        Sum up the phase in single precision
+
+    Returns
+    -------
+    dm_rel, dm_abs: float or np.ndarray
+        The relative and absolute dry mass of the sphere [g]; The
+        shape is that of `alpha` and `rad_fact` broadcast against
+        each other (e.g. use ``alpha[:, np.newaxis]`` to compute
+        the dry mass for all combinations of `alpha` and `rad_fact`).
+    """
+    alpha, rad_fact = np.broadcast_arrays(np.asarray(alpha, dtype=float),
+                                          np.asarray(rad_fact, dtype=float))
+    pha = qpi.pha
+    if float32:
+        pha = pha.astype(np.float32)
+    phi_tot = radial_phase_sum(image=pha,
                                center=center,
-                               alpha=alpha,
-                               rad_fact=rad_fact)
-    medium_index = qpi["medium index"]
-    dm_sup = 4 / 3 * np.pi / (alpha * 1e-6) * \
-        radius**3 * (medium_index - 1.335)
-    return dm_rel + dm_sup
+                               radii=radius / qpi["pixel size"] * rad_fact)
+    # convert alpha mL/g to m³/g
+    alpha_m3g = alpha * 1e-6
+    # same as in :func:`relative_dry_mass`
+    pxarea = qpi["pixel size"]**2
+    dm_rel = qpi["wavelength"] / (2 * np.pi * alpha_m3g) * phi_tot * pxarea
+    # same as in :func:`absolute_dry_mass_sphere`
+    dm_sup = 4 / 3 * np.pi / alpha_m3g * \
+        radius**3 * (qpi["medium index"] - 1.335)
+    dm_abs = dm_rel + dm_sup
+    return dm_rel[()], dm_abs[()]
+
+
+def radial_phase_sum(image, center, radii):
+    """Sum up the phase within circles around a common center
+
+    The cumulative radial phase sum is computed only once (within
+    the bounding box of the largest circle) and evaluated for all
+    `radii`.
+
+    Parameters
+    ----------
+    image: 2d np.ndarray
+        Phase image [rad]
+    center: tuple (x,y)
+        Center of the circles [px]
+    radii: float or array_like
+        Radii of the circles [px]; Only pixels whose distance to
+        `center` is smaller than the radius are included.
+
+    Returns
+    -------
+    phi_tot: float or np.ndarray
+        The total phase within each circle [rad] with the shape
+        of `radii`
+    """
+    radii = np.asarray(radii, dtype=float)
+    sx, sy = image.shape
+    cx, cy = center
+    valid = radii[~np.isnan(radii)]
+    rmax = max(np.max(valid), 0) if valid.size else 0
+    # bounding box
+    x0 = int(np.clip(np.floor(cx - rmax), 0, sx))
+    x1 = int(np.clip(np.ceil(cx + rmax) + 1, 0, sx))
+    y0 = int(np.clip(np.floor(cy - rmax), 0, sy))
+    y1 = int(np.clip(np.ceil(cy + rmax) + 1, 0, sy))
+    x = np.arange(x0, x1).reshape(-1, 1)
+    y = np.arange(y0, y1).reshape(1, -1)
+    discsq = ((x - cx)**2 + (y - cy)**2).ravel()
+    order = np.argsort(discsq, kind="stable")
+    discsq = discsq[order]
+    cumsum = np.concatenate(
+        [[0], np.cumsum(image[x0:x1, y0:y1].ravel()[order])])
+    # number of pixels within each circle
+    num = np.searchsorted(discsq, np.square(radii), side="left")
+    num = np.where(np.isnan(radii), 0, num)
+    return cumsum[num][()]
 
 
 def relative_dry_mass(qpi, radius, center, alpha=.18, rad_fact=1.2):
@@ -291,20 +1411,14 @@ def relative_dry_mass(qpi, radius, center, alpha=.18, rad_fact=1.2):
     -------
     dry_mass: float
         The relative dry mass of the object [g]
+
+    See Also
+    --------
+    dry_mass_sphere: relative and absolute dry mass for many values
+        of `alpha` and `rad_fact`
     """
-    image = qpi.pha
-    rincl = radius / qpi["pixel size"] * rad_fact
-    wavelength = qpi["wavelength"]
-    sx, sy = qpi.shape
-    x = np.arange(sx).reshape(-1, 1)
-    y = np.arange(sy).reshape(1, -1)
-    discsq = ((x - center[0])**2 + (y - center[1])**2)
-    area = discsq < rincl**2
-    phi_tot = np.sum(image[area])
-    # compute dry mass
-    pxarea = qpi["pixel size"]**2
-    # convert alpha mL/g to m³/g
-    fact = 1e-6
-    # [kg]
-    dm = wavelength / (2 * np.pi * alpha * fact) * phi_tot * pxarea
-    return dm
+    return dry_mass_sphere(qpi=qpi,
+                           radius=radius,
+                           center=center,
+                           alpha=alpha,
+                           rad_fact=rad_fact)[0]
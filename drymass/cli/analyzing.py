@@ -1,16 +1,23 @@
 import io
 from os import fspath
+import pathlib
+import traceback
 
 import matplotlib.image as mpimg
 import qpimage
 import tifffile
 
-from ..anasphere import analyze_sphere
+from ..anasphere import (FILE_SPHERE_FAILURES, analyze_sphere,
+                         load_sphere_params, simulate_sphere)
+from ..fitcache import FIT_CACHE_DIR, SphereFitCache
+from ..simlib import SphereSimLibrary
+from .. import util
 
 from . import config
 from . import dialog
 from .extracting import cli_extract_roi
 from . import plot
+from . import scheduler
 from .task_watcher import TaskWatcher
 
 
@@ -18,22 +25,45 @@ from .task_watcher import TaskWatcher
 FILE_SPHERE_ANALYSIS_IMAGE = "sphere_{}_{}_images.tif"
 
 
-def cli_analyze_sphere(path=None, ret_data=False, profile=None):
+def cli_analyze_sphere(path=None, ret_data=False, profile=None,
+                       ret_failed=False):
     """Perform sphere analysis"""
     description = "Determine integral refractive index, radius, and " \
                   + "related parameters by inferring spherical symmetry " \
                   + "for each phase object found."
-    path_in, path_out = dialog.main(path=path,
-                                    req_meta=["medium index",
-                                              "pixel size um",
-                                              "wavelength nm"],
-                                    description=description,
-                                    profile=profile)
+    path_in, path_out, jobs = dialog.main(
+        path=path,
+        req_meta=["medium index", "pixel size um", "wavelength nm"],
+        description=description,
+        profile=profile,
+        ret_jobs=True)
     if isinstance(path_in, list):
         # recursive analysis
-        for ii, pi in enumerate(path_in):
-            print("Analyzing dataset {}/{}.".format(ii+1, len(path_in)))
-            cli_analyze_sphere(path=pi)
+        failed_data = []
+        failed_rois = {}
+        for pi, future in scheduler.process_datasets(cli_analyze_sphere,
+                                                     path_in,
+                                                     jobs=jobs,
+                                                     ret_failed=True):
+            try:
+                failed = future.result()
+            except (Exception, SystemExit):
+                # (SystemExit, e.g. if no ROIs were found)
+                po = pi.with_name(pi.name + dialog.OUTPUT_SUFFIX)
+                if not config.ConfigFile(po)["sphere"]["isolate failures"]:
+                    raise
+                print(traceback.format_exc())
+                failed_data.append(pi)
+            else:
+                if failed:
+                    failed_rois[pi] = failed
+        if failed_data or failed_rois:
+            print("Failure summary:")
+            for pi in failed_data:
+                print(" - {}: analysis failed".format(pi))
+            for pi in failed_rois:
+                print(" - {}: {} ROI fit(s) failed".format(
+                    pi, len(failed_rois[pi])))
         # nothing else to do
         return
     cfg = config.ConfigFile(path_out)
@@ -60,58 +90,122 @@ def cli_analyze_sphere(path=None, ret_data=False, profile=None):
         "verbose": cfg["sphere"]["image verbosity"],
     }
 
+    # persistent sphere-fit cache
+    if cfg["sphere"]["fit cache size mb"] > 0:
+        if cfg["sphere"]["fit cache dir"] is None:
+            cache_dir = FIT_CACHE_DIR
+        else:
+            cache_dir = pathlib.Path(cfg["sphere"]["fit cache dir"])
+        fit_cache = SphereFitCache(
+            path=cache_dir.expanduser(),
+            max_size=cfg["sphere"]["fit cache size mb"] * 1024**2)
+    else:
+        fit_cache = None
+
+    # precomputed sphere simulations for initial guesses
+    if cfg["sphere"]["image sim library"]:
+        sim_library = SphereSimLibrary()
+    else:
+        sim_library = None
+
+    # cheap quality gate before fitting
+    quality_gate = {
+        "min_border_margin": cfg["sphere"]["quality min border margin px"],
+        "min_circularity": cfg["sphere"]["quality min circularity"],
+        "min_contrast": cfg["sphere"]["quality min contrast rad"],
+        "min_symmetry": cfg["sphere"]["quality min symmetry"],
+    }
+    quality_gate = {k: v for k, v in quality_gate.items() if v is not None}
+
+    # several methods/models may be analyzed in a single pass
+    methods = cfg["sphere"]["method"]
+    models = cfg["sphere"]["model"]
+    multi = isinstance(methods, list) or isinstance(models, list)
+
+    # HDF5 storage
+    h5_compression = util.get_h5_compression(
+        method=cfg["output"]["hdf5 compression"],
+        level=cfg["output"]["hdf5 compression level"],
+        shuffle=cfg["output"]["hdf5 shuffle"])
+
     with TaskWatcher("Performing sphere analysis... ") as tw:
-        h5sim, changed, reused = analyze_sphere(
+        h5sim, changed, reused, failed = analyze_sphere(
             h5roi=h5roi,
             dir_out=path_out,
             r0=cfg["specimen"]["size um"] / 2 * 1e-6,
-            method=cfg["sphere"]["method"],
-            model=cfg["sphere"]["model"],
+            method=methods,
+            model=models,
             alpha=cfg["sphere"]["refraction increment"],
             rad_fact=cfg["sphere"]["radial inclusion factor"],
             edgekw=edgekw,
             imagekw=imagekw,
+            fit_cache=fit_cache,
+            store_sim=cfg["output"]["sphere sim data"],
+            fit_timeout=cfg["sphere"]["fit timeout s"],
+            timeout_fallback=cfg["sphere"]["fit timeout fallback"],
+            coarse_levels=cfg["sphere"]["image coarse levels"],
+            sim_library=sim_library,
+            search_init=cfg["sphere"]["radius from search"],
+            quality_gate=quality_gate,
+            isolate_failures=cfg["sphere"]["isolate failures"],
+            phase_only=cfg["output"]["phase only"],
+            float32=cfg["output"]["single precision"],
+            h5_compression=h5_compression,
             ret_changed=True,
             ret_reused=True,
+            ret_failed=True,
             count=tw.count,
             max_count=tw.max_count,
         )
 
-    if reused:
-        print("Done (reused {} previous fits).".format(reused))
+    if not multi:
+        h5sim, changed, reused = [h5sim], [changed], [reused]
+        failed = [failed]
+    if not isinstance(methods, list):
+        methods = [methods] * len(h5sim)
+    if not isinstance(models, list):
+        models = [models] * len(h5sim)
+
+    if sum(reused):
+        print("Done (reused {} previous fits).".format(sum(reused)))
     else:
         print("Done.")
 
-    tifout = path_out / FILE_SPHERE_ANALYSIS_IMAGE.format(
-        cfg["sphere"]["method"],
-        cfg["sphere"]["model"]
-    )
-    if (changed and cfg["output"]["sphere images"]) or not tifout.exists():
-
-        with TaskWatcher("Plotting sphere images... ") as tw:
-            # plot h5series and rmgr with matplotlib
-            with qpimage.QPSeries(h5file=h5roi, h5mode="r") as qps_roi, \
-                    qpimage.QPSeries(h5file=h5sim, h5mode="r") as qps_sim, \
-                    tifffile.TiffWriter(fspath(tifout), imagej=True) as tf:
-                tw.max_count.value += len(qps_roi)
-                for qpi_real in qps_roi:
-                    qpi_sim = find_qpi_by_identifier(qps_sim,
-                                                     qpi_real["identifier"])
-                    if qpi_sim is not None:
-                        assert qpi_real["identifier"] in qpi_sim["identifier"]
-                        imio = io.BytesIO()
-                        plot.plot_qpi_sphere(qpi_real=qpi_real,
-                                             qpi_sim=qpi_sim,
-                                             path=imio,
-                                             simtype=cfg["sphere"]["model"])
-                        imio.seek(0)
-                        imdat = (mpimg.imread(imio) * 255).astype("uint8")
-                        tf.save(imdat, compress=9)
-                    tw.count.value += 1
-        print("Done")
-
-    if ret_data:
-        return h5sim
+    for ii in range(len(failed)):
+        if failed[ii]:
+            print("Fitting failed for {} ROI(s), see '{}'.".format(
+                len(failed[ii]),
+                path_out / FILE_SPHERE_FAILURES.format(methods[ii],
+                                                       models[ii])))
+
+    for ii in range(len(h5sim)):
+        tifout = path_out / FILE_SPHERE_ANALYSIS_IMAGE.format(methods[ii],
+                                                              models[ii])
+        if ((changed[ii] and cfg["output"]["sphere images"])
+                or not tifout.exists()):
+            with TaskWatcher("Plotting sphere images... ") as tw:
+                plot_sphere_images(h5roi=h5roi,
+                                   h5sim=h5sim[ii],
+                                   tifout=tifout,
+                                   model=models[ii],
+                                   count=tw.count,
+                                   max_count=tw.max_count)
+            print("Done")
+
+    # failed ROI identifiers of all analyses
+    failed = sorted(set(sum(failed, [])))
+    if ret_data and ret_failed:
+        if multi:
+            return h5sim, failed
+        else:
+            return h5sim[0], failed
+    elif ret_data:
+        if multi:
+            return h5sim
+        else:
+            return h5sim[0]
+    elif ret_failed:
+        return failed
 
 
 def find_qpi_by_identifier(qps, identifier):
@@ -138,3 +232,59 @@ def find_qpi_by_identifier(qps, identifier):
     else:
         qpi = None
     return qpi
+
+
+def plot_sphere_images(h5roi, h5sim, tifout, model, count=None,
+                       max_count=None):
+    """Render the sphere analysis images of all ROIs to a tif file
+
+    Parameters
+    ----------
+    h5roi: pathlib.Path
+        ROI data (see :func:`drymass.extractroi.extract_roi`)
+    h5sim: pathlib.Path
+        Sphere analysis data (see :func:`drymass.anasphere.analyze_sphere`)
+    tifout: pathlib.Path
+        Output tif file
+    model: str
+        Sphere model used in the analysis
+    count, max_count: multiprocessing.Value
+        Can be used to monitor the progress
+    """
+    # plot h5series and rmgr with matplotlib
+    with qpimage.QPSeries(h5file=h5roi, h5mode="r") as qps_roi, \
+            qpimage.QPSeries(h5file=h5sim, h5mode="r") as qps_sim, \
+            tifffile.TiffWriter(fspath(tifout), imagej=True) as tf:
+        if max_count is not None:
+            max_count.value += len(qps_roi)
+        if len(qps_sim):
+            sphere_params = None
+            sim_index = util.get_identifier_index(qps_sim)
+        else:
+            # only fit parameters stored; recompute simulations
+            sphere_params = load_sphere_params(qps_sim)
+        for qpi_real in qps_roi:
+            simident = "{}:{}".format(qpi_real["identifier"], model)
+            if sphere_params is None:
+                if simident in sim_index:
+                    qpi_sim = qps_sim[sim_index[simident]]
+                else:
+                    qpi_sim = None
+            else:
+                if simident in sphere_params:
+                    qpi_sim = simulate_sphere(sphere_params[simident])
+                    qpi_sim["identifier"] = simident
+                else:
+                    qpi_sim = None
+            if qpi_sim is not None:
+                assert qpi_real["identifier"] in qpi_sim["identifier"]
+                imio = io.BytesIO()
+                plot.plot_qpi_sphere(qpi_real=qpi_real,
+                                     qpi_sim=qpi_sim,
+                                     path=imio,
+                                     simtype=model)
+                imio.seek(0)
+                imdat = (mpimg.imread(imio) * 255).astype("uint8")
+                tf.save(imdat, compress=9)
+            if count is not None:
+                count.value += 1
@@ -1,4 +1,6 @@
+import copy
 import pathlib
+import time
 
 from . import definitions
 from . import parse_funcs
@@ -6,6 +8,13 @@ from .._version import version
 
 #: DryMass configuration file name
 FILE_CONFIG = "drymass.cfg"
+#: Time span [ns] within which a modification of a configuration file
+#: may go unnoticed by comparing modification times (coarse file
+#: system timestamps); cached files are compared by content instead.
+RACY_MTIME_NS = 2 * 10**9
+
+#: Validated content of configuration files (see :func:`ConfigFile._read`)
+_cache = {}
 
 
 class ConfigFile(object):
@@ -21,6 +30,18 @@ class ConfigFile(object):
         path: str
             path to the configuration file or a folder containing the
             configuration file :data:`FILE_CONFIG`.
+
+        Notes
+        -----
+        The validated content of the configuration file is cached in
+        memory (shared by all instances with the same path) and only
+        parsed again when the modification time, size, or inode of
+        the file change.
+
+        Use this class as a context manager to batch write operations:
+        Within the context, changes are kept in memory and written to
+        the configuration file only once when the context is exited
+        (changes are discarded if an exception occurs).
         """
         path = pathlib.Path(path).resolve()
         if path.is_dir():
@@ -28,6 +49,20 @@ class ConfigFile(object):
         if not path.exists():
             path.touch()
         self.path = path
+        #: pending configuration dictionary in batch mode
+        self._batch = None
+        self._batch_depth = 0
+
+    def __enter__(self):
+        self._batch_depth += 1
+        return self
+
+    def __exit__(self, type, value, tb):
+        self._batch_depth -= 1
+        if self._batch_depth == 0:
+            datadict, self._batch = self._batch, None
+            if datadict is not None and type is None:
+                self._write(datadict)
 
     def __getitem__(self, section):
         """Get a configuration section
@@ -146,10 +181,50 @@ class ConfigFile(object):
         human-readable. Normal users should not be able to use it,
         because the concept could be considered confusing.
         """
-        with self.path.open() as fd:
-            data = fd.readlines()
+        if self._batch is not None:
+            # pending changes in batch mode
+            return copy.deepcopy(self._batch)
+        # copy sections and lists (cached data must not be modified)
         outdict = {}
-        for line in data:
+        for sec, secd in self._read().items():
+            outdict[sec] = {key: copy.copy(val) for key, val in secd.items()}
+        if autocomplete:
+            # Insert default variables where missing
+            must_write = False
+            for sec in outdict:
+                for key in definitions.config[sec]:
+                    if key not in outdict[sec]:
+                        outdict[sec][key] = definitions.config[sec][key][0]
+                        must_write = True
+            if must_write:
+                # Update the configuration file
+                self._write(outdict)
+        return outdict
+
+    def _read(self):
+        """Return the validated content of the configuration file
+
+        The content is cached in :data:`_cache` and only parsed
+        again when the file has changed. Do not modify the returned
+        dictionary.
+        """
+        stat = self.path.stat()
+        signature = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        cached = _cache.get(self.path)
+        now = time.time_ns()
+        if cached is not None and cached[0] == signature:
+            if cached[2] - signature[0] > RACY_MTIME_NS:
+                return cached[3]
+            # The file was modified shortly before it was read. Later
+            # modifications might not change its modification time.
+            text = self.path.read_text()
+            if text == cached[1]:
+                _cache[self.path] = (signature, text, now, cached[3])
+                return cached[3]
+        else:
+            text = self.path.read_text()
+        outdict = {}
+        for line in text.split("\n"):
             line = line.strip()
             if (line.startswith("#") or
                     len(line) == 0):
@@ -165,17 +240,7 @@ class ConfigFile(object):
                 key, val = self._parse_compat(sec, key, val)
                 val = self._check_value(sec, key, val)
                 outdict[sec][key] = val
-        if autocomplete:
-            # Insert default variables where missing
-            must_write = False
-            for sec in outdict:
-                for key in definitions.config[sec]:
-                    if key not in outdict[sec]:
-                        outdict[sec][key] = definitions.config[sec][key][0]
-                        must_write = True
-            if must_write:
-                # Update the configuration file
-                self._write(outdict)
+        _cache[self.path] = (signature, text, now, outdict)
         return outdict
 
     def _write(self, datadict):
@@ -191,7 +256,13 @@ class ConfigFile(object):
         The configuration key values are converted to the correct
         dtype before writing using the definitions given in
         definitions.py.
+
+        In batch mode, `datadict` is only written when the context
+        is exited.
         """
+        if self._batch_depth:
+            self._batch = copy.deepcopy(datadict)
+            return
         keys = sorted(list(datadict.keys()))
         lines = ["# DryMass version {}".format(version),
                  "# Configuration file documented at: ",
@@ -207,8 +278,9 @@ class ConfigFile(object):
                 typefunc = definitions.config[kk][sk][1]
                 if value is not None:
                     value = typefunc(value)
-                    if typefunc in [parse_funcs.strlist,
-                                    parse_funcs.strlist_vsort]:
+                    if (typefunc in [parse_funcs.strlist,
+                                     parse_funcs.strlist_vsort]
+                            or isinstance(value, list)):
                         # cosmetics for e.g. '[roi]: ignore data'
                         value = ", ".join(value)
                 lines.append("{} = {}".format(sk, value))
@@ -216,6 +288,7 @@ class ConfigFile(object):
             lines[ii] += "\n"
         with self.path.open("w") as fd:
             fd.writelines(lines)
+        _cache.pop(self.path, None)
 
     def remove_section(self, section):
         """Remove a section from the configuration file"""
@@ -258,10 +331,11 @@ class ConfigFile(object):
         None-valued keys are ignored.
         """
         other_dict = other._parse(autocomplete=False)
-        for sec in other_dict:
-            for key in other_dict[sec]:
-                value = other_dict[sec][key]
-                if value is not None:
-                    self.set_value(section=sec,
-                                   key=key,
-                                   value=value)
+        with self:
+            for sec in other_dict:
+                for key in other_dict[sec]:
+                    value = other_dict[sec][key]
+                    if value is not None:
+                        self.set_value(section=sec,
+                                       key=key,
+                                       value=value)
@@ -1,9 +1,11 @@
 import pathlib
 
 from ..converter import convert
+from .. import util
 
 from . import config
 from . import dialog
+from . import scheduler
 from .task_watcher import TaskWatcher
 
 
@@ -12,16 +14,17 @@ def cli_convert(path=None, ret_data=False, profile=None):
     description = "Convert raw quantitative phase microscopy data to " \
                   + "the qpimage file format for further analysis in " \
                   + "DryMass."
-    path_in, path_out = dialog.main(path=path,
-                                    req_meta=["pixel size um",
-                                              "wavelength nm"],
-                                    description=description,
-                                    profile=profile)
+    path_in, path_out, jobs = dialog.main(
+        path=path,
+        req_meta=["pixel size um", "wavelength nm"],
+        description=description,
+        profile=profile,
+        ret_jobs=True)
     if isinstance(path_in, list):
         # recursive analysis
-        for ii, pi in enumerate(path_in):
-            print("Analyzing dataset {}/{}.".format(ii+1, len(path_in)))
-            cli_convert(path=pi)
+        for _, future in scheduler.process_datasets(cli_convert, path_in,
+                                                    jobs=jobs):
+            future.result()
         # nothing else to do
         return
     cfg = config.ConfigFile(path_out)
@@ -41,6 +44,13 @@ def cli_convert(path=None, ret_data=False, profile=None):
     bg_data_pha = parse_bg_value(cfg["bg"]["phase data"],
                                  reldir=path_in.parent)
 
+    # HDF5 storage
+    h5_compression = util.get_h5_compression(
+        method=cfg["output"]["hdf5 compression"],
+        level=cfg["output"]["hdf5 compression level"],
+        shuffle=cfg["output"]["hdf5 shuffle"])
+    chunk_px = cfg["output"]["hdf5 sensor chunk px"]
+
     with TaskWatcher("Converting input data... ") as tw:
         h5series, ds, changed = convert(
             path_in=path_in,
@@ -50,6 +60,9 @@ def cli_convert(path=None, ret_data=False, profile=None):
             bg_data_amp=bg_data_amp,
             bg_data_pha=bg_data_pha,
             write_tif=cfg["output"]["sensor tif data"],
+            phase_only=cfg["output"]["phase only"],
+            h5_chunks=(chunk_px, chunk_px) if chunk_px else None,
+            h5_compression=h5_compression,
             ret_dataset=True,
             ret_changed=True,
             count=tw.count,
@@ -1,5 +1,5 @@
 from .parse_funcs import fbool, float01, float_or_str, int_or_path, lcstr, \
-    floattuple_or_one, strlist_vsort, tupletupleint
+    lcstr_or_list, floattuple_or_one, strlist_vsort, tupletupleint
 
 config = {
     "bg": {
@@ -92,12 +92,51 @@ config = {
             (None, float, "Imaging wavelength [nm]"),
     },
     "output": {
+        "hdf5 compression":
+            ("gzip", lcstr, "Compression filter of HDF5 image data",
+             "Valid values are 'gzip' (small files, slow), 'lzf' (larger "
+             "files, fast), and 'off'. The settings in this section "
+             "only apply to newly written files."),
+        "hdf5 compression level":
+            (9, int, "Compression level (0-9) of the 'gzip' filter"),
+        "hdf5 sensor chunk px":
+            (128, int, "HDF5 chunk size of the sensor data [px]",
+             "Small chunks allow to read only the ROIs from the sensor "
+             "data; Set to 0 to store each sensor image in a single "
+             "chunk (efficient when entire images are read). The ROI "
+             "and sphere analysis data are always stored with one "
+             "chunk per ROI."),
+        "hdf5 shuffle":
+            (False, fbool, "Apply the HDF5 shuffle filter before "
+             "compression"),
+        "phase only":
+            (False, fbool, "Only store, correct, and export phase data",
+             "If set to `True`, the amplitude data are neither stored "
+             "in the sensor, ROI, and sphere analysis data, nor "
+             "background-corrected (the 'amplitude' keys in the "
+             "'bg' section are ignored), nor exported to tif files. "
+             "The amplitude is then one for all images. The sphere "
+             "analysis only uses the phase data."),
         "roi images":
             (True, fbool, "Rendered phase images with ROI location"),
         "sphere images":
             (True, fbool, "Phase/Intensity images for sphere analysis"),
         "sensor tif data":
             (True, fbool, "Phase/Amplitude sensor tif data"),
+        "single precision":
+            (False, fbool, "Single-precision (float32) processing",
+             "If set to `True`, the ROI search, the ROI background "
+             "correction, and the dry mass computation are performed "
+             "with float32 arrays, which halves their memory footprint. "
+             "The image data are always stored in single precision "
+             "and the sphere fits are always performed in double "
+             "precision."),
+        "sphere sim data":
+            (True, fbool, "Simulated phase/amplitude data of sphere analysis",
+             "If set to False, only the sphere fit parameters are stored "
+             "in 'sphere_*_data.h5'; the simulated phase and amplitude "
+             "data are recomputed from these parameters when needed "
+             "(e.g. for the sphere images)."),
     },
     "roi": {
         "dist border px":
@@ -110,6 +149,16 @@ config = {
              "must contain ROIs."),
         "exclude overlap px":
             (30.0, float, "Allowed distance between two objects [px]"),
+        "fft friendly size":
+            (False, fbool, "Pad/crop ROIs to FFT-friendly sizes",
+             "If set to `True`, square ROIs are centered at the objects "
+             "and their size (equivalent object diameter plus "
+             "'pad border px') is rounded up to the next size of a short "
+             "ladder (2^k or 3*2^k px, e.g. 96, 128, 192). ROIs that do "
+             "not fit into the image are cropped to a product of 2, 3, "
+             "and 5. Only a few distinct ROI sizes are used, which makes "
+             "the FFTs in the sphere analysis (e.g. of the Rytov models) "
+             "faster and their plans reusable across ROIs."),
         "force":
             (None, tupletupleint, "Force ROI coordinates (x1,x2,y1,y2) [px]"),
         "ignore data":
@@ -144,6 +193,37 @@ config = {
             (1.1, float, "Exterior edge point filtering radius"),
         "edge iter":
             (20, int, "Maximum number iterations for coarse edge detection"),
+        "fit cache dir":
+            (None, str, "Directory of the persistent sphere-fit cache",
+             "Sphere fits are stored in this directory, identified by "
+             "the ROI data and the fit parameters, and reused in "
+             "subsequent runs (also for other datasets). If `None`, "
+             "a directory in the user's cache directory is used "
+             "(see :const:`drymass.fitcache.FIT_CACHE_DIR`)."),
+        "fit cache size mb":
+            (0, float, "Maximum size of the sphere-fit cache [MB]",
+             "The least recently used fits are removed when the "
+             "cache exceeds this size. The cache is disabled if "
+             "set to 0 (default)."),
+        "fit timeout s":
+            (None, float, "Maximum time of a single sphere fit [s]",
+             "If set, the sphere fits are performed in a separate process "
+             "that is terminated when a fit takes longer (the number of "
+             "iterations of the image fit is limited by 'image iter'). "
+             "Timed-out ROIs are handled according to "
+             "'fit timeout fallback' and fitted again in the next run."),
+        "fit timeout fallback":
+            ("edge", lcstr, "Fallback for timed-out sphere fits",
+             "Valid values are 'edge' (use the edge-detection approach "
+             "with the projection model) or 'skip' (record "
+             "'skipped-timeout' in the statistics)."),
+        "image coarse levels":
+            (0, int, "Number of coarse-to-fine levels for image fitting",
+             "If set to a value larger than zero, the image fit is "
+             "first performed on 2^N-, ..., 4-, and 2-fold binned "
+             "ROIs, each level starting from the result of the previous "
+             "one, before it is refined at full resolution with the "
+             "stopping criteria defined below."),
         "image fit range position":  # crel
             (0.05, float, "Fit interpolation range for radius"),
         "image fit range radius":  # rrel
@@ -154,6 +234,17 @@ config = {
             (True, fbool, "Fix the simulation background phase to zero"),
         "image iter":  # max_iter
             (100, int, "Maximum number of iterations for image fitting"),
+        "image sim library":
+            (False, fbool, "Initial guess from a sphere simulation library",
+             "If set to `True`, the initial refractive index and radius "
+             "of the image fit are obtained by comparing the radial phase "
+             "profile of each ROI to a library of precomputed simulations "
+             "instead of by edge detection (ROIs that do not match the "
+             "library, e.g. objects with negative contrast, are "
+             "initialized by edge detection). The library is computed once "
+             "for each combination of model, wavelength, pixel size, "
+             "medium index, and specimen size and stored in the user's "
+             "cache directory (see :const:`drymass.simlib.SIM_LIB_DIR`)."),
         "image stop delta position":  # stop_dc
             (1, float, "Stopping criterion for position"),
         "image stop delta radius":  # stop_dr
@@ -162,17 +253,56 @@ config = {
             (0.0005, float, "Stopping criterion for refractive index"),
         "image verbosity":  # verbose
             (0, int, "Verbosity level of image fitting algorithm"),
+        "isolate failures":
+            (False, fbool, "Continue with the next ROI if a fit fails",
+             "If set to `True`, errors raised while fitting an ROI do not "
+             "abort the analysis. Failed ROIs are recorded with the status "
+             "'failed-<error>' in the statistics, their tracebacks are "
+             "written to 'sphere_<method>_<model>_failures.txt', and they "
+             "are fitted again in the next run. In recursive mode, the "
+             "analysis also continues with the next dataset if a dataset "
+             "fails."),
         "method":
-            ("image", lcstr, "Method for determining sphere parameters",
+            ("image", lcstr_or_list, "Method for determining sphere "
+             "parameters",
              "Valid values are 'edge' (edge-detection approach) or "
-             "'image' (2D phase image fitting)."),
+             "'image' (2D phase image fitting). Several analyses are "
+             "performed in a single pass if a comma-separated list "
+             "is given (paired with the list in 'model'), e.g. "
+             "'method = edge, image, image' and "
+             "'model = projection, projection, rytov'. Cheap models "
+             "are then used as initial guesses for expensive models."),
         "model":
-            ("rytov-sc", lcstr, "Physical sphere model",
+            ("rytov-sc", lcstr_or_list, "Physical sphere model",
              "Valid values are defined in "
              ":data:`qpsphere.models.available`. If `method=edge`, then "
              "`model` must be set to `projection`. If `method=image`, "
              "setting `model` to `rytov-sc` has the best trade-off between "
              "accuracy and speed."),
+        "quality min border margin px":
+            (None, float, "Minimum distance of objects to the ROI border "
+             "[px]",
+             "Objects that are closer to (or clipped by, if set to 0) the "
+             "ROI border are rejected before fitting. This and the "
+             "other 'quality' keys define a cheap quality gate (see "
+             ":func:`drymass.quality.compute_roi_quality`). Rejected "
+             "ROIs are not fitted; their status in the statistics "
+             "output reads 'rejected-' followed by the names of the "
+             "failed metrics joined by '+' (e.g. "
+             "'rejected-contrast+symmetry'). Set to `None` to disable "
+             "a check."),
+        "quality min circularity":
+            (None, float01, "Minimum circularity of the detected edge"),
+        "quality min contrast rad":
+            (None, float, "Minimum phase contrast of the object [rad]"),
+        "quality min symmetry":
+            (None, float01, "Minimum radial symmetry of the phase"),
+        "radius from search":
+            (False, fbool, "Initial radius and center from the ROI search",
+             "If set to `True`, the equivalent diameter and the centroid "
+             "of each object found in the ROI search are used as the "
+             "initial radius and center of its sphere fit instead of "
+             "the specimen size and the ROI center."),
         "refraction increment":
             (0.18, float, "Refraction increment [mL/g]"),
         "radial inclusion factor":
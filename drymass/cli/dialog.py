@@ -1,10 +1,15 @@
 import argparse
+import concurrent.futures
 import functools
+import hashlib
+import json
+import os
 import pathlib
 
 import qpformat
 
 from .._version import version
+from ..converter import CACHE_DIR
 
 from . import definitions
 from . import config
@@ -12,6 +17,12 @@ from .profile import get_profile_path
 
 #: DryMass analysis output suffix (appended to data path)
 OUTPUT_SUFFIX = "_dm"
+#: Directory of the dataset indices of recursive searches
+SCAN_INDEX_DIR = CACHE_DIR / "scan_index"
+#: Number of threads used for probing files in a recursive search
+PROBE_THREADS = 8
+#: Magic bytes of file formats that may contain series data (HDF5, zip)
+SERIES_MAGIC = [b"\x89HDF\r\n\x1a\n", b"PK\x03\x04"]
 
 META_MAPPER = {"medium index": ("medium index", 1),
                "pixel size um": ("pixel size", 1e6),
@@ -41,7 +52,7 @@ def input_setting(path, section, key, value=None):
 
 
 def main(path=None, req_meta=None, description="DryMass analysis.",
-         profile=None, recursive=False):
+         profile=None, recursive=False, jobs=1, ret_jobs=False):
     """Main user dialog with optional "meta" kwargs required
 
     Parameters
@@ -65,6 +76,12 @@ def main(path=None, req_meta=None, description="DryMass analysis.",
         Perform recursive search in `path`. If `path` is None, then
         `recursive` must be False. Instead, the `recursive` argument
         should be set via the command line.
+    jobs: int
+        Number of datasets processed in parallel in a recursive
+        analysis (see :func:`drymass.cli.scheduler.process_datasets`);
+        If `path` is None, `jobs` is set via the command line.
+    ret_jobs: bool
+        Return `jobs`
 
     Returns
     -------
@@ -75,6 +92,9 @@ def main(path=None, req_meta=None, description="DryMass analysis.",
     path_out: pathlib.Path or None
         The output path, i.e. the path with `_dm` appended. If a
         recursive search is performed, `path_out` is set to None.
+    jobs: int
+        Number of datasets processed in parallel (only returned if
+        `ret_jobs` is True)
     """
     # get directories
     if req_meta is None:
@@ -83,7 +103,7 @@ def main(path=None, req_meta=None, description="DryMass analysis.",
         if recursive:
             msg = "'recursive' must not be set when 'path' is 'None'!"
             raise ValueError(msg)
-        path_in, profile, recursive = parse(description)
+        path_in, profile, recursive, jobs = parse(description)
     else:
         path_in = pathlib.Path(path).resolve()
     if recursive:
@@ -141,7 +161,10 @@ def main(path=None, req_meta=None, description="DryMass analysis.",
                               section="meta",
                               key=mm,
                               value=value)
-    return path_in, path_out
+    if ret_jobs:
+        return path_in, path_out, jobs
+    else:
+        return path_in, path_out
 
 
 @functools.lru_cache(maxsize=32)  # cached to avoid multiple prints
@@ -163,6 +186,11 @@ def parse(description="DryMass analysis."):
                              + "and run DryMass separately for each folder.",
                         default=False,
                         action='store_true')
+    parser.add_argument("-j", "--jobs",
+                        help="Number of datasets processed in parallel "
+                             + "in recursive mode (0 uses all CPUs).",
+                        default=1,
+                        type=int)
     args = parser.parse_args()
     # Workaround: We use nargs='+' and join the input to support white
     # spaces in path names.
@@ -172,53 +200,179 @@ def parse(description="DryMass analysis."):
         msg = "Given path must be directory in recursive mode; " \
               + "got '{}'!".format(path_in)
         raise ValueError(msg)
-    return path_in, args.profile, args.recursive
+    return path_in, args.profile, args.recursive, args.jobs
+
+
+def recursive_search(path, threads=PROBE_THREADS, use_index=True):
+    """Perform recursive search for supported measurements
 
+    Parameters
+    ----------
+    path: str or pathlib.Path
+        Directory to search (or a measurement file)
+    threads: int
+        Number of threads used for probing the file formats
+        (the probes mostly wait for file system access)
+    use_index: bool
+        Whether to use the scan index in :data:`SCAN_INDEX_DIR`;
+        Only files and folders that changed since the last search
+        of `path` are probed (see :func:`_scan_candidates`).
 
-def recursive_search(path):
-    """Perform recursive search for supported measurements"""
+    Returns
+    -------
+    paths_datasets: list of pathlib.Path
+        Sorted list of series files and series folders
+
+    Notes
+    -----
+    Directories whose names end with :data:`OUTPUT_SUFFIX` (DryMass
+    results) are not searched. Only files starting with one of the
+    :data:`SERIES_MAGIC` bytes are probed with :func:`qpformat.load_data`
+    and only folders with at least two files are probed with the
+    "SeriesFolder" format.
+    """
     path = pathlib.Path(path).resolve()
-    paths_datasets = []
-    # Get all candidates
-    paths_with_dm = sorted(list(path.rglob("*")) + [path])
-    # Exclude all files/directories that are in a results directory
-    cands_noresults = []
-    for c1 in paths_with_dm:
-        tocheck = list(c1.parents)
-        if c1.is_dir():
-            tocheck.append(c1)
-        for pp in tocheck:
-            if pp.name and pp.name.endswith("_dm"):
-                break
+    # Exclude everything that is in a results directory
+    for pp in [path] + list(path.parents):
+        if pp.name.endswith(OUTPUT_SUFFIX):
+            return []
+    files, folders = _scan_candidates(path)
+    path_index = SCAN_INDEX_DIR / "{}.json".format(
+        hashlib.sha256(str(path).encode("utf-8")).hexdigest())
+    index = {}
+    if use_index:
+        try:
+            index = json.loads(path_index.read_text())
+        except (FileNotFoundError, OSError, ValueError):
+            pass
+    new_index = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as ex:
+        # Try to open all series files with qpformat
+        is_series = _probe_candidates(files, _probe_file, index, new_index,
+                                      ex)
+        # The same thing that applies to SeriesFolder also applies to
+        # SeriesData in general (folders with series files are ignored).
+        # Note that we completely ignore all SingleData file formats here.
+        ignore_folders = {os.path.dirname(pf) for pf in is_series}
+        folders = {pd: folders[pd] for pd in folders
+                   if pd not in ignore_folders}
+        # Determine all directory-based measurements (SeriesFolder format)
+        is_series += _probe_candidates(folders, _probe_folder, index,
+                                       new_index, ex)
+    if use_index:
+        # write to a temporary file first (atomic for parallel runs)
+        path_index.parent.mkdir(parents=True, exist_ok=True)
+        path_temp = path_index.with_name("{}_{}.tmp".format(
+            path_index.name, os.getpid()))
+        path_temp.write_text(json.dumps(new_index))
+        path_temp.replace(path_index)
+    return sorted(pathlib.Path(pp) for pp in is_series)
+
+
+def _probe_candidates(candidates, probe_func, index, new_index, executor):
+    """Probe candidates that are not up-to-date in the scan index
+
+    Parameters
+    ----------
+    candidates: dict
+        Paths (str) and their signatures (see :func:`_scan_candidates`)
+    probe_func: callable
+        Function that returns whether a path is a series dataset
+    index: dict
+        Scan index of the previous search; The values are lists
+        of the signature and the probing result.
+    new_index: dict
+        Scan index of the current search (updated in-place)
+    executor: concurrent.futures.Executor
+        Executor used for probing
+
+    Returns
+    -------
+    is_series: list of str
+        Candidates that are series datasets
+    """
+    results = {}
+    to_probe = []
+    for pp in candidates:
+        entry = index.get(pp)
+        if entry is not None and entry[:-1] == candidates[pp]:
+            results[pp] = entry[-1]
         else:
-            cands_noresults.append(c1)
-    # Try to open all series files with qpformat
-    ignore_folders = []
-    for c2 in cands_noresults:
-        if c2.is_file():
-            try:
-                ds = qpformat.load_data(path=c2)
-            except qpformat.file_formats.UnknownFileFormatError:
-                pass
-            else:
-                if ds.is_series:
-                    # The same thing that applies to SeriesFolder also
-                    # applies to SeriesData in general.
-                    paths_datasets.append(c2)
-                    # Note that we completely ignore all SingleData
-                    # file formats here.
-                    ignore_folders.append(c2.parent)
-    # Determine all directory-based measurements (SeriesFolder format)
-    for c2 in cands_noresults:
-        if c2.is_dir() and c2 not in ignore_folders:
+            to_probe.append(pp)
+    for pp, res in zip(to_probe, executor.map(probe_func, to_probe)):
+        results[pp] = res
+    for pp in candidates:
+        new_index[pp] = candidates[pp] + [results[pp]]
+    return [pp for pp in candidates if results[pp]]
+
+
+def _probe_file(path):
+    """Return whether `path` is a file with series data"""
+    with open(path, "rb") as fd:
+        head = fd.read(max(len(mb) for mb in SERIES_MAGIC))
+    if not head.startswith(tuple(SERIES_MAGIC)):
+        return False
+    try:
+        ds = qpformat.load_data(path=path)
+    except qpformat.file_formats.UnknownFileFormatError:
+        return False
+    return ds.is_series
+
+
+def _probe_folder(path):
+    """Return whether `path` is a folder with series data"""
+    try:
+        ds = qpformat.load_data(path=path, fmt="SeriesFolder")
+    except (NotImplementedError, qpformat.BadFileFormatError):
+        return False
+    return len(ds) > 1
+
+
+def _scan_candidates(path):
+    """Collect files and folders that may contain series data
+
+    Directories whose names end with :data:`OUTPUT_SUFFIX` are
+    pruned during the walk.
+
+    Parameters
+    ----------
+    path: pathlib.Path
+        Directory to search (or a single file)
+
+    Returns
+    -------
+    files: dict
+        File paths (str) and their signatures (modification time
+        [ns], size [B])
+    folders: dict
+        Paths (str) of folders that contain at least two files and
+        their signatures (modification time of the folder [ns],
+        number of files, total size [B], latest modification time
+        of the files [ns])
+    """
+    files = {}
+    folders = {}
+    if path.is_file():
+        stat = path.stat()
+        files[str(path)] = [stat.st_mtime_ns, stat.st_size]
+    for root, dirs, names in os.walk(str(path)):
+        dirs[:] = [dd for dd in dirs if not dd.endswith(OUTPUT_SUFFIX)]
+        stats = []
+        for name in names:
+            pf = os.path.join(root, name)
             try:
-                ds = qpformat.load_data(path=c2, fmt="SeriesFolder")
-            except (NotImplementedError, qpformat.BadFileFormatError):
-                pass
-            else:
-                if len(ds) > 1:
-                    paths_datasets.append(c2)
-    return sorted(paths_datasets)
+                stat = os.stat(pf)
+            except OSError:
+                # e.g. broken symlink
+                continue
+            files[pf] = [stat.st_mtime_ns, stat.st_size]
+            stats.append(stat)
+        if len(stats) > 1:
+            folders[root] = [os.stat(root).st_mtime_ns,
+                             len(stats),
+                             sum(st.st_size for st in stats),
+                             max(st.st_mtime_ns for st in stats)]
+    return files, folders
 
 
 def transfer_meta_data(path_in, path_out):
@@ -226,7 +380,9 @@ def transfer_meta_data(path_in, path_out):
     ds = qpformat.load_data(path=path_in)
     cfg = config.ConfigFile(path_out)
     sec = cfg["meta"]
-    for key in sorted(META_MAPPER):
-        dskey, mult = META_MAPPER[key]
-        if (key not in sec or sec[key] is None) and dskey in ds.meta_data:
-            cfg.set_value("meta", key, ds.meta_data[dskey] * mult)
+    with cfg:
+        for key in sorted(META_MAPPER):
+            dskey, mult = META_MAPPER[key]
+            if ((key not in sec or sec[key] is None)
+                    and dskey in ds.meta_data):
+                cfg.set_value("meta", key, ds.meta_data[dskey] * mult)
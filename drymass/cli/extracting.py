@@ -7,11 +7,13 @@ import qpimage
 import tifffile
 
 from ..extractroi import extract_roi
+from .. import util
 
 from . import config
 from .converting import cli_convert
 from . import dialog
 from . import plot
+from . import scheduler
 from .task_watcher import TaskWatcher
 
 
@@ -23,14 +25,16 @@ def cli_extract_roi(path=None, ret_data=False, profile=None):
     """Extract regions of interest"""
     description = "Extract reqions of interest in quantitative phase" \
                   + "microscopy data for further analysis in DryMass."
-    path_in, path_out = dialog.main(path=path,
-                                    description=description,
-                                    profile=profile)
+    path_in, path_out, jobs = dialog.main(
+        path=path,
+        description=description,
+        profile=profile,
+        ret_jobs=True)
     if isinstance(path_in, list):
         # recursive analysis
-        for ii, pi in enumerate(path_in):
-            print("Analyzing dataset {}/{}.".format(ii+1, len(path_in)))
-            cli_extract_roi(path=pi)
+        for _, future in scheduler.process_datasets(cli_extract_roi, path_in,
+                                                    jobs=jobs):
+            future.result()
         # nothing else to do
         return
     # cli_convert will ask for the required meta data
@@ -68,6 +72,12 @@ def cli_extract_roi(path=None, ret_data=False, profile=None):
         bg_pha_kw = None
         edge_kw = {}
 
+    # HDF5 storage
+    h5_compression = util.get_h5_compression(
+        method=cfg["output"]["hdf5 compression"],
+        level=cfg["output"]["hdf5 compression level"],
+        shuffle=cfg["output"]["hdf5 shuffle"])
+
     with TaskWatcher("Extracting ROIs... ") as tw:
         h5roi, rmgr, changed = extract_roi(
             h5series=h5series,
@@ -79,6 +89,10 @@ def cli_extract_roi(path=None, ret_data=False, profile=None):
             pad_border=cfg["roi"]["pad border px"],
             exclude_overlap=cfg["roi"]["exclude overlap px"],
             threshold=cfg["roi"]["threshold"],
+            fft_friendly=cfg["roi"]["fft friendly size"],
+            phase_only=cfg["output"]["phase only"],
+            float32=cfg["output"]["single precision"],
+            h5_compression=h5_compression,
             ignore_data=cfg["roi"]["ignore data"],
             force_roi=cfg["roi"]["force"],
             bg_amp_kw=bg_amp_kw,
@@ -102,6 +102,18 @@ def lcstr(astr):
     return astr.lower()
 
 
+def lcstr_or_list(astr):
+    """Lower-case string or list of lower-case strings (comma-separated)"""
+    if isinstance(astr, str):
+        for s in "()[]'"+'"':
+            astr = astr.replace(s, "")
+        astr = astr.split(",")
+    alist = [a.strip().lower() for a in astr if a.strip()]
+    if len(alist) == 1:
+        alist = alist[0]
+    return alist
+
+
 def strlist(alist):
     """List of strings, comma- or space-separated"""
     if isinstance(alist, str):
@@ -0,0 +1,127 @@
+import concurrent.futures
+import contextlib
+import io
+import os
+import pathlib
+import traceback
+
+from ..fitworker import RemoteTraceback
+
+
+def dataset_size(path):
+    """Return the size of a dataset file or folder [B]
+
+    For folders (SeriesFolder format), the sizes of the files in
+    the folder (not in its subfolders) are summed up.
+    """
+    path = pathlib.Path(path)
+    if path.is_dir():
+        return sum(pp.stat().st_size for pp in path.iterdir()
+                   if pp.is_file())
+    else:
+        return path.stat().st_size
+
+
+def process_datasets(func, paths, jobs=1, **kwargs):
+    """Process datasets of a recursive analysis
+
+    Parameters
+    ----------
+    func: callable
+        Function that processes a single dataset, called with
+        `path=path` and `kwargs` (e.g.
+        :func:`drymass.cli.cli_convert`)
+    paths: list of pathlib.Path
+        Measurement paths of the datasets
+    jobs: int
+        Number of worker processes; If set to 1, the datasets are
+        processed in the current process in the given order. If
+        set to 0, the number of CPUs is used.
+    kwargs: dict
+        Additional keyword arguments to `func`
+
+    Yields
+    ------
+    path: pathlib.Path
+        Measurement path of the processed dataset
+    future: concurrent.futures.Future
+        Completed future holding the return value of `func` or the
+        exception raised by `func`
+
+    Notes
+    -----
+    With worker processes, the largest datasets are processed
+    first (load balancing) and the datasets are yielded in the
+    order in which they are completed. The console output of each
+    dataset is collected in the worker and printed by the current
+    process once the dataset is completed, followed by the overall
+    progress. User input is not possible in the worker processes;
+    All required metadata must be in the configuration files
+    (see :func:`drymass.cli.dialog.main`).
+    """
+    if jobs == 0:
+        jobs = os.cpu_count()
+    if jobs == 1:
+        for ii, pi in enumerate(paths):
+            print("Analyzing dataset {}/{}.".format(ii+1, len(paths)))
+            future = concurrent.futures.Future()
+            try:
+                future.set_result(func(path=pi, **kwargs))
+            except (Exception, SystemExit) as exc:
+                future.set_exception(exc)
+            yield pi, future
+        return
+    sizes = {pi: dataset_size(pi) for pi in paths}
+    size_total = sum(sizes.values())
+    size_done = 0
+    print("Analyzing {} datasets with {} worker processes.".format(
+        len(paths), jobs))
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+    try:
+        futures = {}
+        for pi in sorted(paths, key=lambda x: sizes[x], reverse=True):
+            fut = executor.submit(_run_dataset, func, pi, kwargs)
+            futures[fut] = pi
+        for ii, fut in enumerate(concurrent.futures.as_completed(futures)):
+            pi = futures[fut]
+            result, tb, output = fut.result()
+            print(output, end="")
+            size_done += sizes[pi]
+            print("Completed dataset {}/{} ({:.1f}% of data): {}".format(
+                ii+1, len(paths), size_done / max(size_total, 1) * 100, pi))
+            future = concurrent.futures.Future()
+            if tb is None:
+                future.set_result(result)
+            else:
+                # (the traceback is lost when pickling the exception)
+                result.__cause__ = RemoteTraceback(tb)
+                future.set_exception(result)
+            yield pi, future
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _run_dataset(func, path, kwargs):
+    """Process a dataset in a worker and capture the console output
+
+    Returns
+    -------
+    result: object or BaseException
+        Return value of `func` or the exception raised
+    tb: str or None
+        Formatted traceback if an exception was raised
+    output: str
+        Console output; Progress lines (carriage returns) are
+        reduced to their final state.
+    """
+    out = io.StringIO()
+    tb = None
+    with contextlib.redirect_stdout(out):
+        try:
+            result = func(path=path, **kwargs)
+        except (Exception, SystemExit) as exc:
+            result = exc
+            tb = traceback.format_exc()
+    output = "\n".join(line.split("\r")[-1]
+                       for line in out.getvalue().split("\n"))
+    return result, tb, output
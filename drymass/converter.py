@@ -16,6 +16,10 @@ from . import util
 FILE_SENSOR_DATA_H5 = "sensor_data.h5"
 #: Output phase/amplitude TIFF sensor data
 FILE_SENSOR_DATA_TIF = "sensor_data.tif"
+#: HDF5 chunk shape of the sensor data (allows reading ROIs only)
+H5_SENSOR_CHUNKS = (128, 128)
+#: HDF5 attribute of phase-only sensor data (see :func:`convert`)
+H5_ATTR_PHASE_ONLY = "drymass phase only"
 
 CACHE_DIR = pathlib.Path(appdirs.user_cache_dir(appname="drymass"))
 CACHE_DIR.mkdir(parents=True, exist_ok=True)
@@ -28,7 +32,9 @@ if PYFFTW_WIDOM_PATH.exists():
 
 def convert(path_in, dir_out, meta_data=None, holo_kw=None, qpretrieve_kw=None,
             bg_data_amp=None, bg_data_pha=None, write_tif=False,
-            ret_dataset=False, ret_changed=False, count=None, max_count=None):
+            phase_only=False, h5_chunks=H5_SENSOR_CHUNKS,
+            h5_compression=None, ret_dataset=False, ret_changed=False,
+            count=None, max_count=None):
     """Convert experimental data to `qpimage.QPSeries` on disk
 
     Parameters
@@ -61,6 +67,17 @@ def convert(path_in, dir_out, meta_data=None, holo_kw=None, qpretrieve_kw=None,
         Export tif images for use with Fiji/ImageJ (tif images
         are only created if they don't already exist or if the
         analysis changed)
+    phase_only: bool
+        Only store (and export) the phase data; The amplitude is
+        one for all images and `bg_data_amp` is ignored.
+    h5_chunks: tuple of int or None
+        HDF5 chunk shape of the sensor data; The default allows
+        to read ROIs efficiently, set to `None` to store each image
+        in one chunk (efficient when reading entire images).
+    h5_compression: dict or None
+        HDF5 compression of the sensor data (see
+        :func:`drymass.util.get_h5_compression`); defaults to
+        :const:`drymass.util.H5_COMPRESSION`
     ret_dataset: bool
         Return the qpformat dataset
     ret_changed: bool
@@ -82,7 +99,10 @@ def convert(path_in, dir_out, meta_data=None, holo_kw=None, qpretrieve_kw=None,
                             holo_kw=holo_kw,
                             qpretrieve_kw=qpretrieve_kw)
 
-    if not (bg_data_amp is None and bg_data_pha is None):
+    if phase_only:
+        bg_data_amp = None
+    bg_shared = not (bg_data_amp is None and bg_data_pha is None)
+    if bg_shared:
         # Only set background of data set if there is
         # a background defined.
         bgamp = get_background(bg_data=bg_data_amp,
@@ -98,7 +118,9 @@ def convert(path_in, dir_out, meta_data=None, holo_kw=None, qpretrieve_kw=None,
     if util.is_series_file(h5out):
         with qpimage.QPSeries(h5file=h5out, h5mode="r") as qpsr:
             if (ds.identifier == qpsr.identifier and
-                    len(ds) == len(qpsr)):
+                    len(ds) == len(qpsr) and
+                    phase_only == qpsr.h5.attrs.get(H5_ATTR_PHASE_ONLY,
+                                                    False)):
                 # file has same identifier and same number of QPSeries
                 create = False
             else:
@@ -114,7 +136,9 @@ def convert(path_in, dir_out, meta_data=None, holo_kw=None, qpretrieve_kw=None,
 
     if create:
         # Write h5 data
-        ds.saveh5(h5out, count=count)
+        write_sensor_data(ds, h5out=h5out, bg_shared=bg_shared,
+                          chunks=h5_chunks, phase_only=phase_only,
+                          compression=h5_compression, count=count)
     else:
         if count is not None:
             with count.get_lock():
@@ -122,7 +146,7 @@ def convert(path_in, dir_out, meta_data=None, holo_kw=None, qpretrieve_kw=None,
 
     if write_tif and (create or not imout.exists()):
         # Also write tif data
-        h5series2tif(h5in=h5out, tifout=imout)
+        h5series2tif(h5in=h5out, tifout=imout, phase_only=phase_only)
     if count is not None:
         with count.get_lock():
             count.value += tif_count
@@ -197,17 +221,69 @@ def get_background(bg_data, dataset, which="phase"):
     return bg
 
 
-def h5series2tif(h5in, tifout):
-    """Convert a qpimage.QPSeries file to a phase/amplitude TIFF file"""
+def write_sensor_data(ds, h5out, bg_shared=False, chunks=H5_SENSOR_CHUNKS,
+                      phase_only=False, compression=None, count=None):
+    """Write a qpformat dataset as a `qpimage.QPSeries` file
+
+    This is equivalent to :func:`qpformat.file_formats.SeriesData.saveh5`,
+    except that the image data are stored with the HDF5 chunk shape
+    `chunks`, which allows to read ROIs without loading (and
+    decompressing) the entire sensor image.
+
+    Parameters
+    ----------
+    ds: qpformat.file_formats.SeriesData
+        The dataset
+    h5out: pathlib.Path
+        Output path
+    bg_shared: bool
+        Whether the background data of `ds` are the same for all
+        images (then they are only stored once and hard-linked)
+    chunks: tuple of int or None
+        HDF5 chunk shape; If `None`, the image shape is used.
+    phase_only: bool
+        Do not store the amplitude data
+        (see :func:`drymass.util.write_amplitude_placeholder`);
+        The HDF5 attribute :data:`H5_ATTR_PHASE_ONLY` is set.
+    compression: dict or None
+        HDF5 compression (see :func:`drymass.util.write_image_dataset`)
+    count: multiprocessing.Value
+        Incremented for every image written
+    """
+    with qpimage.QPSeries(h5file=h5out, h5mode="w",
+                          identifier=ds.identifier) as qps:
+        if phase_only:
+            qps.h5.attrs[H5_ATTR_PHASE_ONLY] = True
+        for ii in range(len(ds)):
+            if bg_shared and ii:
+                qpi = ds.get_qpimage_raw(ii)
+                bg_from_idx = 0
+            else:
+                qpi = ds.get_qpimage(ii)
+                bg_from_idx = None
+            util.add_qpimage(qps, qpi=qpi, index=ii, chunks=chunks,
+                             bg_from_idx=bg_from_idx, phase_only=phase_only,
+                             compression=compression)
+            if count is not None:
+                with count.get_lock():
+                    count.value += 1
+
+
+def h5series2tif(h5in, tifout, phase_only=False):
+    """Convert a qpimage.QPSeries file to a phase/amplitude TIFF file
+
+    If `phase_only` is set, only the phase is exported.
+    """
     with qpimage.QPSeries(h5file=h5in, h5mode="r") as qps, \
             tifffile.TiffWriter(fspath(tifout), imagej=True) as tf:
         for ii in range(len(qps)):
             qpi = qps[ii]
             res = 1 / qpi["pixel size"] * 1e-6  # use µm
             dshape = (1, qpi.shape[0], qpi.shape[1])
-            dataa = np.array(qpi.amp, dtype=np.float32).reshape(*dshape)
-            datap = np.array(qpi.pha, dtype=np.float32).reshape(*dshape)
-            data = np.vstack((datap, dataa))
+            data = np.array(qpi.pha, dtype=np.float32).reshape(*dshape)
+            if not phase_only:
+                dataa = np.array(qpi.amp, dtype=np.float32).reshape(*dshape)
+                data = np.vstack((data, dataa))
             tf.save(data=data,
                     resolution=(res, res, None),
                     compress=0,
@@ -23,52 +23,152 @@ FILE_ROI_DATA_H5 = "roi_data.h5"
 FILE_ROI_DATA_TIF = "roi_data.tif"
 #: Output slice locations
 FILE_SLICES = "roi_slices.txt"
+#: HDF5 group in `FILE_ROI_DATA_H5` holding supplementary ROI data
+H5_ROI_META = "roi_meta"
+#: Number of sensor images whose ROIs are background-corrected at once
+EXTRACT_BLOCK_SIZE = 64
 
 
-def _bg_correct(qpi, which_data, bg_kw={}, bg_mask_thresh=None,
-                bg_mask_sphere_kw={}):
-    if bg_kw:
-        if isinstance(bg_mask_thresh, str) or bg_mask_thresh is not None:
-            if which_data == "phase":
-                image = qpi.pha
-            else:
-                image = qpi.amp
-            mask1 = thr.image2mask(image,
-                                   value_or_method=bg_mask_thresh,
-                                   invert=True)
-        else:
-            mask1 = None
-        if bg_mask_sphere_kw["radial_clearance"] is not None:  # sphere mask
-            mask2 = qpsphere.cnvnc.bg_phase_mask_for_qpi(
-                qpi=qpi,
-                r0=bg_mask_sphere_kw["r0"],
-                method="edge",
-                model="projection",
-                edgekw=bg_mask_sphere_kw["edgekw"],
-                imagekw={},
-                radial_clearance=bg_mask_sphere_kw["radial_clearance"])
-        else:
-            mask2 = None
-        # combine masks
-        if mask1 is None and mask2 is None:
-            mask = None
-        elif mask1 is None:
-            mask = mask2
-        elif mask2 is None:
-            mask = mask1
+def _bg_correct(qpis, which_data, bg_kw={}, bg_mask_thresh=None,
+                bg_mask_sphere_kw={}, edge_fits=None, float32=False):
+    """Perform background correction of several ROIs
+
+    The background of ROIs with equal shape and border size is
+    computed in one go (see :func:`_bg_fit`). The results are
+    stored in the ROI data exactly like
+    :func:`qpimage.QPImage.compute_bg` would.
+
+    Returns the list of edge-detection results (see
+    :func:`edge_fit_roi`) used for the sphere masks; Items of
+    `edge_fits` are reused if given and not `None`. If `float32`
+    is set, the background is fitted in single precision.
+    """
+    if edge_fits is None:
+        edge_fits = [None] * len(qpis)
+    else:
+        edge_fits = list(edge_fits)
+    if not bg_kw:
+        return edge_fits
+    # group ROIs by shape
+    groups = {}
+    for ii, qpi in enumerate(qpis):
+        mask, edge_fits[ii] = _bg_mask(qpi=qpi,
+                                       which_data=which_data,
+                                       bg_mask_thresh=bg_mask_thresh,
+                                       bg_mask_sphere_kw=bg_mask_sphere_kw,
+                                       edge_fit=edge_fits[ii])
+        groups.setdefault(qpi.shape, []).append((qpi, mask))
+    for items in groups.values():
+        imdats = []
+        for qpi, _ in items:
+            imdat = qpi._amp if which_data == "amplitude" else qpi._pha
+            # remove existing fit before accessing `imdat.image`
+            imdat.set_bg(bg=None, key="fit")
+            imdats.append(imdat)
+        masks = [mask for _, mask in items]
+        bgimages, attrs = _bg_fit(
+            images=np.array([imdat.image for imdat in imdats],
+                            dtype=np.float32 if float32 else float),
+            masks=masks,
+            pixel_sizes=[qpi["pixel size"] for qpi, _ in items],
+            bg_kw=bg_kw)
+        # same as :func:`qpimage.image_data.ImageData.estimate_bg`
+        for imdat, bgimage, mask, attr in zip(imdats, bgimages, masks,
+                                              attrs):
+            imdat.set_bg(bg=bgimage, key="fit", attrs=attr)
+            imdat["estimate_bg_from_mask"] = mask
+    return edge_fits
+
+
+def _bg_fit(images, masks, pixel_sizes, bg_kw):
+    """Estimate the background of several images of equal shape
+
+    The images are grouped by border size and masking and each
+    group is processed with :func:`compute_bg_batch`.
+
+    Returns the background images and, for each image, the
+    attributes that :func:`qpimage.QPImage.compute_bg` stores
+    with the background fit.
+    """
+    bg_kw = bg_kw.copy()
+    fit_offset = bg_kw.pop("fit_offset", "mean")
+    fit_profile = bg_kw.pop("fit_profile", "tilt")
+    groups = {}
+    for ii, (mask, pixel_size) in enumerate(zip(masks, pixel_sizes)):
+        border_px = get_border_px(shape=images.shape[1:],
+                                  pixel_size=pixel_size,
+                                  from_mask=mask,
+                                  **bg_kw)
+        groups.setdefault((border_px, mask is None), []).append(ii)
+    bgimages = np.zeros(images.shape, dtype=images.dtype)
+    attrs = [None] * len(images)
+    for (border_px, no_mask), idx in groups.items():
+        bgimages[idx] = compute_bg_batch(
+            images=images[idx],
+            fit_offset=fit_offset,
+            fit_profile=fit_profile,
+            border_px=border_px,
+            from_masks=None if no_mask else np.array([masks[ii]
+                                                      for ii in idx]))
+        for ii in idx:
+            attrs[ii] = {"fit_offset": fit_offset,
+                         "fit_profile": fit_profile,
+                         "border_px": border_px}
+    return bgimages, attrs
+
+
+def _bg_mask(qpi, which_data, bg_mask_thresh=None, bg_mask_sphere_kw={},
+             edge_fit=None):
+    """Compute the background mask of a ROI
+
+    Returns the mask (or `None`) and the edge-detection result
+    (see :func:`edge_fit_roi`) used for the sphere mask or
+    `edge_fit` if it was given and no new edge detection was
+    necessary.
+    """
+    if isinstance(bg_mask_thresh, str) or bg_mask_thresh is not None:
+        if which_data == "phase":
+            image = qpi.pha
         else:
-            mask = np.logical_and(mask1, mask2)
-        # perforn actual bg correction
-        qpi.compute_bg(which_data=which_data,
-                       from_mask=mask,
-                       **bg_kw)
+            image = qpi.amp
+        mask1 = thr.image2mask(image,
+                               value_or_method=bg_mask_thresh,
+                               invert=True)
+    else:
+        mask1 = None
+    if bg_mask_sphere_kw["radial_clearance"] is not None:  # sphere mask
+        if edge_fit is None:
+            edge_fit = edge_fit_roi(qpi=qpi,
+                                    r0=bg_mask_sphere_kw["r0"],
+                                    edgekw=bg_mask_sphere_kw["edgekw"])
+        # same mask as :func:`qpsphere.cnvnc.bg_phase_mask_from_sim`
+        cx, cy = edge_fit["edge center"]
+        rpx = edge_fit["edge radius"] / qpi["pixel size"]
+        x = np.arange(qpi.shape[0]).reshape(-1, 1)
+        y = np.arange(qpi.shape[1]).reshape(1, -1)
+        rsq = (x - cx)**2 + (y - cy)**2
+        mask2 = rsq > (rpx * bg_mask_sphere_kw["radial_clearance"])**2
+    else:
+        mask2 = None
+    # combine masks
+    if mask1 is None and mask2 is None:
+        mask = None
+    elif mask1 is None:
+        mask = mask2
+    elif mask2 is None:
+        mask = mask1
+    else:
+        mask = np.logical_and(mask1, mask2)
+    return mask, edge_fit
 
 
 def _extract_roi(h5in, h5out, slout, imout, size_m, size_var, max_ecc,
                  dist_border, pad_border, exclude_overlap, ignore_data,
                  bg_amp_kw, bg_amp_bin, bg_amp_mask_sphere_kw,
                  bg_pha_kw, bg_pha_bin, bg_pha_mask_sphere_kw,
-                 search_enabled, threshold, count, max_count):
+                 search_enabled, threshold, count, max_count,
+                 fixed_roi=False, fft_friendly=False, phase_only=False,
+                 float32=False, h5_compression=None):
     # Determine ROI location
     with qpimage.QPSeries(h5file=h5in, h5mode="r") as qps:
         if max_count is not None:
@@ -81,7 +181,7 @@ def _extract_roi(h5in, h5out, slout, imout, size_m, size_var, max_ecc,
                 image_index = ii + 1
                 qpi = qps[ii]
                 # find objects
-                slices = search.search_phase_objects(
+                slices, geometry = search.search_phase_objects(
                     qpi=qpi,
                     size_m=size_m,
                     size_var=size_var,
@@ -89,15 +189,20 @@ def _extract_roi(h5in, h5out, slout, imout, size_m, size_var, max_ecc,
                     dist_border=dist_border,
                     pad_border=pad_border,
                     exclude_overlap=exclude_overlap,
-                    threshold=threshold)
-                for jj, sl in enumerate(slices):
+                    threshold=threshold,
+                    fft_friendly=fft_friendly,
+                    float32=float32,
+                    ret_geometry=True)
+                for jj, (sl, geo) in enumerate(zip(slices, geometry)):
                     # new indexing convention in drymass 0.6.0
                     roi_index = jj + 1
                     slident = "{}.{}".format(qpi["identifier"], roi_index)
                     rmgr.add(roi_slice=sl,
                              image_index=image_index,
                              roi_index=roi_index,
-                             identifier=slident)
+                             identifier=slident,
+                             search_center=geo["center"],
+                             search_diameter=geo["diameter"])
                 if count is not None:
                     with count.get_lock():
                         count.value += 1
@@ -127,37 +232,70 @@ def _extract_roi(h5in, h5out, slout, imout, size_m, size_var, max_ecc,
             raise ValueError(msg)
 
     # Extract ROI images
+    rois_per_image = {}
+    for roi in rmgr.rois:
+        rois_per_image.setdefault(roi.image_index, []).append(roi)
     with qpimage.QPSeries(h5file=h5in, h5mode="r") as qps, \
             qpimage.QPSeries(h5file=h5out, h5mode="w") as qps_roi, \
             tifffile.TiffWriter(fspath(imout), imagej=True) as tf:
-        for ii in range(len(qps)):
-            # new indexing convention in drymass 0.6.0
-            image_index = ii + 1
-            # image to analyze
-            qpi = qps[ii]
-            # available ROIs
-            rois = rmgr.get_from_image_index(image_index)
-            for jj, roi in enumerate(rois):
+        if fixed_roi:
+            _extract_roi_fixed(qps=qps,
+                               qps_roi=qps_roi,
+                               tf=tf,
+                               rois_per_image=rois_per_image,
+                               ignore_data=ignore_data,
+                               bg_amp_kw=bg_amp_kw,
+                               bg_amp_bin=bg_amp_bin,
+                               bg_pha_kw=bg_pha_kw,
+                               bg_pha_bin=bg_pha_bin,
+                               phase_only=phase_only,
+                               float32=float32,
+                               h5_compression=h5_compression,
+                               count=count)
+            return rmgr
+        roi_shapes = []
+        roi_identifiers = set()
+        for ii0 in range(0, len(qps), EXTRACT_BLOCK_SIZE):
+            # Extract the ROIs of a block of sensor images
+            rois = []
+            qpisls = []
+            for ii in range(ii0, min(ii0 + EXTRACT_BLOCK_SIZE, len(qps))):
                 # new indexing convention in drymass 0.6.0
-                roi_index = jj + 1
-                if is_ignored_roi(roi=roi, ignore_data=ignore_data):
-                    # ignore data
-                    continue
-                # Extract the ROI
-                qpisl = qpi.__getitem__(roi.roi_slice)
-                # amplitude bg correction
-                _bg_correct(qpi=qpisl,
-                            which_data="amplitude",
-                            bg_kw=bg_amp_kw,
-                            bg_mask_thresh=bg_amp_bin,
-                            bg_mask_sphere_kw=bg_amp_mask_sphere_kw)
-                # phase bg correction
-                _bg_correct(qpi=qpisl,
-                            which_data="phase",
-                            bg_kw=bg_pha_kw,
-                            bg_mask_thresh=bg_pha_bin,
-                            bg_mask_sphere_kw=bg_pha_mask_sphere_kw)
-                slident = "{}.{}".format(qpi["identifier"], roi_index)
+                image_index = ii + 1
+                # image to analyze
+                qpi = qps[ii]
+                # available ROIs
+                for jj, roi in enumerate(
+                        sorted(rois_per_image.get(image_index, []))):
+                    # new indexing convention in drymass 0.6.0
+                    roi_index = jj + 1
+                    if is_ignored_roi(roi=roi, ignore_data=ignore_data):
+                        # ignore data
+                        continue
+                    slident = "{}.{}".format(qpi["identifier"], roi_index)
+                    rois.append((slident, roi))
+                    qpisls.append(get_roi_qpimage(qpi, roi.roi_slice,
+                                                  phase_only=phase_only))
+            # amplitude bg correction
+            edge_fits = _bg_correct(
+                qpis=qpisls,
+                which_data="amplitude",
+                bg_kw=None if phase_only else bg_amp_kw,
+                bg_mask_thresh=bg_amp_bin,
+                bg_mask_sphere_kw=bg_amp_mask_sphere_kw,
+                float32=float32)
+            # phase bg correction (The amplitude correction does not
+            # modify the phase, so the edge detection is reused.)
+            edge_fits = _bg_correct(
+                qpis=qpisls,
+                which_data="phase",
+                bg_kw=bg_pha_kw,
+                bg_mask_thresh=bg_pha_bin,
+                bg_mask_sphere_kw=bg_pha_mask_sphere_kw,
+                edge_fits=edge_fits,
+                float32=float32)
+            for (slident, roi), qpisl, edge_fit in zip(rois, qpisls,
+                                                       edge_fits):
                 if roi.identifier != slident:
                     # This might happen if the user does not know the
                     # image identifier and builds his own `FILE_SLICES`.
@@ -166,31 +304,168 @@ def _extract_roi(h5in, h5out, slout, imout, size_m, size_var, max_ecc,
                     warnings.warn(msg)
                     # override `slident` with user identifier
                     slident = roi.identifier
-                qps_roi.add_qpimage(qpisl, identifier=slident)
+                if slident in roi_identifiers:
+                    msg = "The identifier '{}' already ".format(slident) \
+                          + "exists! Please check '{}'.".format(slout)
+                    raise ValueError(msg)
+                roi_identifiers.add(slident)
+                util.add_qpimage(qps_roi, qpisl, index=len(roi_shapes),
+                                 identifier=slident, phase_only=phase_only,
+                                 compression=h5_compression)
+                # store for later use in sphere analysis
+                roi_meta = get_search_meta(roi, qpisl["pixel size"])
+                if edge_fit is not None:
+                    roi_meta.update(edge_fit)
+                if roi_meta:
+                    set_roi_meta(qps_roi, index=len(roi_shapes),
+                                 **roi_meta)
+                roi_shapes.append(qpisl.shape)
             if count is not None:
                 with count.get_lock():
-                    count.value += 1
+                    count.value += ii + 1 - ii0
 
-        if len(qps_roi):
+        if roi_shapes:
             # Write TIF
             # determine largest image
-            sxmax = np.max([qq.shape[0] for qq in qps_roi])
-            symax = np.max([qq.shape[1] for qq in qps_roi])
-            dummy = np.zeros((2, sxmax, symax), dtype=np.float32)
+            sxmax, symax = np.max(roi_shapes, axis=0)
+            nchan = 1 if phase_only else 2
+            dummy = np.zeros((nchan, sxmax, symax), dtype=np.float32)
             for qpir in qps_roi:
                 dummy[0, :, :] = 0
-                dummy[1, :, :] = 1
                 res = 1 / qpir["pixel size"] * 1e-6  # use µm
                 sx, sy = qpir.shape
                 dummy[0, :sx, :sy] = qpir.pha
-                dummy[1, :sx, :sy] = qpir.amp
+                if not phase_only:
+                    dummy[1, :, :] = 1
+                    dummy[1, :sx, :sy] = qpir.amp
                 tf.save(data=dummy, resolution=(res, res, None), compress=9)
     return rmgr
 
 
+def _extract_roi_fixed(qps, qps_roi, tf, rois_per_image, ignore_data,
+                       bg_amp_kw, bg_amp_bin, bg_pha_kw, bg_pha_bin,
+                       count, phase_only=False, float32=False,
+                       h5_compression=None):
+    """Extract ROIs that have the same slice in all sensor images
+
+    This is a fast path of :func:`_extract_roi` for `force_roi`
+    (without sphere masks for background correction). The ROI data
+    of a block of sensor images are read, background-corrected, and
+    written as arrays (without intermediate :class:`qpimage.QPImage`
+    instances). The resulting files are identical (in double
+    precision, i.e. if `float32` is not set).
+    """
+    ctype = np.float32 if float32 else float
+    index = 0
+    roi_identifiers = set()
+    for ii0 in range(0, len(qps), EXTRACT_BLOCK_SIZE):
+        ii1 = min(ii0 + EXTRACT_BLOCK_SIZE, len(qps))
+        rois = []
+        for ii in range(ii0, ii1):
+            # new indexing convention in drymass 0.6.0
+            for roi in rois_per_image.get(ii + 1, []):
+                if not is_ignored_roi(roi=roi, ignore_data=ignore_data):
+                    rois.append((qps.h5["qpi_{}".format(ii)], roi))
+        if rois:
+            roi_slice = tuple(rois[0][1].roi_slice)
+            pixel_sizes = [grp.attrs["pixel size"] for grp, _ in rois]
+            data = {}
+            whiches = [("phase", bg_pha_kw, bg_pha_bin)]
+            if not phase_only:
+                whiches.insert(0, ("amplitude", bg_amp_kw, bg_amp_bin))
+            for which, bg_kw, bg_bin in whiches:
+                # same as :func:`get_roi_qpimage`
+                raw = np.array([grp[which]["raw"][roi_slice]
+                                for grp, _ in rois])
+                if which == "amplitude":
+                    bg = np.ones(raw.shape, dtype=float)
+                else:
+                    bg = np.zeros(raw.shape, dtype=float)
+                for ii, (grp, _) in enumerate(rois):
+                    for bgd in grp[which]["bg_data"].values():
+                        bgsl = bgd[roi_slice] if bgd.ndim else bgd[()]
+                        if which == "amplitude":
+                            bg[ii] *= bgsl
+                        else:
+                            bg[ii] += bgsl
+                # same data type as in :class:`qpimage.QPImage`
+                raw = raw.astype(np.float32)
+                bg = bg.astype(np.float32)
+                if which == "amplitude":
+                    image = raw / bg.astype(ctype)
+                else:
+                    image = raw - bg.astype(ctype)
+                if bg_kw:
+                    # same as :func:`_bg_mask` without sphere mask
+                    if isinstance(bg_bin, str) or bg_bin is not None:
+                        masks = [thr.image2mask(im,
+                                                value_or_method=bg_bin,
+                                                invert=True)
+                                 for im in image]
+                    else:
+                        masks = [None] * len(rois)
+                    fit, attrs = _bg_fit(images=image,
+                                         masks=masks,
+                                         pixel_sizes=pixel_sizes,
+                                         bg_kw=bg_kw)
+                    fit = fit.astype(np.float32)
+                    if which == "amplitude":
+                        image = raw / (bg.astype(ctype) * fit)
+                    else:
+                        image = raw - (bg.astype(ctype) + fit)
+                else:
+                    fit = masks = attrs = None
+                data[which] = raw, bg, fit, masks, attrs, image
+            for kk, (grp, roi) in enumerate(rois):
+                if roi.identifier in roi_identifiers:
+                    msg = "The identifier '{}' already ".format(
+                        roi.identifier) + "exists!"
+                    raise ValueError(msg)
+                roi_identifiers.add(roi.identifier)
+                # same as :func:`util.add_qpimage`
+                grp_roi = qps_roi.h5.create_group("qpi_{}".format(index))
+                if phase_only:
+                    util.write_amplitude_placeholder(
+                        grp_roi, shape=data["phase"][0].shape[1:])
+                for which in data:
+                    raw, bg, fit, masks, attrs, _ = data[which]
+                    grp_which = grp_roi.create_group(which)
+                    util.write_image_dataset(grp_which, "raw", raw[kk],
+                                             compression=h5_compression)
+                    grp_bg = grp_which.create_group("bg_data")
+                    util.write_image_dataset(grp_bg, "data", bg[kk],
+                                             compression=h5_compression)
+                    if fit is not None:
+                        dset = util.write_image_dataset(
+                            grp_bg, "fit", fit[kk],
+                            compression=h5_compression)
+                        dset.attrs.update(attrs[kk])
+                        if masks[kk] is not None:
+                            util.write_image_dataset(
+                                grp_which, "estimate_bg_from_mask",
+                                masks[kk], compression=h5_compression)
+                grp_roi.attrs.update(grp.attrs)
+                grp_roi.attrs["qpimage version"] = qpimage.__version__
+                grp_roi.attrs["identifier"] = roi.identifier
+                index += 1
+                # Write TIF
+                res = 1 / grp.attrs["pixel size"] * 1e-6  # use µm
+                tifdata = np.array([data[which][-1][kk]
+                                    for which in ["phase", "amplitude"]
+                                    if which in data],
+                                   dtype=np.float32)
+                tf.save(data=tifdata, resolution=(res, res, None),
+                        compress=9)
+        if count is not None:
+            with count.get_lock():
+                count.value += ii1 - ii0
+
+
 def extract_roi(h5series, dir_out, size_m, size_var=.5, max_ecc=.7,
                 dist_border=10, pad_border=40, exclude_overlap=30.,
-                threshold="li", ignore_data=None, force_roi=None,
+                threshold="li", fft_friendly=False, phase_only=False,
+                float32=False, h5_compression=None, ignore_data=None,
+                force_roi=None,
                 bg_amp_kw=BG_DEFAULT_KW, bg_amp_bin=None,
                 bg_amp_mask_radial_clearance=None,
                 bg_pha_kw=BG_DEFAULT_KW, bg_pha_bin=None,
@@ -221,6 +496,21 @@ def extract_roi(h5series, dir_out, size_m, size_var=.5, max_ecc=.7,
     threshold: float or str
         Thresholding value or method used;
         see :const:`drymass.search.available_thresholds`
+    fft_friendly: bool
+        Center the ROIs at the objects and pad or crop them to
+        FFT-friendly sizes (see :func:`drymass.search.fft_size`)
+    phase_only: bool
+        Only store, background-correct, and export the phase data
+        of the ROIs; The amplitude is one for all ROIs and the
+        `bg_amp_*` parameters are ignored.
+    float32: bool
+        Perform the ROI search and the background correction in
+        single precision (the data are always stored in single
+        precision)
+    h5_compression: dict or None
+        HDF5 compression of the ROI data (see
+        :func:`drymass.util.get_h5_compression`); defaults to
+        :const:`drymass.util.H5_COMPRESSION`
     ignore_data: list of str
         Identifiers for sensor images or ROIs to be excluded from
         further analysis. These will be labeled in the output
@@ -284,6 +574,11 @@ def extract_roi(h5series, dir_out, size_m, size_var=.5, max_ecc=.7,
     h5in = pathlib.Path(h5series)
     dout = pathlib.Path(dir_out)
 
+    if phase_only:
+        bg_amp_kw = None
+        bg_amp_bin = None
+        bg_amp_mask_radial_clearance = None
+
     h5out = dout / FILE_ROI_DATA_H5
     imout = dout / FILE_ROI_DATA_TIF
     slout = dout / FILE_SLICES
@@ -294,7 +589,7 @@ def extract_roi(h5series, dir_out, size_m, size_var=.5, max_ecc=.7,
         raise ValueError("File '{}' does not exist but is ".format(slout)
                          + "required when `search_enabled` is `False`.")
     with qpimage.QPSeries(h5file=h5in, h5mode="r") as qps:
-        cfgid = util.hash_object([
+        cfgparms = [
             size_m,
             size_var,
             max_ecc,
@@ -319,7 +614,15 @@ def extract_roi(h5series, dir_out, size_m, size_var=.5, max_ecc=.7,
             # an important part of the ROI extraction process and must
             # be part of `cfgid`.
             slid if not search_enabled else None,
-        ])
+        ]
+        # (only if set, so that previous results can be reused)
+        if fft_friendly:
+            cfgparms.append("fft friendly")
+        if phase_only:
+            cfgparms.append("phase only")
+        if float32:
+            cfgparms.append("float32")
+        cfgid = util.hash_object(cfgparms)
         identifier_roi = "{}:{}".format(qps.identifier, cfgid)
     # identifies which indices of those ROIs computed are used
     if ignore_data:
@@ -382,6 +685,10 @@ def extract_roi(h5series, dir_out, size_m, size_var=.5, max_ecc=.7,
             pad_border=pad_border,
             exclude_overlap=exclude_overlap,
             threshold=threshold,
+            fft_friendly=fft_friendly,
+            phase_only=phase_only,
+            float32=float32,
+            h5_compression=h5_compression,
             ignore_data=ignore_data,
             bg_amp_kw=bg_amp_kw,
             bg_amp_bin=bg_amp_bin,
@@ -392,6 +699,10 @@ def extract_roi(h5series, dir_out, size_m, size_var=.5, max_ecc=.7,
             search_enabled=search_enabled,
             count=count,
             max_count=max_count,
+            # fast path (the sphere mask requires a QPImage per ROI)
+            fixed_roi=(force_roi is not None
+                       and bg_amp_mask_radial_clearance is None
+                       and bg_pha_mask_radial_clearance is None),
         )
         with qpimage.QPSeries(h5file=h5out, h5mode="a") as qpo:
             qpo.h5.attrs["identifier"] = "{}:{}".format(identifier_roi, idxid)
@@ -410,6 +721,335 @@ def extract_roi(h5series, dir_out, size_m, size_var=.5, max_ecc=.7,
     return ret
 
 
+def compute_bg_batch(images, fit_offset="mean", fit_profile="tilt",
+                     border_px=0, from_masks=None):
+    """Estimate the background of several images of equal shape
+
+    This is a vectorized version of :func:`qpimage.bg_estimate.estimate`.
+    The background profiles are linear in their parameters, so they
+    are fitted with a linear least-squares solver (instead of
+    iteratively with lmfit). If all images share the same mask
+    (e.g. when only `border_px` is given), the design matrix is
+    factorized only once for all images.
+
+    Parameters
+    ----------
+    images: np.ndarray of shape (N, sx, sy)
+        Image data
+    fit_offset: str
+        The method for computing the profile offset
+        (see :func:`qpimage.bg_estimate.estimate`)
+    fit_profile: str
+        The type of background profile to fit
+        (see :func:`qpimage.bg_estimate.estimate`)
+    border_px: float
+        Assume that a frame of `border_px` pixels around
+        each image is background.
+    from_masks: boolean np.ndarray of shape (N, sx, sy) or None
+        Background masks of the images (`True` elements are used
+        for background estimation); If `border_px` is given as
+        well, the intersection of the two is used.
+
+    Returns
+    -------
+    bgimages: np.ndarray of shape (N, sx, sy)
+        Background images (float32 if `images` is a float32 array,
+        in which case the fit is performed in single precision)
+    """
+    if fit_profile not in qpimage.bg_estimate.VALID_FIT_PROFILES:
+        msg = "`fit_profile` must be one of {}, got '{}'".format(
+            qpimage.bg_estimate.VALID_FIT_PROFILES,
+            fit_profile)
+        raise ValueError(msg)
+    if fit_offset not in qpimage.bg_estimate.VALID_FIT_OFFSETS:
+        msg = "`fit_offset` must be one of {}, got '{}'".format(
+            qpimage.bg_estimate.VALID_FIT_OFFSETS,
+            fit_offset)
+        raise ValueError(msg)
+    if fit_offset == "fit" and fit_profile == "offset":
+        msg = "`fit_offset=='fit'` only valid when `fit_profile!='offset`"
+        raise ValueError(msg)
+    images = np.asarray(images)
+    if images.dtype != np.float32:
+        images = images.astype(float)
+    num, sx, sy = images.shape
+    # masks
+    if from_masks is None:
+        mask = np.ones((sx, sy), dtype=bool)
+    else:
+        mask = np.array(from_masks, dtype=bool)
+    if border_px > 0:
+        border_px = int(np.round(border_px))
+        mask_px = np.zeros((sx, sy), dtype=bool)
+        mask_px[:border_px, :] = True
+        mask_px[-border_px:, :] = True
+        mask_px[:, :border_px] = True
+        mask_px[:, -border_px:] = True
+        mask = np.logical_and(mask, mask_px)
+    mask = np.broadcast_to(mask, images.shape).reshape(num, -1)
+    data = images.reshape(num, -1)
+    # design matrix (coordinates as in :func:`qpimage.bg_estimate`,
+    # scaled for numerical stability)
+    scale = max(sx, sy) / 2
+    x = (np.arange(sx) - sx // 2).reshape(-1, 1) / scale
+    y = (np.arange(sy) - sy // 2).reshape(1, -1) / scale
+    x, y = np.broadcast_arrays(x, y)
+    if fit_profile == "tilt":
+        terms = [np.ones_like(x), x, y]
+    elif fit_profile == "poly2o":
+        terms = [np.ones_like(x), x, y, x**2, y**2, x * y]
+    else:
+        terms = []
+    if terms:
+        design = np.stack([tt.ravel() for tt in terms],
+                          axis=1).astype(images.dtype)
+        if np.all(mask == mask[0]):
+            # one factorization for all images
+            coeffs = np.linalg.lstsq(design[mask[0]],
+                                     data[:, mask[0]].T,
+                                     rcond=None)[0].T
+        else:
+            # weighted normal equations, solved for all images at once
+            weights = mask.astype(images.dtype)
+            lhs = np.einsum("pk,np,pl->nkl", design, weights, design)
+            rhs = np.einsum("pk,np->nk", design, weights * data)
+            coeffs = np.linalg.solve(lhs, rhs[..., np.newaxis])[..., 0]
+        bgdata = coeffs @ design.T
+    else:
+        bgdata = np.zeros_like(data)
+    # add offsets
+    if fit_offset == "mean":
+        resid = np.where(mask, data - bgdata, 0)
+        bgdata += (resid.sum(axis=1) / mask.sum(axis=1)).reshape(-1, 1)
+    elif fit_offset in ["gauss", "mode"]:
+        if fit_offset == "gauss":
+            offset_func = qpimage.bg_estimate.offset_gaussian
+        else:
+            offset_func = qpimage.bg_estimate.offset_mode
+        for ii in range(num):
+            bgdata[ii] += float(
+                offset_func((data[ii] - bgdata[ii])[mask[ii]]))
+    return bgdata.reshape(num, sx, sy)
+
+
+def edge_fit_roi(qpi, r0, edgekw={}):
+    """Determine location, radius, and index of a ROI via edge detection
+
+    Parameters
+    ----------
+    qpi: qpimage.QPImage
+        QPI data of the ROI
+    r0: float
+        Approximate radius of the object [m]
+    edgekw: dict
+        Keyword arguments to :func:`qpsphere.edgefit.contour_canny`
+
+    Returns
+    -------
+    edge_fit: dict
+        Dictionary with the keys "edge center" [px], "edge radius" [m],
+        "edge index", "edge r0" [m], and "edge kw hash" (hash of
+        `edgekw`); The latter two identify the parameters used
+        (see :func:`is_edge_fit_compatible`).
+    """
+    n, r, c = qpsphere.edgefit.analyze(qpi=qpi,
+                                       r0=r0,
+                                       edgekw=edgekw,
+                                       ret_center=True,
+                                       ret_edge=False)
+    edge_fit = {"edge center": np.array(c, dtype=float),
+                "edge index": n,
+                "edge radius": r,
+                "edge r0": r0,
+                "edge kw hash": util.hash_object(edgekw),
+                }
+    return edge_fit
+
+
+def get_border_px(shape, pixel_size, border_m=0, border_perc=0, border_px=0,
+                  from_mask=None):
+    """Compute the background border size of an image in pixels
+
+    This is the border size used in :func:`qpimage.QPImage.compute_bg`,
+    i.e. the largest of the (rounded) `border_*` values in pixels.
+
+    Parameters
+    ----------
+    shape: tuple of int
+        Image shape
+    pixel_size: float
+        Pixel size [m]
+    border_m, border_perc, border_px: float
+        Border size in meters, in percent of the average image size,
+        and in pixels
+    from_mask: boolean np.ndarray or None
+        Background mask (only used for sanity checks)
+    """
+    border_list = []
+    if border_m:
+        if border_m < 0:
+            raise ValueError("`border_m` must be greater than zero!")
+        border_list.append(border_m / pixel_size)
+    if border_perc:
+        if border_perc < 0 or border_perc > 50:
+            raise ValueError("`border_perc` must be in interval [0, 50]!")
+        size = np.average(shape)
+        border_list.append(size * border_perc / 100)
+    if border_px:
+        border_list.append(border_px)
+    if border_list:
+        border_px = int(np.round(np.max(border_list)))
+    elif from_mask is None:
+        raise ValueError("Neither `from_mask` nor `border_*` given!")
+    elif np.all(from_mask == 0):
+        raise ValueError("`from_mask` must not be all-zero!")
+    return border_px
+
+
+def get_roi_meta(qps):
+    """Return supplementary ROI data stored in a ROI series file
+
+    Parameters
+    ----------
+    qps: qpimage.QPSeries
+        ROI series (opened `FILE_ROI_DATA_H5`)
+
+    Returns
+    -------
+    roi_meta: dict
+        Dictionary with ROI identifiers as keys and dictionaries
+        of the supplementary data (e.g. the edge detection results
+        from background correction or the object geometry from the
+        ROI search, see :func:`get_search_meta`) as values. ROIs without
+        supplementary data are not listed.
+    """
+    roi_meta = {}
+    if H5_ROI_META in qps.h5:
+        for grp in qps.h5[H5_ROI_META].values():
+            attrs = dict(grp.attrs)
+            roi_meta[attrs.pop("identifier")] = attrs
+    return roi_meta
+
+
+def set_roi_meta(qps, index, **kwargs):
+    """Store supplementary ROI data in a ROI series file
+
+    Parameters
+    ----------
+    qps: qpimage.QPSeries
+        ROI series (opened `FILE_ROI_DATA_H5` in write mode)
+    index: int
+        Index of the ROI in `qps`
+    kwargs:
+        Data to store; Values must be compatible with HDF5 attributes.
+    """
+    name = "qpi_{}".format(index)
+    grp = qps.h5.require_group(H5_ROI_META).require_group(name)
+    grp.attrs["identifier"] = qps.h5[name].attrs["identifier"]
+    for key in kwargs:
+        grp.attrs[key] = kwargs[key]
+
+
+def get_search_meta(roi, pixel_size):
+    """Return the geometry of an object found by the ROI search
+
+    Parameters
+    ----------
+    roi: drymass.roi.ROI
+        ROI instance
+    pixel_size: float
+        Pixel size [m]
+
+    Returns
+    -------
+    search_meta: dict
+        Dictionary with the keys "search center" (object center
+        relative to the ROI [px]) and "search radius" (radius of a
+        circle with the same area as the object [m]); empty if
+        `roi` has no search geometry (e.g. ROIs from a user-edited
+        `FILE_SLICES` or from `force_roi`)
+    """
+    if roi.search_center is None:
+        return {}
+    sx, sy = roi.roi_slice
+    return {"search center": (roi.search_center[0] - (sx.start or 0),
+                              roi.search_center[1] - (sy.start or 0)),
+            "search radius": roi.search_diameter / 2 * pixel_size}
+
+
+def get_roi_qpimage(qpi, roi_slice, phase_only=False):
+    """Extract a ROI from a QPImage, only reading the ROI data from disk
+
+    This is equivalent to ``qpi[roi_slice]`` (see
+    :func:`qpimage.QPImage.__getitem__`), but only the hyperslabs
+    defined by `roi_slice` of the raw and background data are read
+    from the underlying HDF5 file (see
+    :const:`drymass.converter.H5_SENSOR_CHUNKS`).
+
+    Parameters
+    ----------
+    qpi: qpimage.QPImage
+        Sensor image
+    roi_slice: tuple of (slice, slice)
+        ROI location
+    phase_only: bool
+        Only read the phase data (the amplitude of the ROI is one)
+
+    Returns
+    -------
+    qpi_roi: qpimage.QPImage
+        ROI with the background data merged into the "data"
+        background array
+    """
+    roi_slice = tuple(roi_slice)
+    data = {}
+    for which in ["phase"] if phase_only else ["amplitude", "phase"]:
+        raw = qpi.h5[which]["raw"][roi_slice]
+        if which == "amplitude":
+            bg = np.ones(raw.shape, dtype=float)
+        else:
+            bg = np.zeros(raw.shape, dtype=float)
+        for bgd in qpi.h5[which]["bg_data"].values():
+            bgsl = bgd[roi_slice] if bgd.ndim else bgd[()]
+            if which == "amplitude":
+                bg *= bgsl
+            else:
+                bg += bgsl
+        data[which] = raw, bg
+    if phase_only:
+        return qpimage.QPImage(data=data["phase"][0],
+                               bg_data=data["phase"][1],
+                               which_data="phase",
+                               meta_data=qpi.meta,
+                               proc_phase=False)
+    qpi_roi = qpimage.QPImage(data=(data["phase"][0], data["amplitude"][0]),
+                              bg_data=(data["phase"][1],
+                                       data["amplitude"][1]),
+                              which_data=("phase", "amplitude"),
+                              meta_data=qpi.meta,
+                              proc_phase=False)
+    return qpi_roi
+
+
+def is_edge_fit_compatible(edge_fit, r0, edgekw):
+    """Check whether an edge detection result matches `r0` and `edgekw`
+
+    Parameters
+    ----------
+    edge_fit: dict
+        Edge detection result (see :func:`edge_fit_roi`); may also
+        be any other dictionary (e.g. from :func:`get_roi_meta`).
+    r0: float
+        Approximate radius of the object [m]
+    edgekw: dict
+        Keyword arguments to :func:`qpsphere.edgefit.contour_canny`
+    """
+    return ("edge r0" in edge_fit
+            # `r0` is computed from the specimen size in different ways
+            and np.isclose(edge_fit["edge r0"], r0, rtol=1e-9, atol=0)
+            and edge_fit["edge kw hash"] == util.hash_object(edgekw))
+
+
 def is_ignored_roi(roi, ignore_data):
     """Determine whether a specific ROI should be ignored
 
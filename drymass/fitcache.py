@@ -0,0 +1,188 @@
+import hashlib
+import os
+import pathlib
+
+import qpimage
+import qpsphere
+
+from ._version import version
+from .converter import CACHE_DIR
+from . import util
+
+#: Default directory of the sphere-fit cache
+FIT_CACHE_DIR = CACHE_DIR / "sphere_fits"
+#: Default maximum size of the sphere-fit cache [bytes]
+FIT_CACHE_SIZE = 1000 * 1024**2
+
+
+class SphereFitCache(object):
+    def __init__(self, path=FIT_CACHE_DIR, max_size=FIT_CACHE_SIZE):
+        """Persistent, content-addressed cache for sphere fits
+
+        The results of :func:`drymass.anasphere.fit_sphere` are stored
+        in individual HDF5 files whose names are the SHA-256 hashes
+        of the ROI data and of all parameters that affect the fit
+        (see :func:`SphereFitCache.get_key`). Identical ROIs are thus
+        never fitted twice, independent of the dataset they belong
+        to or of the ROI extraction parameters.
+
+        Parameters
+        ----------
+        path: str or pathlib.Path
+            Cache directory (created if it does not exist)
+        max_size: int
+            Maximum size of the cache [bytes]; If the cache grows
+            larger, the least recently used entries are removed.
+        """
+        self.path = pathlib.Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self._size = sum(self._entry_sizes().values())
+
+    def __contains__(self, key):
+        return self._entry_path(key).exists()
+
+    def _entry_path(self, key):
+        """Path of a cache entry (two-level directory structure)"""
+        return self.path / key[:2] / "{}.h5".format(key)
+
+    def _entry_sizes(self):
+        """Return dictionary of cache entry paths and file sizes"""
+        sizes = {}
+        for pp in self.path.glob("*/*.h5"):
+            try:
+                sizes[pp] = pp.stat().st_size
+            except FileNotFoundError:
+                # removed by another process
+                pass
+        return sizes
+
+    def clear(self):
+        """Remove all entries from the cache"""
+        for pp in self._entry_sizes():
+            pp.unlink()
+        self._size = 0
+
+    def evict(self):
+        """Remove least recently used entries exceeding `self.max_size`"""
+        sizes = self._entry_sizes()
+        self._size = sum(sizes.values())
+        if self._size > self.max_size:
+            mtimes = {}
+            for pp in sizes:
+                try:
+                    mtimes[pp] = pp.stat().st_mtime
+                except FileNotFoundError:
+                    pass
+            for pp in sorted(mtimes, key=lambda x: mtimes[x]):
+                if self._size <= self.max_size:
+                    break
+                try:
+                    pp.unlink()
+                except FileNotFoundError:
+                    pass
+                self._size -= sizes[pp]
+
+    def get(self, key):
+        """Return a cached sphere fit
+
+        Parameters
+        ----------
+        key: str
+            Cache key (see :func:`SphereFitCache.get_key`)
+
+        Returns
+        -------
+        n, r, c, qpi_sim: float, float, tuple of floats, qpimage.QPImage
+            Refractive index, radius [m], center [px], and modeled
+            data (see :func:`drymass.anasphere.fit_sphere`) or `None`
+            if there is no entry for `key`.
+        """
+        path = self._entry_path(key)
+        try:
+            with qpimage.QPImage(h5file=path, h5mode="r") as qpi:
+                qpi_sim = qpi.copy()
+            # mark as recently used
+            os.utime(path)
+        except (FileNotFoundError, OSError):
+            # no entry or entry removed/being written by another process
+            return None
+        return (qpi_sim["sim index"], qpi_sim["sim radius"],
+                qpi_sim["sim center"], qpi_sim)
+
+    @staticmethod
+    def get_key(qpi, r0, method, model, edgekw, imagekw, edge_fit=None,
+                init=None, coarse_levels=0, c0=None):
+        """Compute the cache key of a sphere fit
+
+        Parameters
+        ----------
+        qpi: qpimage.QPImage
+            QPI data of the ROI
+        r0, method, model, edgekw, imagekw, edge_fit, init, coarse_levels, c0:
+            Fit parameters (see :func:`drymass.anasphere.fit_sphere`)
+
+        Returns
+        -------
+        key: str
+            SHA-256 hex-hash of the (background-corrected) phase and
+            amplitude data, the relevant metadata, the fit parameters,
+            and the qpsphere and DryMass versions
+        """
+        pha = qpi.pha
+        amp = qpi.amp
+        if edge_fit is not None:
+            edge_fit = [edge_fit["edge center"], edge_fit["edge radius"]]
+        if init is not None:
+            init = [init["index"], init["radius"], init["center"]]
+        # verbosity does not affect the fit
+        imagekw = {k: imagekw[k] for k in imagekw if k != "verbose"}
+        data = [
+            list(pha.shape), str(pha.dtype), pha,
+            list(amp.shape), str(amp.dtype), amp,
+            qpi["pixel size"],
+            qpi["wavelength"],
+            qpi["medium index"],
+            r0,
+            method,
+            model,
+            edgekw,
+            imagekw if method == "image" else None,
+            edge_fit,
+            init,
+            coarse_levels if method == "image" else 0,
+            list(c0) if c0 is not None and method == "image" else None,
+            qpsphere.__version__,
+            version,
+        ]
+        return hashlib.sha256(util.obj2bytes(data)).hexdigest()
+
+    def set(self, key, qpi_sim):
+        """Store a sphere fit in the cache
+
+        Parameters
+        ----------
+        key: str
+            Cache key (see :func:`SphereFitCache.get_key`)
+        qpi_sim: qpimage.QPImage
+            Modeled data (with the "sim index", "sim radius", and
+            "sim center" metadata)
+        """
+        if self.max_size <= 0:
+            return
+        path = self._entry_path(key)
+        path.parent.mkdir(exist_ok=True)
+        try:
+            # size of an entry that is overwritten
+            size_old = path.stat().st_size
+        except FileNotFoundError:
+            size_old = 0
+        # write to a temporary file first (atomic for parallel runs)
+        path_temp = path.with_name(
+            "{}_{}.tmp".format(path.name, os.getpid()))
+        with qpi_sim.copy(h5file=path_temp):
+            pass
+        path_temp.replace(path)
+        self._size += path.stat().st_size - size_old
+        if self._size > self.max_size:
+            self.evict()
@@ -0,0 +1,168 @@
+import multiprocessing as mp
+import traceback
+
+import qpimage
+
+
+class RemoteTraceback(Exception):
+    """Traceback of an exception raised in a worker process"""
+
+    def __init__(self, tb):
+        self.tb = tb
+
+    def __str__(self):
+        return self.tb
+
+
+class SphereFitTimeoutError(Exception):
+    """Raised when a sphere fit exceeds its time budget"""
+    pass
+
+
+class SphereFitWorker(object):
+    def __init__(self, timeout):
+        """Run sphere fits in a separate process with a time budget
+
+        The worker process is started with the first fit. If a fit
+        does not finish within `timeout`, the worker process is
+        terminated (and restarted with the next fit), such that a
+        single pathological ROI cannot stall the sphere analysis.
+
+        Parameters
+        ----------
+        timeout: float or None
+            Maximum wall-clock time of a single fit [s]; If set to
+            None, the fits are performed in the current process.
+
+        Notes
+        -----
+        Use this class as a context manager or call
+        :func:`SphereFitWorker.close` to stop the worker process.
+        """
+        self.timeout = timeout
+        self._proc = None
+        self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, tb):
+        self.close()
+
+    def _start(self):
+        self._conn, conn_worker = mp.Pipe()
+        self._proc = mp.Process(target=_fit_worker_loop,
+                                args=(conn_worker,),
+                                daemon=True)
+        self._proc.start()
+        conn_worker.close()
+
+    def _kill(self):
+        self._proc.terminate()
+        self._proc.join()
+        self._conn.close()
+        self._proc = None
+        self._conn = None
+
+    def close(self):
+        """Stop the worker process"""
+        if self._proc is not None:
+            try:
+                self._conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            self._proc.join(timeout=1)
+            self._kill()
+
+    def fit_sphere(self, qpi, **kwargs):
+        """Run :func:`drymass.anasphere.fit_sphere` in the worker
+
+        Parameters
+        ----------
+        qpi: qpimage.QPImage
+            QPI data
+        kwargs: dict
+            Keyword arguments to :func:`drymass.anasphere.fit_sphere`
+
+        Returns
+        -------
+        n, r, c, qpi_sim:
+            See :func:`drymass.anasphere.fit_sphere`
+
+        Raises
+        ------
+        SphereFitTimeoutError
+            If the fit did not finish within `self.timeout`
+        Exception
+            Exceptions raised by the fit in the worker process are
+            raised again; Their message is extended by the traceback
+            of the worker (or, if the exception has no message, the
+            traceback is attached as :class:`RemoteTraceback` cause).
+        """
+        if self.timeout is None:
+            # import here to avoid circular imports
+            from .anasphere import fit_sphere
+            return fit_sphere(qpi, **kwargs)
+        if self._proc is None or not self._proc.is_alive():
+            self._start()
+        self._conn.send((qpi_to_dict(qpi), kwargs))
+        if not self._conn.poll(self.timeout):
+            self._kill()
+            raise SphereFitTimeoutError(
+                "Sphere fit did not finish within {}s!".format(self.timeout))
+        try:
+            result = self._conn.recv()
+        except EOFError:
+            # worker died (e.g. segmentation fault)
+            self._kill()
+            raise
+        if isinstance(result[0], BaseException):
+            exc, tb = result
+            # (the traceback is lost when pickling the exception)
+            if exc.args and isinstance(exc.args[0], str):
+                exc.args = ("{}\n\nTraceback of the fit worker:\n{}".format(
+                    exc.args[0], tb.rstrip()),) + exc.args[1:]
+            else:
+                exc.__cause__ = RemoteTraceback(tb)
+            raise exc
+        n, r, c, qpi_sim = result
+        return n, r, c, qpi_from_dict(qpi_sim)
+
+
+def _fit_worker_loop(conn):
+    """Fit spheres sent through `conn` until `None` is received"""
+    # import here to avoid circular imports
+    from .anasphere import fit_sphere
+    while True:
+        job = conn.recv()
+        if job is None:
+            break
+        qpi, kwargs = job
+        try:
+            n, r, c, qpi_sim = fit_sphere(qpi_from_dict(qpi), **kwargs)
+            result = (n, r, c, qpi_to_dict(qpi_sim))
+        except Exception as exc:
+            result = (exc, traceback.format_exc())
+        conn.send(result)
+    conn.close()
+
+
+def qpi_from_dict(data):
+    """Create a QPImage from the output of :func:`qpi_to_dict`"""
+    qpi = qpimage.QPImage(data=(data["raw_pha"], data["raw_amp"]),
+                          which_data=("phase", "amplitude"),
+                          meta_data=data["meta"],
+                          proc_phase=False)
+    qpi.set_bg_data(bg_data=(data["bg_pha"], data["bg_amp"]),
+                    which_data=("phase", "amplitude"))
+    return qpi
+
+
+def qpi_to_dict(qpi):
+    """Return the data of a QPImage as a (picklable) dictionary"""
+    return {"raw_pha": qpi.raw_pha,
+            "raw_amp": qpi.raw_amp,
+            "bg_pha": qpi.bg_pha,
+            "bg_amp": qpi.bg_amp,
+            "meta": dict(qpi.meta),
+            }
@@ -0,0 +1,140 @@
+"""
+Cheap quality metrics for deciding whether an ROI is worth fitting
+
+The image fit of the sphere analysis is expensive. ROIs containing
+debris, doublets, out-of-focus, or clipped objects are usually
+excluded after the analysis anyway. The metrics computed here only
+require an edge detection and a few array operations, such that
+these ROIs can be rejected before fitting
+(see :func:`drymass.anasphere.analyze_sphere`).
+"""
+import numpy as np
+import qpsphere
+
+from .simlib import radial_profile
+
+
+#: Quality metrics computed by :func:`compute_roi_quality`
+QUALITY_METRICS = ["contrast", "circularity", "symmetry", "border margin"]
+
+
+def check_roi_quality(metrics, min_contrast=None, min_circularity=None,
+                      min_symmetry=None, min_border_margin=None):
+    """Check ROI quality metrics against lower limits
+
+    Parameters
+    ----------
+    metrics: dict
+        ROI quality metrics (see :func:`compute_roi_quality`)
+    min_contrast: float or None
+        Minimum phase contrast [rad]
+    min_circularity: float or None
+        Minimum circularity of the detected edge
+    min_symmetry: float or None
+        Minimum radial symmetry of the phase
+    min_border_margin: float or None
+        Minimum distance between the object and the ROI border [px];
+        Set to 0 to reject objects that are clipped by the ROI border.
+
+    Returns
+    -------
+    reason: str or None
+        Names of the metrics that are below their limits, joined
+        by "+" with spaces replaced by underscores (e.g.
+        "contrast+border_margin"; invalid metrics, e.g. the circularity
+        of an ROI in which no edge was found, are always below the
+        limit) or `None` if the ROI passed all checks.
+    """
+    limits = {"contrast": min_contrast,
+              "circularity": min_circularity,
+              "symmetry": min_symmetry,
+              "border margin": min_border_margin,
+              }
+    failed = []
+    for name in QUALITY_METRICS:
+        # (`not >=` for NaN-values)
+        if limits[name] is not None and not metrics[name] >= limits[name]:
+            failed.append(name)
+    if failed:
+        # (no spaces, see status column of the sphere statistics)
+        return "+".join(ff.replace(" ", "_") for ff in failed)
+    else:
+        return None
+
+
+def compute_roi_quality(qpi, r0, edgekw={}, c0=None):
+    """Compute cheap quality metrics of an ROI
+
+    Parameters
+    ----------
+    qpi: qpimage.QPImage
+        QPI data of the ROI
+    r0: float
+        Approximate radius of the object [m]
+    edgekw: dict
+        Keyword arguments to :func:`qpsphere.edgefit.contour_canny`
+    c0: tuple of floats or None
+        Approximate center of the object [px] (e.g. from the ROI
+        search); used only if the edge detection fails. If set to
+        `None`, the center of the ROI is used.
+
+    Returns
+    -------
+    metrics: dict
+        Dictionary with the keys
+
+        - "contrast": 99th percentile of the phase relative to the
+          median phase at the ROI border [rad]
+        - "circularity": one minus the average deviation of the
+          detected edge from a circle relative to its radius
+          (NaN if no edge was found)
+        - "symmetry": one minus the norm of the deviation of the
+          phase from its radial average relative to the norm of
+          the phase (within 1.2 times the object radius)
+        - "border margin": distance between the object (circle) and
+          the ROI border [px]; negative if the object is clipped
+    """
+    pha = qpi.pha
+    px_m = qpi["pixel size"]
+    border = np.concatenate([pha[0, :], pha[-1, :],
+                             pha[1:-1, 0], pha[1:-1, -1]])
+    pha = pha - np.median(border)
+    contrast = np.percentile(pha, 99)
+    try:
+        edge = qpsphere.edgefit.contour_canny(image=pha,
+                                              radius=r0 / px_m,
+                                              verbose=False,
+                                              **edgekw)
+        center, radius, rdev = qpsphere.edgefit.circle_fit(edge,
+                                                           ret_dev=True)
+    except (qpsphere.edgefit.EdgeDetectionError,
+            qpsphere.edgefit.RadiusExceedsImageSizeError):
+        circularity = np.nan
+        radius = r0 / px_m
+        if c0 is None:
+            center = (np.array(pha.shape) - 1) / 2
+        else:
+            center = c0
+    else:
+        circularity = 1 - rdev / radius
+    # radial symmetry
+    size = int(np.ceil(1.2 * radius)) + 1
+    profile, counts = radial_profile(pha, center, size)
+    xx, yy = np.ogrid[:pha.shape[0], :pha.shape[1]]
+    dist = np.round(np.sqrt((xx - center[0])**2 + (yy - center[1])**2))
+    inside = dist < size
+    pha_in = pha[inside]
+    deviation = pha_in - profile[dist[inside].astype(int)]
+    norm = np.linalg.norm(pha_in)
+    if norm > 0:
+        symmetry = 1 - np.linalg.norm(deviation) / norm
+    else:
+        symmetry = np.nan
+    border_margin = min(center[0], center[1],
+                        pha.shape[0] - 1 - center[0],
+                        pha.shape[1] - 1 - center[1]) - radius
+    return {"contrast": float(contrast),
+            "circularity": float(circularity),
+            "symmetry": float(symmetry),
+            "border margin": float(border_margin),
+            }
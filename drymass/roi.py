@@ -8,8 +8,15 @@ class ROIManagerWarning(UserWarning):
 
 
 class ROI(object):
-    def __init__(self, identifier, image_index, roi_index, roi_slice):
-        """Handle one region of interest (ROI)"""
+    def __init__(self, identifier, image_index, roi_index, roi_slice,
+                 search_center=None, search_diameter=None):
+        """Handle one region of interest (ROI)
+
+        The optional `search_center` and `search_diameter` [px]
+        describe the object found by the ROI search in the
+        coordinates of the sensor image (see
+        :func:`drymass.search.search_phase_objects`).
+        """
         if not isinstance(identifier, str):
             raise ValueError("`identifier` must be a string!")
         # verify roi_slice
@@ -23,6 +30,8 @@ class ROI(object):
         self.image_index = image_index
         self.roi_index = roi_index
         self.roi_slice = roi_slice
+        self.search_center = search_center
+        self.search_diameter = search_diameter
 
     def __eq__(self, other):
         return self.to_str() == other.to_str()
@@ -49,20 +58,34 @@ class ROI(object):
                        max(sldata[0], sldata[1]))
         slice2 = slice(min(sldata[2], sldata[3]),
                        max(sldata[2], sldata[3]))
+        if len(ll) > 5:
+            # object geometry from the ROI search
+            cdata = ll[4].strip("() ").split(",")
+            search_center = (float(cdata[0]), float(cdata[1]))
+            search_diameter = float(ll[5])
+        else:
+            search_center = None
+            search_diameter = None
         roi = ROI(identifier=ll[0],
                   image_index=int(ll[1]),
                   roi_index=int(ll[2]),
-                  roi_slice=(slice1, slice2)
+                  roi_slice=(slice1, slice2),
+                  search_center=search_center,
+                  search_diameter=search_diameter,
                   )
         return roi
 
     def to_str(self):
         """Export ROI to a string"""
-        strout = "\t".join([self.identifier,
-                            str(self.image_index),
-                            str(self.roi_index),
-                            str(self.roi_slice)
-                            ])
+        items = [self.identifier,
+                 str(self.image_index),
+                 str(self.roi_index),
+                 str(self.roi_slice)
+                 ]
+        if self.search_center is not None:
+            items += ["({:.2f}, {:.2f})".format(*self.search_center),
+                      "{:.2f}".format(self.search_diameter)]
+        strout = "\t".join(items)
         return strout
 
 
@@ -83,7 +106,8 @@ class ROIManager(object):
     def __len__(self):
         return len(self.rois)
 
-    def add(self, roi_slice, image_index, roi_index, identifier):
+    def add(self, roi_slice, image_index, roi_index, identifier,
+            search_center=None, search_diameter=None):
         """Add a ROI to ROIManager
 
         Parameters
@@ -97,6 +121,11 @@ class ROIManager(object):
         identifier: str
             The ROI identifier. If `self.identifier` is not contained
             within `identifier`, a `ROIManagerWarning` will be issued.
+        search_center: tuple of floats or None
+            Center of the object found by the ROI search [px]
+        search_diameter: float or None
+            Equivalent diameter of the object found by the ROI
+            search [px]
         """
         # verify identifier
         if not isinstance(identifier, str):
@@ -108,7 +137,9 @@ class ROIManager(object):
         self.rois.append(ROI(identifier=identifier,
                              image_index=image_index,
                              roi_index=roi_index,
-                             roi_slice=roi_slice))
+                             roi_slice=roi_slice,
+                             search_center=search_center,
+                             search_diameter=search_diameter))
 
     def get_from_image_index(self, image_index):
         rois = [r for r in self.rois if r.image_index == image_index]
@@ -1,4 +1,5 @@
 import numpy as np
+import scipy.fft
 import skimage.filters as skfilters
 from skimage.segmentation import clear_border
 from skimage.morphology import label
@@ -24,23 +25,88 @@ def approx_bg(data, filter_size=None):
 
     Returns
     -------
-    Approximate background of `data`.
+    Approximate background of `data` (computed in single precision
+    if `data` is a float32 array).
     """
     if filter_size is None:
         filter_size = np.sum(data.shape) / 6
+    if data.dtype == np.float32:
+        dtype = np.float32
+    else:
+        dtype = float
 
-    a = np.fft.fft2(data)
+    # (unlike numpy.fft, scipy.fft preserves single precision)
+    a = scipy.fft.fft2(np.asarray(data, dtype=dtype))
     x = np.fft.fftfreq(data.shape[0]).reshape(-1, 1)
     y = np.fft.fftfreq(data.shape[1]).reshape(1, -1)
 
     sigma = 1 / (5 * filter_size)
     gauss = np.exp(-(x**2 + y**2) / (2 * sigma**2))
     gauss /= np.max(gauss)
-    b = a * gauss
-    bg = np.fft.ifft2(b)
+    b = a * gauss.astype(dtype)
+    bg = scipy.fft.ifft2(b)
     return bg.real
 
 
+def fft_size(n, larger=True):
+    """Return an FFT-friendly size (a product of 2, 3, and 5)
+
+    Parameters
+    ----------
+    n: int
+        Minimum (or maximum) size
+    larger: bool
+        If `True`, return the smallest FFT-friendly size that is
+        larger than or equal to `n`, otherwise return the largest
+        FFT-friendly size that is smaller than or equal to `n`.
+
+    Returns
+    -------
+    size: int
+        FFT-friendly size
+    """
+    n = max(1, int(n))
+    step = 1 if larger else -1
+    while True:
+        m = n
+        for p in (2, 3, 5):
+            while m % p == 0:
+                m //= p
+        if m == 1:
+            return n
+        n += step
+
+
+def fft_ladder_size(n):
+    """Return the smallest size of a short FFT-friendly size ladder
+
+    The ladder consists of the sizes 2^k and 3 * 2^k (..., 64, 96,
+    128, 192, 256, ...), i.e. consecutive sizes differ by a factor
+    of at most 1.5. Unlike :func:`fft_size`, which returns nearly
+    distinct sizes for a population of objects of varying size,
+    only a few distinct sizes (and thus FFT plans) are needed.
+
+    Parameters
+    ----------
+    n: int
+        Minimum size
+
+    Returns
+    -------
+    size: int
+        Smallest size in the ladder that is larger than or equal
+        to `n`
+    """
+    n = max(1, int(np.ceil(n)))
+    size = 1
+    while size < n:
+        size *= 2
+    if size >= 4 and 3 * size // 4 >= n:
+        # the intermediate size 3 * 2^k is sufficient
+        size = 3 * size // 4
+    return size
+
+
 def search_objects_base(image, size=110, size_var=.5, max_ecc=.7,
                         dist_border=10, threshold="li", verbose=False):
     """Search objects in images
@@ -145,7 +211,8 @@ def search_objects_base(image, size=110, size_var=.5, max_ecc=.7,
 def search_phase_objects(qpi, size_m, size_var=.5, max_ecc=.7,
                          dist_border=10, pad_border=40,
                          exclude_overlap=30., threshold="li",
-                         verbose=False):
+                         fft_friendly=False, float32=False, verbose=False,
+                         ret_geometry=False):
     """Search phase objects in quantitative phase images
 
     Parameters
@@ -178,12 +245,29 @@ def search_phase_objects(qpi, size_m, size_var=.5, max_ecc=.7,
     threshold: float or str
         Thresholding value or method used;
         see :const:`drymass.threshold.available_thresholds`
+    fft_friendly: bool
+        If `True`, the padded regions are centered at the objects
+        and padded to the next size of a short ladder of FFT-friendly
+        sizes (see :func:`fft_ladder_size`, based on the equivalent
+        diameter of the object) or cropped to an FFT-friendly size
+        (see :func:`fft_size`) if they do not fit into the image,
+        such that the FFTs of the sphere analysis are fast and their
+        plans can be reused for many ROIs.
+    float32: bool
+        Perform the search in single precision
     verbose: bool
         If `True`, print information about ignored regions
+    ret_geometry: bool
+        If `True`, also return the geometry of the detected objects
 
     Returns
     -------
     slices: list of slice
+    geometry: list of dict
+        Dictionaries with the keys "center" (centroid of the
+        object [px]) and "diameter" (diameter of a circle with the
+        same area as the object [px]) for each slice in `slices`;
+        only returned if `ret_geometry` is `True`
 
     Notes
     -----
@@ -211,6 +295,9 @@ def search_phase_objects(qpi, size_m, size_var=.5, max_ecc=.7,
 
     phase = qpi.raw_pha
     bgphase = qpi.bg_pha
+    if float32:
+        phase = phase.astype(np.float32)
+        bgphase = bgphase.astype(np.float32)
 
     # Search for regions
     # First, compute regions with automatic background estimation
@@ -256,11 +343,29 @@ def search_phase_objects(qpi, size_m, size_var=.5, max_ecc=.7,
             regs.remove(dd)
     # Create slices and pad the region sizes
     slices = []
+    geometry = []
     for re in regs:
         x1, y1, x2, y2 = re.bbox
-        x1 = max(0, x1 - pad_border)
-        y1 = max(0, y1 - pad_border)
-        x2 = min(qpi.shape[0], x2 + pad_border)
-        y2 = min(qpi.shape[1], y2 + pad_border)
-        slices.append((slice(x1, x2), slice(y1, y2)))
-    return slices
+        if fft_friendly:
+            # square region centered at the object (few distinct
+            # sizes for objects of varying size)
+            size = fft_ladder_size(re.equivalent_diameter + 2 * pad_border)
+            sl = []
+            for ax in range(2):
+                sax = min(size, fft_size(qpi.shape[ax], larger=False))
+                start = int(round(re.centroid[ax] - sax / 2))
+                start = min(max(0, start), qpi.shape[ax] - sax)
+                sl.append(slice(start, start + sax))
+            slices.append(tuple(sl))
+        else:
+            x1 = max(0, x1 - pad_border)
+            y1 = max(0, y1 - pad_border)
+            x2 = min(qpi.shape[0], x2 + pad_border)
+            y2 = min(qpi.shape[1], y2 + pad_border)
+            slices.append((slice(x1, x2), slice(y1, y2)))
+        geometry.append({"center": tuple(float(c) for c in re.centroid),
+                         "diameter": float(re.equivalent_diameter)})
+    if ret_geometry:
+        return slices, geometry
+    else:
+        return slices
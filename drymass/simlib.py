@@ -0,0 +1,208 @@
+import hashlib
+import os
+import pathlib
+
+import numpy as np
+import qpsphere
+
+from .converter import CACHE_DIR
+from . import util
+
+#: Default directory of the sphere simulation library
+SIM_LIB_DIR = CACHE_DIR / "sphere_sims"
+#: Default radii of the library relative to the initial radius
+SIM_LIB_RADII = np.linspace(.5, 2, 16)
+#: Default refractive index differences (sphere - medium) of the library
+SIM_LIB_DELTA_INDEX = np.linspace(.002, .08, 20)
+#: Minimum goodness of fit (coefficient of determination) of the
+#: closest library profile; ROIs that are not covered by the library
+#: (e.g. objects with negative contrast) fall below this value
+SIM_LIB_MIN_MATCH = .5
+
+
+class SphereSimLibrary(object):
+    def __init__(self, path=SIM_LIB_DIR, radii_rel=SIM_LIB_RADII,
+                 delta_indices=SIM_LIB_DELTA_INDEX):
+        """Precomputed sphere simulations for initial fit parameters
+
+        For each combination of model, wavelength, pixel size, medium
+        index, and initial radius (i.e. for each instrument/specimen
+        profile), the radial phase profiles of spheres on a grid of
+        radii and refractive indices are simulated once and stored
+        on disk. The radial phase profile of an ROI is compared to
+        all profiles of the library to obtain an initial guess for
+        the image fit (see :func:`SphereSimLibrary.initial_guess`).
+
+        Parameters
+        ----------
+        path: str or pathlib.Path
+            Library directory (created if it does not exist)
+        radii_rel: 1d ndarray
+            Radii of the library relative to the initial radius
+        delta_indices: 1d ndarray
+            Refractive index differences between sphere and medium
+        """
+        self.path = pathlib.Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.radii_rel = np.array(radii_rel, dtype=float)
+        self.delta_indices = np.array(delta_indices, dtype=float)
+        # libraries in memory
+        self._libs = {}
+
+    def get_key(self, model, wavelength, pixel_size, medium_index, r0):
+        """Compute the key (SHA-256 hex-hash) of a library"""
+        data = [model, wavelength, pixel_size, medium_index, r0,
+                self.radii_rel, self.delta_indices, qpsphere.__version__]
+        return hashlib.sha256(util.obj2bytes(data)).hexdigest()
+
+    def get_library(self, model, wavelength, pixel_size, medium_index, r0):
+        """Load or compute a library of radial phase profiles
+
+        Parameters
+        ----------
+        model: str
+            Sphere model (see :data:`qpsphere.models.available`)
+        wavelength: float
+            Wavelength [m]
+        pixel_size: float
+            Pixel size [m]
+        medium_index: float
+            Refractive index of the medium
+        r0: float
+            Initial radius [m]
+
+        Returns
+        -------
+        radii: 1d ndarray of length N
+            Radii [m]
+        indices: 1d ndarray of length N
+            Refractive indices
+        profiles: 2d ndarray of shape (N, L)
+            Radial phase profiles [rad] with a bin size of one pixel
+        """
+        key = self.get_key(model, wavelength, pixel_size, medium_index, r0)
+        if key not in self._libs:
+            path = self.path / "{}.npz".format(key)
+            try:
+                with np.load(str(path)) as data:
+                    lib = data["radii"], data["indices"], data["profiles"]
+            except (FileNotFoundError, OSError, KeyError, ValueError):
+                lib = self._compute_library(model, wavelength, pixel_size,
+                                            medium_index, r0)
+                # write to a temporary file first (atomic for parallel runs)
+                path_temp = path.with_name("{}_{}.tmp.npz".format(
+                    path.name, os.getpid()))
+                np.savez(str(path_temp), radii=lib[0], indices=lib[1],
+                         profiles=lib[2])
+                path_temp.replace(path)
+            self._libs[key] = lib
+        return self._libs[key]
+
+    def _compute_library(self, model, wavelength, pixel_size, medium_index,
+                         r0):
+        radii = r0 * self.radii_rel
+        size = int(np.ceil(1.5 * radii.max() / pixel_size))
+        grid_size = (2 * size + 1, 2 * size + 1)
+        rr, nn = np.meshgrid(radii, medium_index + self.delta_indices,
+                             indexing="ij")
+        profiles = np.zeros((rr.size, size + 1))
+        for ii, (radius, index) in enumerate(zip(rr.flat, nn.flat)):
+            qpi = qpsphere.simulate(radius=radius,
+                                    sphere_index=index,
+                                    medium_index=medium_index,
+                                    wavelength=wavelength,
+                                    grid_size=grid_size,
+                                    model=model,
+                                    pixel_size=pixel_size,
+                                    center=(size, size))
+            profiles[ii], _ = radial_profile(qpi.pha, (size, size), size + 1)
+        return rr.flatten(), nn.flatten(), profiles
+
+    def initial_guess(self, qpi, r0, model, center=None,
+                      min_match=SIM_LIB_MIN_MATCH):
+        """Initial sphere parameters from the closest library entry
+
+        Parameters
+        ----------
+        qpi: qpimage.QPImage
+            QPI data of the ROI
+        r0: float
+            Initial radius [m] (defines the library)
+        model: str
+            Sphere model
+        center: tuple of floats or None
+            Center of the sphere [px]; If None, the centroid of
+            the positive phase values is used.
+        min_match: float
+            Minimum coefficient of determination of the closest
+            library profile and the radial phase profile of the ROI
+
+        Returns
+        -------
+        init: dict or None
+            Initial guess with the keys "index", "radius" [m], and
+            "center" [px] (see :func:`drymass.anasphere.fit_sphere`)
+            or None if the ROI does not match the library (e.g. an
+            object with negative contrast or a refractive index
+            outside of the library); The standard initialization
+            should be used in this case.
+        """
+        pha = qpi.pha
+        if center is None:
+            weights = np.clip(pha, 0, None)
+            if weights.sum() == 0:
+                weights = np.ones_like(pha)
+            xx, yy = np.meshgrid(np.arange(pha.shape[0]),
+                                 np.arange(pha.shape[1]),
+                                 indexing="ij")
+            center = (np.sum(xx * weights) / weights.sum(),
+                      np.sum(yy * weights) / weights.sum())
+        radii, indices, profiles = self.get_library(
+            model=model,
+            wavelength=qpi["wavelength"],
+            pixel_size=qpi["pixel size"],
+            medium_index=qpi["medium index"],
+            r0=r0)
+        profile, counts = radial_profile(pha, center, profiles.shape[1])
+        # weighted (by area) sum of squared differences
+        sq_diff = np.sum(counts * (profiles - profile)**2, axis=1)
+        idx = np.argmin(sq_diff)
+        sq_sum = np.sum(counts * profile**2)
+        if sq_sum == 0 or 1 - sq_diff[idx] / sq_sum < min_match:
+            # poor match
+            return None
+        return {"index": indices[idx],
+                "radius": radii[idx],
+                "center": tuple(float(c) for c in center),
+                }
+
+
+def radial_profile(image, center, size):
+    """Compute the radial profile of an image
+
+    Parameters
+    ----------
+    image: 2d ndarray
+        Input image
+    center: tuple of floats
+        Center of the profile [px]
+    size: int
+        Number of radial bins (bin size is one pixel)
+
+    Returns
+    -------
+    profile: 1d ndarray
+        Average image value in each bin (zero for empty bins)
+    counts: 1d ndarray
+        Number of pixels in each bin
+    """
+    xx, yy = np.ogrid[:image.shape[0], :image.shape[1]]
+    dist = np.sqrt((xx - center[0])**2 + (yy - center[1])**2)
+    bins = np.round(dist).astype(int).ravel()
+    valid = bins < size
+    counts = np.bincount(bins[valid], minlength=size)
+    sums = np.bincount(bins[valid], weights=image.ravel()[valid],
+                       minlength=size)
+    profile = np.zeros(size)
+    profile[counts > 0] = sums[counts > 0] / counts[counts > 0]
+    return profile, counts
@@ -2,9 +2,245 @@
 import hashlib
 import pathlib
 
+import h5py
 import numpy as np
 import qpimage
 
+#: Default HDF5 compression of image data (same as in qpimage)
+H5_COMPRESSION = {"compression": "gzip",
+                  "compression_opts": 9,
+                  }
+
+
+def add_qpimage(qps, qpi, index, identifier=None, chunks=None,
+                bg_from_idx=None, phase_only=False, compression=None):
+    """Add a QPImage to a QPSeries with a user-defined chunk layout
+
+    This is equivalent to :func:`qpimage.QPSeries.add_qpimage`, except
+    that the HDF5 chunk shape of the image data can be set and that the
+    uniqueness of `identifier` is not checked (which scales with the
+    length of the series).
+
+    Parameters
+    ----------
+    qps: qpimage.QPSeries
+        The series (opened in write mode)
+    qpi: qpimage.QPImage
+        The QPImage to add
+    index: int
+        The index of `qpi` in `qps`; must be equal to the current
+        length of `qps`.
+    identifier: str
+        Identifier key for `qpi`; defaults to the identifier of `qpi`
+    chunks: tuple of int or None
+        HDF5 chunk shape of the image data; defaults to the image
+        shape (which is favorable when the image is always read in
+        its entirety).
+    bg_from_idx: int or None
+        Use the background data ("data" key) from the QPImage
+        stored at this index by creating hard links within the
+        HDF5 file.
+    phase_only: bool
+        Do not store the amplitude data of `qpi` (see
+        :func:`write_amplitude_placeholder`)
+    compression: dict or None
+        HDF5 compression of the image data (see
+        :func:`write_image_dataset`)
+    """
+    group = qps.h5.create_group("qpi_{}".format(index))
+    if phase_only:
+        copyh5(qpi.h5, group, chunks=chunks, exclude=["amplitude"],
+               compression=compression)
+        write_amplitude_placeholder(group, shape=qpi.shape)
+    else:
+        copyh5(qpi.h5, group, chunks=chunks, compression=compression)
+    if bg_from_idx is not None:
+        ref = qps.h5["qpi_{}".format(bg_from_idx)]
+        for which in ["amplitude", "phase"]:
+            bgkey = "{}/bg_data/data".format(which)
+            if bgkey in group:
+                del group[bgkey]
+            if bgkey in ref:
+                group[bgkey] = ref[bgkey]
+    if identifier is None and "identifier" in qpi:
+        identifier = qpi["identifier"]
+    if identifier:
+        group.attrs["identifier"] = identifier
+
+
+def copyh5(inh5, outh5, chunks=None, exclude=[], compression=None):
+    """Recursively copy HDF5 data of a QPImage from one group to another
+
+    This is equivalent to :func:`qpimage.core.copyh5`, except that
+    the chunk shape of two-dimensional datasets can be set.
+
+    Parameters
+    ----------
+    inh5: h5py.Group
+        The input HDF5 data
+    outh5: h5py.Group
+        The output HDF5 group
+    chunks: tuple of int or None
+        HDF5 chunk shape of two-dimensional datasets; If the chunk
+        shape exceeds the dataset shape, it is cropped. If set to
+        `None`, the dataset shape is used.
+    exclude: list of str
+        Keys of `inh5` that are not copied
+    compression: dict or None
+        HDF5 compression of two-dimensional datasets (see
+        :func:`write_image_dataset`)
+    """
+    for key in inh5:
+        if key in exclude:
+            continue
+        if key in outh5:
+            del outh5[key]
+        if isinstance(inh5[key], h5py.Group):
+            copyh5(inh5[key], outh5.create_group(key), chunks=chunks,
+                   compression=compression)
+        else:
+            data = inh5[key][()]
+            if data.ndim == 2:
+                dset = write_image_dataset(outh5, key, data, chunks=chunks,
+                                           compression=compression)
+            else:
+                dset = outh5.create_dataset(key, data=data)
+            dset.attrs.update(inh5[key].attrs)
+    outh5.attrs.update(inh5.attrs)
+
+
+def write_amplitude_placeholder(group, shape):
+    """Write an amplitude of one without storing any image data
+
+    The "amplitude" group of a QPImage is created with a "raw"
+    dataset that is not allocated in the HDF5 file (it consists
+    of its fill value one) and without background data. Such
+    QPImages are read by :mod:`qpimage` as if they had been
+    created from phase data only.
+
+    Parameters
+    ----------
+    group: h5py.Group
+        HDF5 group of a QPImage
+    shape: tuple of int
+        Image shape
+    """
+    grp_amp = group.create_group("amplitude")
+    grp_amp.create_dataset("raw", shape=shape, dtype=np.float32,
+                           fillvalue=1)
+    grp_amp.create_group("bg_data")
+
+
+def get_h5_compression(method="gzip", level=9, shuffle=False):
+    """Return the HDF5 compression keyword arguments for image data
+
+    Parameters
+    ----------
+    method: str or None
+        Compression filter; One of "gzip" (slow, small files),
+        "lzf" (fast, larger files), or "off" (no compression,
+        also `None`)
+    level: int
+        Compression level of the "gzip" filter (0-9)
+    shuffle: bool
+        Apply the HDF5 shuffle filter before compression (groups
+        the bytes of the floating point values by significance,
+        which usually results in smaller files)
+
+    Returns
+    -------
+    compression: dict
+        Keyword arguments for :func:`h5py.Group.create_dataset`
+        (see :func:`write_image_dataset`)
+    """
+    if method in [None, "off"]:
+        compression = {}
+    elif method == "gzip":
+        if level not in range(10):
+            raise ValueError("The gzip compression level must be in "
+                             + "[0, 9], got '{}'!".format(level))
+        compression = {"compression": "gzip",
+                       "compression_opts": level}
+    elif method == "lzf":
+        compression = {"compression": "lzf"}
+    else:
+        raise ValueError("Unknown HDF5 compression: '{}'!".format(method))
+    if shuffle and compression:
+        compression["shuffle"] = True
+    return compression
+
+
+def write_image_dataset(group, key, data, chunks=None, compression=None):
+    """Write an image to an HDF5 group as a dataset
+
+    This is equivalent to :func:`qpimage.image_data.write_image_dataset`
+    (the data type of `data` is used), except that the chunk shape
+    can be set.
+
+    Parameters
+    ----------
+    group: h5py.Group
+        HDF5 group to store data to
+    key: str
+        Dataset identifier
+    data: np.ndarray of shape (M,N)
+        Image data to store
+    chunks: tuple of int or None
+        HDF5 chunk shape; If the chunk shape exceeds the image
+        shape, it is cropped. If set to `None`, the image shape
+        is used.
+    compression: dict or None
+        HDF5 compression keyword arguments (see
+        :func:`get_h5_compression`); defaults to `H5_COMPRESSION`
+
+    Returns
+    -------
+    dataset: h5py.Dataset
+        The created HDF5 dataset object
+    """
+    if chunks is None:
+        chunks = data.shape
+    else:
+        chunks = tuple(min(c, s) for c, s in zip(chunks, data.shape))
+    if compression is None:
+        compression = H5_COMPRESSION
+    dset = group.create_dataset(key,
+                                data=data,
+                                chunks=chunks,
+                                fletcher32=True,
+                                **compression)
+    # for image visualization (see qpimage.image_data)
+    dset.attrs.create('CLASS', np.string_('IMAGE'))
+    dset.attrs.create('IMAGE_VERSION', np.string_('1.2'))
+    dset.attrs.create('IMAGE_SUBCLASS', np.string_('IMAGE_GRAYSCALE'))
+    return dset
+
+
+def get_identifier_index(qps):
+    """Return the indices of all QPImages in a QPSeries by identifier
+
+    Only the HDF5 attributes are read; In contrast, ``identifier in
+    qps`` and ``qps[identifier]`` load the QPImages one by one.
+
+    Parameters
+    ----------
+    qps: qpimage.QPSeries
+        The series
+
+    Returns
+    -------
+    index: dict
+        Dictionary with the QPImage identifiers as keys and their
+        indices in `qps` as values
+    """
+    index = {}
+    for key in qps.h5:
+        if key.startswith("qpi_"):
+            identifier = qps.h5[key].attrs.get("identifier")
+            if identifier is not None:
+                index[identifier] = int(key[4:])
+    return index
+
 
 def hash_file(path, blocksize=65536):
     """Compute sha256 hex-hash of a file
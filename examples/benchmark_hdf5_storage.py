@@ -0,0 +1,110 @@
+"""Benchmark of HDF5 compression filters and chunk layouts
+
+DryMass stores all phase and amplitude images in HDF5 files. The
+compression filter and the chunk shape are configurable in the
+"output" section of the configuration file ("hdf5 compression",
+"hdf5 compression level", "hdf5 shuffle", and "hdf5 sensor chunk
+px"). This script writes a synthetic series of sensor images with
+:func:`drymass.util.write_image_dataset` for each combination and
+prints the write throughput, the read throughput for per-frame
+access (whole images) and per-ROI access (small subregions), and
+the resulting file size.
+
+Noisy float32 images do not compress well. The byte shuffle filter
+improves the compression ratio and gzip with a low level is faster
+than gzip with the maximum level (the default) at a similar file
+size; lzf and uncompressed storage are the fastest. Per-frame
+chunks are well suited for reading whole images, while smaller
+chunks are considerably faster for reading subregions (ROIs).
+"""
+import pathlib
+import tempfile
+import time
+
+import h5py
+import numpy as np
+
+from drymass import util
+
+#: number of images
+NUM = 20
+#: image shape
+SHAPE = (512, 512)
+#: size of the subregions for per-ROI access
+ROI_SIZE = 64
+
+COMPRESSION = [
+    ("off", {"method": "off"}),
+    ("lzf", {"method": "lzf"}),
+    ("lzf+shuffle", {"method": "lzf", "shuffle": True}),
+    ("gzip 1", {"method": "gzip", "level": 1}),
+    ("gzip 4+shuffle", {"method": "gzip", "level": 4, "shuffle": True}),
+    ("gzip 9", {"method": "gzip", "level": 9}),
+]
+
+CHUNKS = [
+    ("frame", None),
+    ("128px", (128, 128)),
+]
+
+
+def synthetic_images(num=NUM, shape=SHAPE):
+    """Noisy float32 phase images with a few circular objects"""
+    rs = np.random.RandomState(42)
+    xx, yy = np.mgrid[:shape[0], :shape[1]]
+    images = []
+    for _ in range(num):
+        pha = np.zeros(shape, dtype=np.float32)
+        for _ in range(5):
+            cx, cy = rs.uniform(50, shape[0] - 50, size=2)
+            rr2 = (xx - cx)**2 + (yy - cy)**2
+            pha += 2 * np.sqrt(np.clip(1 - rr2 / 30**2, 0, None))
+        pha += rs.normal(scale=.05, size=shape).astype(np.float32)
+        images.append(pha)
+    return images
+
+
+def benchmark(path, images, chunks, compression):
+    t0 = time.perf_counter()
+    with h5py.File(str(path), "w") as h5:
+        for ii, img in enumerate(images):
+            util.write_image_dataset(group=h5,
+                                     key=str(ii),
+                                     data=img,
+                                     chunks=chunks,
+                                     compression=compression)
+    t_write = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    with h5py.File(str(path), "r") as h5:
+        for ii in range(len(images)):
+            h5[str(ii)][:]
+    t_frame = time.perf_counter() - t0
+
+    rs = np.random.RandomState(0)
+    t0 = time.perf_counter()
+    with h5py.File(str(path), "r") as h5:
+        for ii in range(len(images)):
+            for _ in range(10):
+                x, y = rs.randint(0, SHAPE[0] - ROI_SIZE, size=2)
+                h5[str(ii)][x:x+ROI_SIZE, y:y+ROI_SIZE]
+    t_roi = time.perf_counter() - t0
+    return t_write, t_frame, t_roi, path.stat().st_size
+
+
+if __name__ == "__main__":
+    images = synthetic_images()
+    mb = sum(img.nbytes for img in images) / 1024**2
+    path = pathlib.Path(tempfile.mkdtemp(prefix="drymass_bench_")) / "b.h5"
+    print("{} images of shape {} ({:.1f} MB)".format(NUM, SHAPE, mb))
+    print("{:<16}{:<8}{:>12}{:>12}{:>12}{:>10}".format(
+        "compression", "chunks", "write MB/s", "frame MB/s", "ROIs/s",
+        "size MB"))
+    for cname, ckw in COMPRESSION:
+        compression = util.get_h5_compression(**ckw)
+        for chname, chunks in CHUNKS:
+            t_write, t_frame, t_roi, size = benchmark(path, images, chunks,
+                                                      compression)
+            print("{:<16}{:<8}{:>12.1f}{:>12.1f}{:>12.0f}{:>10.2f}".format(
+                cname, chname, mb / t_write, mb / t_frame,
+                10 * NUM / t_roi, size / 1024**2))
@@ -3,7 +3,9 @@
 This examples illustrates the usage of the "radial inclusion factor"
 which is defined in the configuration section "sphere" and used in
 :py:func:`drymass.anasphere.relative_dry_mass` with the
-keyword argument `rad_fact`.
+keyword argument `rad_fact`. The dry mass is computed for all
+inclusion factors at once with
+:py:func:`drymass.anasphere.dry_mass_sphere`.
 
 The phase image is computed from two spheres whose dry masses
 add up to 100pg with the larger sphere having a dry mass of 83pg.
@@ -16,7 +18,7 @@ this inclusion factor must be increased or decreased depending on
 whether additional information (the smaller sphere) should be included
 in the dry mass computation or not.
 """
-from drymass.anasphere import relative_dry_mass
+from drymass.anasphere import dry_mass_sphere
 import matplotlib
 import matplotlib.pylab as plt
 import numpy as np
@@ -63,16 +65,13 @@ qpi_sum = qpimage.QPImage(data=phase_data,
                                      "medium index": medium_index})
 
 # compute dry mass in dependence of radius
-mass_evolution = []
-mass_radii = []
-for rad_fact in np.linspace(0, 2.0, 100):
-    dm = relative_dry_mass(qpi=qpi_sum,
-                           radius=radii[0] * 1e-6,
-                           center=centers[0],
-                           alpha=alpha,
-                           rad_fact=rad_fact)
-    mass_evolution.append(dm * 1e12)
-    mass_radii.append(rad_fact)
+mass_radii = np.linspace(0, 2.0, 100)
+dm_rel, _ = dry_mass_sphere(qpi=qpi_sum,
+                            radius=radii[0] * 1e-6,
+                            center=centers[0],
+                            alpha=alpha,
+                            rad_fact=mass_radii)
+mass_evolution = dm_rel * 1e12
 
 # plot results
 fig = plt.figure(figsize=(8, 3.8))
@@ -2,10 +2,15 @@ import pathlib
 import tempfile
 
 import numpy as np
+import pytest
 import qpimage
+import tifffile
 
+import drymass.anasphere
 from drymass.cli import cli_analyze_sphere, config, dialog
-from drymass.anasphere import FILE_SPHERE_DATA, FILE_SPHERE_STAT
+from drymass.cli.analyzing import FILE_SPHERE_ANALYSIS_IMAGE
+from drymass.anasphere import FILE_SPHERE_DATA, FILE_SPHERE_FAILURES, \
+    FILE_SPHERE_STAT, load_statistics
 
 
 def setup_test_data(radius_px=30, size=200, pxsize=1e-6, medium_index=1.335,
@@ -61,6 +66,94 @@ def test_base():
     assert len(pathsl.read_bytes()) > 100
 
 
+def test_multi_model():
+    _, path_in, path_out = setup_test_data(num=2)
+    cfg = config.ConfigFile(path_out)
+    cfg.set_value(section="sphere", key="method", value="edge, image")
+    cfg.set_value(section="sphere", key="model", value="projection")
+    cfg.set_value(section="sphere", key="image iter", value=3)
+    assert cfg["sphere"]["method"] == ["edge", "image"]
+    h5data = cli_analyze_sphere(path=path_in, ret_data=True)
+    assert len(h5data) == 2
+    for method in ["edge", "image"]:
+        for name in [FILE_SPHERE_DATA, FILE_SPHERE_STAT,
+                     FILE_SPHERE_ANALYSIS_IMAGE]:
+            assert (path_out / name.format(method, "projection")).exists()
+
+
+def test_quality_gate():
+    _, path_in, path_out = setup_test_data(num=2)
+    cfg = config.ConfigFile(path_out)
+    cfg.set_value(section="sphere", key="quality min contrast rad",
+                  value=2)
+    assert cfg["sphere"]["quality min symmetry"] is None
+    cli_analyze_sphere(path=path_in)
+    stat = load_statistics(path_out)
+    assert np.all(stat["status"] == "rejected-contrast")
+
+
+def test_h5_compression():
+    _, path_in, path_out = setup_test_data(num=2)
+    cfg = config.ConfigFile(path_out)
+    cfg.set_value(section="output", key="hdf5 compression", value="lzf")
+    cfg.set_value(section="output", key="hdf5 shuffle", value=True)
+    cfg.set_value(section="output", key="hdf5 sensor chunk px", value=0)
+    h5data = cli_analyze_sphere(path=path_in, ret_data=True)
+    for name in ["sensor_data.h5", "roi_data.h5", h5data.name]:
+        with qpimage.QPSeries(h5file=path_out / name, h5mode="r") as qps:
+            raw = qps.h5["qpi_1/phase/raw"]
+            assert raw.compression == "lzf"
+            assert raw.shuffle
+            assert raw.chunks == raw.shape
+
+
+def test_isolate_failures(monkeypatch):
+    _, path_in, path_out = setup_test_data(num=2)
+    cfg = config.ConfigFile(path_out)
+    cfg.set_value(section="sphere", key="isolate failures", value=True)
+
+    def fit_sphere_failing(*args, **kwargs):
+        raise ValueError("Bad ROI")
+
+    monkeypatch.setattr(drymass.anasphere, "fit_sphere", fit_sphere_failing)
+    failed = cli_analyze_sphere(path=path_in, ret_failed=True)
+    assert len(failed) == 2
+    stat = load_statistics(path_out)
+    assert np.all(stat["status"] == "failed-ValueError")
+    failout = path_out / FILE_SPHERE_FAILURES.format("edge", "projection")
+    assert failout.exists()
+
+
+@pytest.mark.filterwarnings("error::drymass.roi.ROIManagerWarning")
+def test_phase_only():
+    _, path_in, path_out = setup_test_data(num=2)
+    cfg = config.ConfigFile(path_out)
+    cfg.set_value(section="output", key="phase only", value=True)
+    h5data = cli_analyze_sphere(path=path_in, ret_data=True)
+    stat = load_statistics(path_out)
+    assert np.all(stat["status"] == "ok")
+    for name in ["sensor_data.h5", "roi_data.h5", h5data.name]:
+        with qpimage.QPSeries(h5file=path_out / name, h5mode="r") as qps:
+            assert len(qps) == 2
+            raw = qps.h5["qpi_1/amplitude/raw"]
+            assert raw.id.get_storage_size() == 0
+
+
+def test_sphere_params_only():
+    _, path_in, path_out = setup_test_data(num=2)
+    cfg = config.ConfigFile(path_out)
+    cfg.set_value(section="output", key="sphere sim data", value=False)
+    h5data = cli_analyze_sphere(path=path_in, ret_data=True)
+
+    with qpimage.QPSeries(h5file=h5data, h5mode="r") as qps:
+        assert len(qps) == 0
+    # sphere images are plotted from the fit parameters
+    tifout = path_out / FILE_SPHERE_ANALYSIS_IMAGE.format("edge",
+                                                          "projection")
+    with tifffile.TiffFile(str(tifout)) as tf:
+        assert len(tf.pages) == 2
+
+
 if __name__ == "__main__":
     # Run all tests
     loc = locals()
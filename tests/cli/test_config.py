@@ -1,3 +1,4 @@
+import os
 import tempfile
 
 import numpy as np
@@ -11,6 +12,62 @@ def test_basic():
     assert isinstance(cfg["bg"], dict)
 
 
+def test_batch_write():
+    path = tempfile.mkdtemp(prefix="drymass_test_config_")
+    cfg = config.ConfigFile(path=path)
+    cfg["bg"]
+    content = cfg.path.read_text()
+    with cfg:
+        cfg.set_value("bg", "phase profile", "offset")
+        cfg.set_value("bg", "amplitude profile", "offset")
+        # not written yet
+        assert cfg.path.read_text() == content
+        assert cfg["bg"]["phase profile"] == "offset"
+    cfg2 = config.ConfigFile(path=path)
+    assert cfg2["bg"]["phase profile"] == "offset"
+    assert cfg2["bg"]["amplitude profile"] == "offset"
+    # changes are discarded on error
+    try:
+        with cfg:
+            cfg.set_value("bg", "phase profile", "tilt")
+            raise ValueError("abort")
+    except ValueError:
+        pass
+    assert cfg2["bg"]["phase profile"] == "offset"
+
+
+def test_cache(monkeypatch):
+    path = tempfile.mkdtemp(prefix="drymass_test_config_")
+    cfg = config.ConfigFile(path=path)
+    cfg.set_value("sphere", "refraction increment", 0.19)
+    # old modification time (content is not compared)
+    os.utime(cfg.path, (1, 1))
+    assert cfg["sphere"]["refraction increment"] == 0.19
+
+    ncheck = []
+    check_value = config.ConfigFile._check_value
+
+    def _check_value(self, *args):
+        ncheck.append(args)
+        return check_value(self, *args)
+
+    monkeypatch.setattr(config.ConfigFile, "_check_value", _check_value)
+    for _ in range(3):
+        sec = config.ConfigFile(path=path)["sphere"]
+        assert sec["refraction increment"] == 0.19
+        # the returned dictionary is a copy
+        sec["refraction increment"] = 1
+    assert len(ncheck) == 0
+    # external modification
+    text = cfg.path.read_text()
+    cfg.path.write_text(text.replace("= 0.19", "= 0.21"))
+    assert cfg["sphere"]["refraction increment"] == 0.21
+    assert len(ncheck) > 0
+    # external modification with the same size shortly after reading
+    cfg.path.write_text(text.replace("= 0.19", "= 0.22"))
+    assert cfg["sphere"]["refraction increment"] == 0.22
+
+
 def test_compat_013():
     path = tempfile.mkdtemp(prefix="drymass_test_config_")
     cfg = config.ConfigFile(path=path)
@@ -122,6 +122,14 @@ def test_lcstr():
     assert parse_funcs.lcstr("ASD") == "asd"
 
 
+def test_lcstr_or_list():
+    assert parse_funcs.lcstr_or_list("Image") == "image"
+    assert parse_funcs.lcstr_or_list("edge, Image") == ["edge", "image"]
+    assert parse_funcs.lcstr_or_list("[image,image, ]") == ["image", "image"]
+    assert parse_funcs.lcstr_or_list(["Rytov", "rytov-sc"]) == ["rytov",
+                                                                "rytov-sc"]
+
+
 def test_strlist_vsort():
     assert parse_funcs.strlist_vsort("1.1, 2.1, 3") == ["1.1", "2.1", "3"]
     assert parse_funcs.strlist_vsort("1.10, 1.9") == ["1.9", "1.10"]
@@ -3,8 +3,11 @@ import tempfile
 
 import numpy as np
 import qpimage
+import pytest
 
-from drymass.cli import config, dialog
+from drymass.anasphere import load_statistics
+from drymass.cli import cli_analyze_sphere, config, dialog, scheduler
+import drymass.cli.analyzing
 
 
 def setup_test_data(radius_px=30, size=200, pxsize=1e-6, medium_index=1.335,
@@ -112,6 +115,111 @@ def test_complex_folder_with_unused_qpseries():
     assert path0.samefile(ps[3])
 
 
+def test_recursive_isolate_failures(monkeypatch, capsys):
+    path = setup_test_data_recursive(n=2, num=2)
+    for ii in range(2):
+        cfg = config.ConfigFile(path / "sub_{}.h5_dm".format(ii))
+        cfg.set_value(section="specimen", key="size um", value=60)
+    cli_extract_roi = drymass.cli.analyzing.cli_extract_roi
+
+    def cli_extract_roi_failing(path, **kwargs):
+        if path.name == "sub_0.h5":
+            raise ValueError("Bad dataset")
+        return cli_extract_roi(path=path, **kwargs)
+
+    monkeypatch.setattr(drymass.cli.analyzing, "cli_extract_roi",
+                        cli_extract_roi_failing)
+    monkeypatch.setattr("sys.argv", ["dm_analyze_sphere", "-r", str(path)])
+    dialog.parse.cache_clear()
+    with pytest.raises(ValueError, match="Bad dataset"):
+        cli_analyze_sphere()
+    for ii in range(2):
+        cfg = config.ConfigFile(path / "sub_{}.h5_dm".format(ii))
+        cfg.set_value(section="sphere", key="isolate failures", value=True)
+    cli_analyze_sphere()
+    # the second dataset is analyzed nevertheless
+    stat = load_statistics(path / "sub_1.h5_dm")
+    assert np.all(stat["status"] == "ok")
+    out = capsys.readouterr().out
+    assert "ValueError: Bad dataset" in out
+    assert "sub_0.h5: analysis failed" in out
+
+
+def test_recursive_search_index(monkeypatch):
+    monkeypatch.setattr(dialog, "SCAN_INDEX_DIR",
+                        pathlib.Path(tempfile.mkdtemp(prefix="drymass_idx_")))
+    path = setup_test_data_recursive(n=2, num=3)
+    # results directories are not searched
+    setup_test_data(path_in=path / "sub_0.h5_dm" / "other.h5")
+    (path / "notes.txt").write_text("This file is not probed.")
+    probed = []
+    probe_file = dialog._probe_file
+
+    def _probe_file(path):
+        probed.append(pathlib.Path(path).name)
+        return probe_file(path)
+
+    monkeypatch.setattr(dialog, "_probe_file", _probe_file)
+    ps = dialog.recursive_search(path)
+    assert [pp.name for pp in ps] == ["sub_0.h5", "sub_1.h5"]
+    assert sorted(probed) == ["notes.txt", "sub_0.h5", "sub_1.h5"]
+    # unchanged files are not probed again
+    probed.clear()
+    ps = dialog.recursive_search(path)
+    assert [pp.name for pp in ps] == ["sub_0.h5", "sub_1.h5"]
+    assert probed == []
+    # modified file
+    (path / "sub_1.h5").write_text("Not a dataset anymore.")
+    ps = dialog.recursive_search(path)
+    assert [pp.name for pp in ps] == ["sub_0.h5"]
+    assert probed == ["sub_1.h5"]
+
+
+def test_recursive_jobs(monkeypatch, capsys):
+    path = setup_test_data_recursive(n=3, num=2)
+    for ii in range(3):
+        cfg = config.ConfigFile(path / "sub_{}.h5_dm".format(ii))
+        cfg.set_value(section="specimen", key="size um", value=60)
+    monkeypatch.setattr("sys.argv",
+                        ["dm_analyze_sphere", "-r", "-j", "2", str(path)])
+    dialog.parse.cache_clear()
+    cli_analyze_sphere()
+    for ii in range(3):
+        stat = load_statistics(path / "sub_{}.h5_dm".format(ii))
+        assert len(stat) == 2
+        assert np.all(stat["status"] == "ok")
+    out = capsys.readouterr().out
+    assert "Analyzing 3 datasets with 2 worker processes." in out
+    assert "Completed dataset 3/3 (100.0% of data)" in out
+    # the console output of the workers is printed
+    assert out.count("Performing sphere analysis... Done") == 3
+
+
+def _process_dataset(path, fail=False):
+    if fail and path.name == "sub_0.h5":
+        raise ValueError("Bad dataset")
+    return path.name
+
+
+def test_scheduler_errors():
+    path = setup_test_data_recursive(n=3, num=1)
+    paths = sorted(path.glob("*.h5"))
+    # largest dataset first
+    (path / "sub_2.h5").write_bytes(b"0" * 10**6)
+    assert scheduler.dataset_size(path / "sub_2.h5") == 10**6
+    results = {}
+    for pi, future in scheduler.process_datasets(_process_dataset, paths,
+                                                 jobs=2, fail=True):
+        if pi.name == "sub_0.h5":
+            exc = future.exception()
+            assert isinstance(exc, ValueError)
+            assert isinstance(exc.__cause__, scheduler.RemoteTraceback)
+            assert "_process_dataset" in str(exc.__cause__)
+        else:
+            results[pi.name] = future.result()
+    assert results == {"sub_1.h5": "sub_1.h5", "sub_2.h5": "sub_2.h5"}
+
+
 def test_recursive_root_include1():
     qpi, path_in, path_out = setup_test_data(num=2)
     ps = dialog.recursive_search(path_in)
@@ -1,7 +1,10 @@
+import pathlib
 import shutil
 import tempfile
 import time
 
+import pytest
+
 TMPDIR = tempfile.mkdtemp(prefix=time.strftime(
     "drymass_test_%H.%M_"))
 
@@ -20,3 +23,12 @@ def pytest_unconfigure(config):
     called before test process is exited.
     """
     shutil.rmtree(TMPDIR, ignore_errors=True)
+
+
+@pytest.fixture(autouse=True)
+def cache_dirs(monkeypatch):
+    """Keep persistent caches out of the user's cache directory"""
+    monkeypatch.setattr("drymass.cli.analyzing.FIT_CACHE_DIR",
+                        pathlib.Path(TMPDIR) / "sphere_fits")
+    monkeypatch.setattr("drymass.cli.dialog.SCAN_INDEX_DIR",
+                        pathlib.Path(TMPDIR) / "scan_index")
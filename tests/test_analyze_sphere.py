@@ -46,6 +46,504 @@ def test_basic():
         assert qpso[0]["identifier"].count("projection")
 
 
+def test_bin_qpi():
+    qpi, _path, _dout = setup_test_data(size=101)
+    qpi_bin = drymass.anasphere.bin_qpi(qpi, 2)
+    assert qpi_bin.shape == (50, 50)
+    assert qpi_bin["pixel size"] == 2 * qpi["pixel size"]
+    assert np.allclose(qpi_bin.pha[10, 20], qpi.pha[20:22, 40:42].mean())
+    assert np.allclose(qpi_bin.amp, 1)
+
+
+def test_coarse_to_fine():
+    qpi = qpsphere.simulate(radius=8e-6,
+                            sphere_index=1.36,
+                            medium_index=1.335,
+                            wavelength=550e-9,
+                            grid_size=(100, 100),
+                            model="projection",
+                            pixel_size=.4e-6,
+                            center=(48.3, 51.2))
+    imagekw = {"stop_dn": 5e-4, "stop_dr": 1e-3, "stop_dc": 1}
+    n, r, c, _ = drymass.anasphere.fit_sphere(
+        qpi, r0=7e-6, method="image", model="projection", imagekw=imagekw)
+    n2, r2, c2, qpi_sim = drymass.anasphere.fit_sphere(
+        qpi, r0=7e-6, method="image", model="projection", imagekw=imagekw,
+        coarse_levels=2)
+    assert qpi_sim.shape == qpi.shape
+    assert qpi_sim["pixel size"] == qpi["pixel size"]
+    assert np.abs(n - n2) < imagekw["stop_dn"]
+    assert np.abs(r - r2) / r < imagekw["stop_dr"]
+    assert np.all(np.abs(np.array(c) - c2) <= imagekw["stop_dc"])
+    assert np.abs(n2 - 1.36) < 1e-3
+
+
+def test_edge_fit_from_roi_extraction():
+    radius = 30
+    pxsize = 1e-6
+    _qpi, path, dout = setup_test_data_roi(radius=radius, pxsize=pxsize)
+    path_rois = drymass.extract_roi(path,
+                                    dir_out=dout,
+                                    size_m=2*radius*pxsize,
+                                    bg_pha_mask_radial_clearance=1.1)
+    with qpimage.QPSeries(h5file=path_rois, h5mode="r") as qps:
+        roi_meta = drymass.extractroi.get_roi_meta(qps)
+        qpi_roi = qps[0]
+        assert list(roi_meta.keys()) == [qpi_roi["identifier"]]
+        meta = roi_meta[qpi_roi["identifier"]]
+        assert np.allclose(meta["edge radius"], radius*pxsize, rtol=.02)
+        # this is what would be computed without the stored edge fit
+        n, r, c = qpsphere.edgefit.analyze(qpi=qpi_roi,
+                                           r0=radius*pxsize,
+                                           ret_center=True)
+    h5sim = drymass.analyze_sphere(path_rois, dir_out=dout,
+                                   r0=radius*pxsize)
+    with qpimage.QPSeries(h5file=h5sim, h5mode="r") as qps_sim:
+        assert np.allclose(qps_sim[0]["sim index"], n, atol=1e-6, rtol=0)
+        assert np.allclose(qps_sim[0]["sim radius"], r, atol=0, rtol=1e-3)
+        assert np.allclose(qps_sim[0]["sim center"], c, atol=.1, rtol=0)
+
+
+def test_resume_interrupted(monkeypatch):
+    _qpi, path, dout = setup_test_data(num=4)
+    fit_sphere = drymass.anasphere.fit_sphere
+    calls = []
+
+    def fit_sphere_interrupted(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 3:
+            raise KeyboardInterrupt
+        # (only image fits are journaled; use the faster edge fit)
+        kwargs["method"] = "edge"
+        return fit_sphere(*args, **kwargs)
+
+    monkeypatch.setattr(drymass.anasphere, "fit_sphere",
+                        fit_sphere_interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        drymass.analyze_sphere(path, dir_out=dout, method="image")
+    dout = pathlib.Path(dout)
+    journal = dout / drymass.anasphere.DIR_SPHERE_JOURNAL.format(
+        "image", "projection")
+    assert len(list(journal.glob("*/*.h5"))) == 2
+    h5sim = dout / drymass.anasphere.FILE_SPHERE_DATA.format(
+        "image", "projection")
+    assert not h5sim.exists()
+    # resume
+    calls.clear()
+    h5sim2, reused = drymass.analyze_sphere(path, dir_out=dout,
+                                            method="image",
+                                            ret_reused=True)
+    assert h5sim2 == h5sim
+    assert len(calls) == 2
+    assert reused == 2
+    assert not journal.exists()
+    with qpimage.QPSeries(h5file=h5sim, h5mode="r") as qps:
+        assert len(qps) == 4
+        assert qps[0]["identifier"] == "test_0:projection"
+        assert np.allclose(qps[0].pha, qps[3].pha)
+    stat = drymass.anasphere.load_statistics(dout)
+    assert np.all(stat["status"] == "ok")
+    # interrupted run with other parameters keeps the previous results
+    calls.clear()
+    with pytest.raises(KeyboardInterrupt):
+        drymass.analyze_sphere(path, dir_out=dout, method="image",
+                               r0=11e-6)
+    with qpimage.QPSeries(h5file=h5sim, h5mode="r") as qps:
+        assert len(qps) == 4
+
+
+def test_resume_no_journal_edge(monkeypatch):
+    _qpi, path, dout = setup_test_data(num=4)
+    fit_sphere = drymass.anasphere.fit_sphere
+    calls = []
+
+    def fit_sphere_interrupted(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 3 and interrupt:
+            raise KeyboardInterrupt
+        return fit_sphere(*args, **kwargs)
+
+    monkeypatch.setattr(drymass.anasphere, "fit_sphere",
+                        fit_sphere_interrupted)
+    interrupt = True
+    with pytest.raises(KeyboardInterrupt):
+        drymass.analyze_sphere(path, dir_out=dout)
+    # edge fits are cheap and not journaled
+    dout = pathlib.Path(dout)
+    journal = dout / drymass.anasphere.DIR_SPHERE_JOURNAL.format(
+        "edge", "projection")
+    assert not journal.exists()
+    calls.clear()
+    interrupt = False
+    _h5sim, reused = drymass.analyze_sphere(path, dir_out=dout,
+                                            ret_reused=True)
+    assert len(calls) == 4
+    assert reused == 0
+
+
+def test_phase_only():
+    _qpi, path, dout = setup_test_data(num=2)
+    dout2 = tempfile.mkdtemp(prefix="drymass_test_sphere_")
+    h5sim = drymass.analyze_sphere(path, dir_out=dout)
+    h5sim2 = drymass.analyze_sphere(path, dir_out=dout2, phase_only=True)
+    with qpimage.QPSeries(h5file=h5sim, h5mode="r") as qps, \
+            qpimage.QPSeries(h5file=h5sim2, h5mode="r") as qps2:
+        assert len(qps2) == 2
+        for ii in range(2):
+            raw = qps2.h5["qpi_{}/amplitude/raw".format(ii)]
+            assert raw.id.get_storage_size() == 0
+            assert np.all(qps2[ii].pha == qps[ii].pha)
+            assert qps2[ii]["sim radius"] == qps[ii]["sim radius"]
+    # phase-only simulations are not reused for regular analyses
+    _p, reused = drymass.analyze_sphere(path, dir_out=dout2,
+                                        ret_reused=True)
+    assert reused == 0
+
+
+def test_float32():
+    """Single-precision processing must not alter the results"""
+    x = np.arange(200).reshape(-1, 1)
+    y = np.arange(200).reshape(1, -1)
+    bg = .3 + x * .002 - y * .001
+    stats = []
+    for float32 in [False, True]:
+        _qpi, path, dout = setup_test_data_roi(num=2, bg=bg,
+                                               identifier="tf32")
+        h5roi = drymass.extract_roi(path, dir_out=dout, size_m=60e-6,
+                                    float32=float32)
+        drymass.analyze_sphere(h5roi, dir_out=dout, r0=30e-6,
+                               float32=float32)
+        stats.append(drymass.anasphere.load_statistics(dout))
+    st64, st32 = stats
+    assert np.allclose(st64["radius_um"], st32["radius_um"],
+                       rtol=1e-5, atol=0)
+    for key in ["abs_dry_mass_pg", "rel_dry_mass_pg"]:
+        assert np.allclose(st64[key], st32[key], rtol=1e-4, atol=0)
+
+
+def test_isolate_failures(monkeypatch):
+    _qpi, path, dout = setup_test_data(num=3)
+    fit_sphere = drymass.anasphere.fit_sphere
+
+    def fit_sphere_failing(qpi, **kwargs):
+        if qpi["identifier"] == "test_1":
+            raise ValueError("Bad ROI")
+        return fit_sphere(qpi, **kwargs)
+
+    monkeypatch.setattr(drymass.anasphere, "fit_sphere", fit_sphere_failing)
+    with pytest.raises(ValueError, match="ROI test_1: Bad ROI"):
+        drymass.analyze_sphere(path, dir_out=dout)
+    _h5sim, failed = drymass.analyze_sphere(path, dir_out=dout,
+                                            isolate_failures=True,
+                                            ret_failed=True)
+    assert failed == ["test_1"]
+    dout = pathlib.Path(dout)
+    stat = drymass.anasphere.load_statistics(dout)
+    assert list(stat["status"]) == ["ok", "failed-ValueError", "ok"]
+    assert np.isnan(stat["radius_um"][1])
+    assert np.allclose(stat["radius_um"][2], 30, rtol=.05, atol=0)
+    failout = dout / drymass.anasphere.FILE_SPHERE_FAILURES.format(
+        "edge", "projection")
+    report = failout.read_text()
+    assert "ROI test_1:" in report
+    assert "ValueError: Bad ROI" in report
+    # only the failed ROI is fitted again
+    monkeypatch.setattr(drymass.anasphere, "fit_sphere", fit_sphere)
+    _h5sim, reused, failed = drymass.analyze_sphere(path, dir_out=dout,
+                                                    isolate_failures=True,
+                                                    ret_reused=True,
+                                                    ret_failed=True)
+    assert reused == 2
+    assert failed == []
+    assert not failout.exists()
+    stat = drymass.anasphere.load_statistics(dout)
+    assert np.all(stat["status"] == "ok")
+
+
+def test_fit_sphere_c0():
+    qpi = qpsphere.simulate(radius=5e-6,
+                            sphere_index=1.36,
+                            medium_index=1.335,
+                            wavelength=550e-9,
+                            grid_size=(60, 60),
+                            model="projection",
+                            pixel_size=.5e-6,
+                            center=(35.2, 24.6))
+    # force the edge detection to fail (start at `c0`)
+    n, r, c, _ = drymass.anasphere.fit_sphere(
+        qpi, r0=5.5e-6, method="image", model="projection",
+        edgekw={"maxiter": 0}, c0=(34, 26))
+    assert np.abs(n - 1.36) < 1e-3
+    assert np.abs(r - 5e-6) / 5e-6 < 1e-3
+    assert np.allclose(c, (35.2, 24.6), atol=.1, rtol=0)
+
+
+def test_search_init():
+    radius = 30
+    pxsize = 1e-6
+    _qpi, path, dout = setup_test_data_roi(radius=radius, pxsize=pxsize)
+    # specimen size is off by a factor of 2.4
+    r0 = 2.4 * radius * pxsize
+    path_rois = drymass.extract_roi(path,
+                                    dir_out=dout,
+                                    size_m=2*r0,
+                                    size_var=.6)
+    with qpimage.QPSeries(h5file=path_rois, h5mode="r") as qps:
+        qpi_roi = qps[0]
+        # `r0` exceeds the ROI size
+        assert r0 / pxsize > qpi_roi.shape[0] / 2
+        meta = drymass.extractroi.get_roi_meta(qps)[qpi_roi["identifier"]]
+        n, r, c = qpsphere.edgefit.analyze(qpi=qpi_roi,
+                                           r0=meta["search radius"],
+                                           ret_center=True)
+    h5sim = drymass.analyze_sphere(path_rois, dir_out=dout, r0=r0,
+                                   search_init=True)
+    with qpimage.QPSeries(h5file=h5sim, h5mode="r") as qps_sim:
+        assert np.allclose(qps_sim[0]["sim index"], n, atol=1e-6, rtol=0)
+        assert np.allclose(qps_sim[0]["sim radius"], r, atol=0, rtol=1e-6)
+        assert np.allclose(r, radius*pxsize, atol=0, rtol=.02)
+    # disabled by default
+    with pytest.raises(qpsphere.edgefit.RadiusExceedsImageSizeError):
+        drymass.analyze_sphere(path_rois, dir_out=dout, r0=r0)
+
+
+def test_multi_model():
+    _qpi, path, dout = setup_test_data(num=2)
+    dout2 = tempfile.mkdtemp(prefix="drymass_test_sphere_")
+    imagekw = {"max_iter": 3}
+    methods = ["image", "edge"]
+    h5sims, changed, reused = drymass.analyze_sphere(
+        path, dir_out=dout, method=methods, model="projection",
+        imagekw=imagekw, ret_changed=True, ret_reused=True)
+    assert changed == [True, True]
+    assert reused == [0, 0]
+    assert h5sims[0].name == "sphere_image_projection_data.h5"
+    assert h5sims[1].name == "sphere_edge_projection_data.h5"
+    # edge analysis is the same as in a separate run
+    h5edge = drymass.analyze_sphere(path, dir_out=dout2, method="edge")
+    with qpimage.QPSeries(h5file=h5sims[1], h5mode="r") as qps1, \
+            qpimage.QPSeries(h5file=h5edge, h5mode="r") as qps2:
+        assert qps1[0]["sim index"] == qps2[0]["sim index"]
+        assert qps1[0]["sim radius"] == qps2[0]["sim radius"]
+    # the image fit is initialized with the edge result
+    stat = drymass.anasphere.load_statistics(dout, method="image")
+    assert np.allclose(stat["radius_um"], 30, atol=2, rtol=0)
+    # reuse all
+    _h5, changed, reused = drymass.analyze_sphere(
+        path, dir_out=dout, method=methods, model="projection",
+        imagekw=imagekw, ret_changed=True, ret_reused=True)
+    assert changed == [False, False]
+    assert reused == [2, 2]
+    with pytest.raises(ValueError, match="Got 2 methods, but 3 models"):
+        drymass.analyze_sphere(path, dir_out=dout, method=methods,
+                               model=["projection", "rytov", "mie"])
+    with pytest.raises(ValueError, match="Duplicate"):
+        drymass.analyze_sphere(path, dir_out=dout, method=["edge", "edge"])
+
+
+def test_params_only():
+    _qpi, path, dout = setup_test_data(num=2)
+    dout2 = tempfile.mkdtemp(prefix="drymass_test_sphere_")
+    imagekw = {"max_iter": 3}
+    h5sim = drymass.analyze_sphere(path, dir_out=dout, method="image",
+                                   imagekw=imagekw)
+    h5par = drymass.analyze_sphere(path, dir_out=dout2, method="image",
+                                   imagekw=imagekw, store_sim=False)
+    assert h5par.stat().st_size < h5sim.stat().st_size
+    with qpimage.QPSeries(h5file=h5par, h5mode="r") as qps:
+        assert len(qps) == 0
+    stat = drymass.anasphere.FILE_SPHERE_STAT.format("image", "projection")
+    assert ((pathlib.Path(dout) / stat).read_text()
+            == (pathlib.Path(dout2) / stat).read_text())
+    # recompute simulations from the fit parameters
+    params = drymass.anasphere.load_sphere_params(h5par)
+    assert sorted(params.keys()) == ["test_0:projection", "test_1:projection"]
+    with qpimage.QPSeries(h5file=h5sim, h5mode="r") as qps:
+        for ident in params:
+            qpi_ref = qps[ident]
+            qpi_sim = drymass.anasphere.simulate_sphere(params[ident])
+            assert np.allclose(qpi_sim.pha, qpi_ref.pha, atol=1e-14, rtol=0)
+            assert np.allclose(qpi_sim.amp, qpi_ref.amp, atol=1e-14, rtol=0)
+            # fitted phase offset
+            pars_off = dict(params[ident])
+            pars_off["phase offset"] += .1
+            qpi_off = drymass.anasphere.simulate_sphere(pars_off)
+            assert np.allclose(qpi_off.pha, qpi_ref.pha + .1, atol=1e-6,
+                               rtol=0)
+    # parameters of legacy files are extracted from the simulations
+    with qpimage.QPSeries(h5file=h5sim, h5mode="a") as qps:
+        del qps.h5[drymass.anasphere.H5_SPHERE_PARAMS]
+    params_legacy = drymass.anasphere.load_sphere_params(h5sim)
+    for ident in params:
+        for key in ["sim index", "sim radius", "phase offset"]:
+            assert np.allclose(params[ident][key], params_legacy[ident][key])
+        assert params[ident]["shape"] == params_legacy[ident]["shape"]
+
+
+def test_params_only_reuse():
+    _qpi, path, dout = setup_test_data(num=2)
+    drymass.analyze_sphere(path, dir_out=dout, store_sim=False)
+    _h5, changed, reused = drymass.analyze_sphere(path, dir_out=dout,
+                                                  store_sim=False,
+                                                  ret_changed=True,
+                                                  ret_reused=True)
+    assert not changed
+    assert reused == 2
+    # simulations are recomputed from the stored parameters
+    h5sim, changed, reused = drymass.analyze_sphere(path, dir_out=dout,
+                                                    ret_changed=True,
+                                                    ret_reused=True)
+    assert not changed
+    assert reused == 2
+    with qpimage.QPSeries(h5file=h5sim, h5mode="r") as qps:
+        assert len(qps) == 2
+        assert qps[1]["identifier"] == "test_1:projection"
+
+
+def test_statistics_npy():
+    _qpi, path, dout = setup_test_data(num=2)
+    drymass.analyze_sphere(path, dir_out=dout, alpha=.19)
+    stat = drymass.anasphere.load_statistics(dout)
+    assert stat.size == 2
+    assert stat["identifier"][1] == "test_1"
+    assert np.all(stat["method"] == "edge")
+    assert np.all(stat["model"] == "projection")
+    assert np.all(stat["refraction_increment"] == .19)
+    assert np.all(stat["path"] == str(pathlib.Path(dout).resolve()))
+    assert np.allclose(stat["center_x_px"], 80, atol=1, rtol=0)
+    # same values as text file
+    statxt = pathlib.Path(dout) / drymass.anasphere.FILE_SPHERE_STAT.format(
+        "edge", "projection")
+    ref = np.loadtxt(str(statxt), usecols=(1, 2, 3, 4, 6))
+    for ii, name in enumerate(["index", "radius_um", "rel_dry_mass_pg",
+                               "abs_dry_mass_pg", "medium"]):
+        assert np.allclose(stat[name], ref[:, ii], atol=0, rtol=1e-12)
+    # many datasets with different identifier lengths
+    _qpi, path2, dout2 = setup_test_data(num=11)
+    drymass.analyze_sphere(path2, dir_out=dout2)
+    stat2 = drymass.anasphere.load_statistics([dout, dout2],
+                                              method="edge")
+    assert stat2.size == 13
+    assert stat2["identifier"][-1] == "test_10"
+    assert drymass.anasphere.load_statistics(dout, method="image").size == 0
+    # fast .npy reader
+    npy = pathlib.Path(dout) / drymass.anasphere.FILE_SPHERE_STAT_NPY.format(
+        "edge", "projection")
+    ref = np.load(str(npy))
+    arr = drymass.anasphere._load_npy_1d(npy, {})
+    assert arr.dtype == ref.dtype
+    assert arr.tobytes() == ref.tobytes()
+
+
+def test_fit_timeout():
+    _qpi, path, dout = setup_test_data(num=2)
+    imagekw = {"max_iter": 100}
+    h5sim = drymass.analyze_sphere(path, dir_out=dout, method="image",
+                                   imagekw=imagekw, fit_timeout=1e-3)
+    stat = drymass.anasphere.load_statistics(dout)
+    assert np.all(stat["status"] == "fallback-timeout")
+    assert np.allclose(stat["radius_um"], 30, atol=1, rtol=0)
+    with qpimage.QPSeries(h5file=h5sim, h5mode="r") as qps:
+        assert len(qps) == 2
+        assert qps[0]["sim model"] == "projection"
+    # skip
+    _h5, changed, reused = drymass.analyze_sphere(
+        path, dir_out=dout, method="image", imagekw=imagekw,
+        fit_timeout=1e-3, timeout_fallback="skip", ret_changed=True,
+        ret_reused=True)
+    # timed-out fits are not reused
+    assert changed
+    assert reused == 0
+    stat = drymass.anasphere.load_statistics(dout)
+    assert np.all(stat["status"] == "skipped-timeout")
+    assert np.all(np.isnan(stat["index"]))
+    assert np.all(np.isnan(stat["abs_dry_mass_pg"]))
+    with qpimage.QPSeries(h5file=h5sim, h5mode="r") as qps:
+        assert len(qps) == 0
+    with pytest.raises(ValueError, match="timeout_fallback"):
+        drymass.analyze_sphere(path, dir_out=dout, fit_timeout=1e-3,
+                               timeout_fallback="image")
+
+
+def test_fit_timeout_fallback_failure(monkeypatch):
+    _qpi, path, dout = setup_test_data(num=2)
+    fit_sphere = drymass.anasphere.fit_sphere
+
+    def fit_sphere_failing(qpi, **kwargs):
+        if kwargs["method"] == "edge":
+            raise ValueError("Bad fallback")
+        return fit_sphere(qpi, **kwargs)
+
+    monkeypatch.setattr(drymass.anasphere, "fit_sphere", fit_sphere_failing)
+    imagekw = {"max_iter": 100}
+    with pytest.raises(ValueError, match="ROI test_0: Bad fallback"):
+        drymass.analyze_sphere(path, dir_out=dout, method="image",
+                               imagekw=imagekw, fit_timeout=1e-3)
+    _h5, failed = drymass.analyze_sphere(path, dir_out=dout, method="image",
+                                         imagekw=imagekw, fit_timeout=1e-3,
+                                         isolate_failures=True,
+                                         ret_failed=True)
+    assert failed == ["test_0", "test_1"]
+    stat = drymass.anasphere.load_statistics(dout)
+    assert np.all(stat["status"] == "failed-ValueError")
+
+
+def test_quality_gate():
+    _qpi, path, dout = setup_test_data(num=2)
+    # the sphere is 49px away from the border
+    h5sim, reused = drymass.analyze_sphere(
+        path, dir_out=dout, quality_gate={"min_border_margin": 60},
+        ret_reused=True)
+    stat = drymass.anasphere.load_statistics(dout)
+    assert np.all(stat["status"] == "rejected-border_margin")
+    assert np.all(np.isnan(stat["radius_um"]))
+    # the text file can be parsed by whitespace-splitting
+    stat_txt = pathlib.Path(dout) / drymass.anasphere.FILE_SPHERE_STAT.format(
+        "edge", "projection")
+    data = np.loadtxt(str(stat_txt), dtype=str)
+    assert data.shape == (2, 8)
+    assert np.all(data[:, 7] == "rejected-border_margin")
+    with qpimage.QPSeries(h5file=h5sim, h5mode="r") as qps:
+        assert len(qps) == 0
+    # rejected ROIs are fitted when the gate is relaxed
+    h5sim, reused = drymass.analyze_sphere(
+        path, dir_out=dout, quality_gate={"min_border_margin": 40},
+        ret_reused=True)
+    assert reused == 0
+    stat = drymass.anasphere.load_statistics(dout)
+    assert np.all(stat["status"] == "ok")
+    assert np.allclose(stat["radius_um"], 30, atol=1, rtol=0)
+    with qpimage.QPSeries(h5file=h5sim, h5mode="r") as qps:
+        assert len(qps) == 2
+
+
+def test_quality_gate_reused(monkeypatch):
+    _qpi, path, dout = setup_test_data(num=2)
+    compute_roi_quality = drymass.anasphere.compute_roi_quality
+    calls = []
+
+    def compute_roi_quality_counted(*args, **kwargs):
+        calls.append(1)
+        return compute_roi_quality(*args, **kwargs)
+
+    monkeypatch.setattr(drymass.anasphere, "compute_roi_quality",
+                        compute_roi_quality_counted)
+    gate = {"min_border_margin": 40}
+    # metrics are computed once per ROI for several analyses
+    drymass.analyze_sphere(path, dir_out=dout, method=["edge", "image"],
+                           model=["projection", "projection"],
+                           imagekw={"max_iter": 1}, quality_gate=gate)
+    assert len(calls) == 2
+    # metrics are not computed for reused fits
+    calls.clear()
+    _h5, reused = drymass.analyze_sphere(path, dir_out=dout,
+                                         quality_gate=gate, ret_reused=True)
+    assert reused == 2
+    assert len(calls) == 0
+    stat = drymass.anasphere.load_statistics(dout)
+    assert np.all(stat["status"] == "ok")
+
+
 @pytest.mark.filterwarnings('ignore::drymass.anasphere.'
                             + 'EdgeDetectionFailedWarning',
                             'ignore::RuntimeWarning')
@@ -93,11 +591,13 @@ def test_recompute_edge_when_otherkw_changes():
     drymass.analyze_sphere(path, dir_out=dout,
                            alpha=0.18,
                            edgekw={"clip_rmax": 1.1})
-    _p, changed = drymass.analyze_sphere(path, dir_out=dout,
-                                         alpha=0.19,
-                                         edgekw={"clip_rmax": 1.1},
-                                         ret_changed=True)
-    assert changed, "change due to other alpha"
+    _p, changed, reused = drymass.analyze_sphere(path, dir_out=dout,
+                                                 alpha=0.19,
+                                                 edgekw={"clip_rmax": 1.1},
+                                                 ret_changed=True,
+                                                 ret_reused=True)
+    assert not changed, "alpha does not affect the fit"
+    assert reused == 1
     _p, changed = drymass.analyze_sphere(path, dir_out=dout,
                                          alpha=0.19,
                                          edgekw={"clip_rmax": 1.2},
@@ -105,6 +605,27 @@ def test_recompute_edge_when_otherkw_changes():
     assert changed, "change due to other edgekw"
 
 
+def test_reuse_fit_when_alpha_rad_fact_change():
+    _qpi, path, dout = setup_test_data(num=2)
+    statout = pathlib.Path(dout) / drymass.anasphere.FILE_SPHERE_STAT.format(
+        "edge", "projection")
+    drymass.analyze_sphere(path, dir_out=dout, alpha=.18, rad_fact=1.2)
+    stat1 = np.loadtxt(str(statout), usecols=(1, 2, 3, 4))
+    _p, changed, reused = drymass.analyze_sphere(path, dir_out=dout,
+                                                 alpha=.2, rad_fact=1.5,
+                                                 ret_changed=True,
+                                                 ret_reused=True)
+    stat2 = np.loadtxt(str(statout), usecols=(1, 2, 3, 4))
+    assert not changed
+    assert reused == 2
+    # index and radius unchanged
+    assert np.all(stat1[:, :2] == stat2[:, :2])
+    # dry mass scales with 1/alpha (rad_fact does not matter here,
+    # because the background phase is zero)
+    assert np.allclose(stat1[:, 2] * .18, stat2[:, 2] * .2, rtol=1e-10,
+                       atol=0)
+
+
 def test_recompute_reuse():
     cx = 14
     cy = 16
@@ -145,6 +666,28 @@ def test_recompute_reuse():
     assert 10 * (tb1 - tb0) < ta1 - ta0
 
 
+def test_reuse_native_copy():
+    _qpi, path, dout = setup_test_data(num=3)
+    h5sim = drymass.analyze_sphere(path, dir_out=dout)
+    with qpimage.QPSeries(h5file=h5sim, h5mode="r") as qps:
+        ref = [(qpi["identifier"], qpi.pha, qpi.amp) for qpi in qps]
+        index = drymass.util.get_identifier_index(qps)
+    assert index == {"test_0:projection": 0,
+                     "test_1:projection": 1,
+                     "test_2:projection": 2}
+    # identical data after reusing all fits
+    h5sim, reused = drymass.analyze_sphere(path, dir_out=dout,
+                                           ret_reused=True)
+    assert reused == 3
+    with qpimage.QPSeries(h5file=h5sim, h5mode="r") as qps:
+        assert len(qps) == 3
+        for (ident, pha, amp), qpi in zip(ref, qps):
+            assert qpi["identifier"] == ident
+            assert np.all(qpi.pha == pha)
+            assert np.all(qpi.amp == amp)
+        assert len(drymass.anasphere.load_sphere_params(qps)) == 3
+
+
 def test_recreate_file_sphere_stat():
     _qpi, path, dout = setup_test_data()
     spkw = {"method": "edge",
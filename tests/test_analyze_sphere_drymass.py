@@ -1,7 +1,8 @@
 import numpy as np
 import qpsphere
 
-from drymass.anasphere import absolute_dry_mass_sphere, relative_dry_mass
+from drymass.anasphere import absolute_dry_mass_sphere, dry_mass_sphere, \
+    radial_phase_sum, relative_dry_mass
 
 
 def defaultsim(medium_index=1.335,
@@ -41,6 +42,27 @@ def test_equivalence():
     assert np.allclose(mabs, m_g, atol=0, rtol=.0005)
 
 
+def test_dry_mass_sphere_vectorized():
+    kwargs = defaultsim(m_g=100e-12, medium_index=1.337)
+    alphas = np.array([.17, .18, .19])
+    rad_facts = np.linspace(0, 2, 11)
+    kwargs["alpha"] = alphas.reshape(-1, 1)
+    kwargs["rad_fact"] = rad_facts
+    mrel, mabs = dry_mass_sphere(**kwargs)
+    assert mrel.shape == (3, 11)
+    assert mabs.shape == (3, 11)
+    for ii, alpha in enumerate(alphas):
+        for jj, rad_fact in enumerate(rad_facts):
+            kwargs["alpha"] = alpha
+            kwargs["rad_fact"] = rad_fact
+            assert np.allclose(mrel[ii, jj], relative_dry_mass(**kwargs),
+                               atol=0, rtol=1e-12)
+            assert np.allclose(mabs[ii, jj],
+                               absolute_dry_mass_sphere(**kwargs),
+                               atol=0, rtol=1e-12)
+    assert np.all(mrel[:, 0] == 0)
+
+
 def test_higher_medium():
     for m_g in np.linspace(30e-12, 150e-12, 4):
         for medium_index in np.linspace(1.334, 1.34, 8):
@@ -50,6 +72,21 @@ def test_higher_medium():
             assert np.allclose(mabs, m_g, atol=0, rtol=.002)
 
 
+def test_radial_phase_sum():
+    rs = np.random.RandomState(42)
+    image = rs.rand(60, 70)
+    x = np.arange(60).reshape(-1, 1)
+    y = np.arange(70).reshape(1, -1)
+    for center in [(30, 35), (2.5, 68.2), (-5, 10), (59, 0)]:
+        discsq = (x - center[0])**2 + (y - center[1])**2
+        radii = [0, 1, 2.3, 5, 30, 100, np.inf, np.nan]
+        phi_tot = radial_phase_sum(image, center=center, radii=radii)
+        for radius, phi in zip(radii, phi_tot):
+            # full-frame reference
+            ref = np.sum(image[discsq < radius**2])
+            assert np.allclose(phi, ref, atol=1e-12, rtol=1e-12)
+
+
 def test_negative():
     m_g = 5e-12
     medium_index = 1.336
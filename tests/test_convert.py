@@ -1,7 +1,10 @@
+import pathlib
 import tempfile
 
 import numpy as np
+import pytest
 import qpimage
+import tifffile
 
 import drymass
 
@@ -161,6 +164,95 @@ def test_change_wavelength():
     assert id1 != id2, "Files should have different identifiers"
 
 
+def test_chunked_sensor_data():
+    qpi, path, dout = setup_test_data(num=3, size=300)
+
+    path_out = drymass.convert(path_in=path,
+                               dir_out=dout,
+                               bg_data_amp=1,
+                               bg_data_pha=1)
+    with qpimage.QPSeries(h5file=path_out, h5mode="r") as qps:
+        assert len(qps) == 3
+        for ii in range(3):
+            assert qps.h5["qpi_{}/phase/raw".format(ii)].chunks == (128, 128)
+            assert qps[ii]["identifier"]
+        # background data are hard-linked
+        bg0 = qps.h5["qpi_0/phase/bg_data/data"]
+        bg2 = qps.h5["qpi_2/phase/bg_data/data"]
+        assert bg0.id == bg2.id
+        assert np.all(qps[2].pha == 0)
+        assert np.allclose(qps[2].amp, 1)
+
+
+def test_h5_compression():
+    qpi, path, dout = setup_test_data(num=2)
+    compression = drymass.util.get_h5_compression(method="lzf",
+                                                  shuffle=True)
+    path_out = drymass.convert(path_in=path,
+                               dir_out=dout,
+                               h5_chunks=None,
+                               h5_compression=compression)
+    with qpimage.QPSeries(h5file=path_out, h5mode="r") as qps:
+        raw = qps.h5["qpi_1/phase/raw"]
+        assert raw.compression == "lzf"
+        assert raw.shuffle
+        # one chunk per image
+        assert raw.chunks == (200, 200)
+        assert np.allclose(qps[1].pha, qpi.pha)
+        assert np.allclose(qps[1].amp, qpi.amp)
+
+
+def test_h5_compression_kwargs():
+    get_h5_compression = drymass.util.get_h5_compression
+    assert get_h5_compression() == drymass.util.H5_COMPRESSION
+    assert get_h5_compression(method="gzip", level=4, shuffle=True) == {
+        "compression": "gzip", "compression_opts": 4, "shuffle": True}
+    assert get_h5_compression(method="off", shuffle=True) == {}
+    with pytest.raises(ValueError, match="Unknown HDF5 compression"):
+        get_h5_compression(method="zip")
+    with pytest.raises(ValueError, match="compression level"):
+        get_h5_compression(level=10)
+
+
+def test_phase_only():
+    qpi, path, dout = setup_test_data(num=2)
+    path_out, changed = drymass.convert(path_in=path,
+                                        dir_out=dout,
+                                        bg_data_pha=1,
+                                        write_tif=True,
+                                        ret_changed=True)
+    assert changed
+    path_out, changed = drymass.convert(path_in=path,
+                                        dir_out=dout,
+                                        bg_data_pha=1,
+                                        write_tif=True,
+                                        phase_only=True,
+                                        ret_changed=True)
+    assert changed
+    with qpimage.QPSeries(h5file=path_out, h5mode="r") as qps:
+        assert qps.h5.attrs[drymass.converter.H5_ATTR_PHASE_ONLY]
+        # the identifier is that of the dataset (for ROIManager)
+        assert qps.identifier == qps[0]["identifier"].split(":")[0]
+        assert len(qps) == 2
+        # amplitude data are not stored
+        raw = qps.h5["qpi_1/amplitude/raw"]
+        assert raw.id.get_storage_size() == 0
+        assert np.all(qps[1].amp == 1)
+        assert np.all(qps[1].pha == 0)
+    tifout = pathlib.Path(dout) / drymass.converter.FILE_SENSOR_DATA_TIF
+    with tifffile.TiffFile(str(tifout)) as tf:
+        assert len(tf.pages) == 2
+        assert tf.asarray().shape == (2, 200, 200)
+    # phase-only data are not reused for regular conversion
+    path_out, changed = drymass.convert(path_in=path,
+                                        dir_out=dout,
+                                        bg_data_pha=1,
+                                        ret_changed=True)
+    assert changed
+    with qpimage.QPSeries(h5file=path_out, h5mode="r") as qps:
+        assert drymass.converter.H5_ATTR_PHASE_ONLY not in qps.h5.attrs
+
+
 def test_reuse():
     _qpi, path, dout = setup_test_data(num=2)
 
@@ -1,7 +1,11 @@
+import pathlib
+import shutil
 import tempfile
 
+import h5py
 import numpy as np
 import qpimage
+import tifffile
 
 import drymass
 
@@ -106,6 +110,263 @@ def test_ret_changed():
     assert not ch2, "Second call should reuse data on disk"
 
 
+def test_compute_bg_batch_float32():
+    rng = np.random.default_rng(42)
+    x = np.arange(60).reshape(-1, 1)
+    y = np.arange(80).reshape(1, -1)
+    images = rng.normal(size=(3, 60, 80)) * .01 + .2 + x * .003 - y * .001
+    masks = rng.random((3, 60, 80)) > .3
+    for kwargs in [{"border_px": 5},
+                   {"fit_profile": "poly2o", "from_masks": masks}]:
+        bg64 = drymass.extractroi.compute_bg_batch(images, **kwargs)
+        bg32 = drymass.extractroi.compute_bg_batch(
+            images.astype(np.float32), **kwargs)
+        assert bg32.dtype == np.float32
+        assert np.allclose(bg64, bg32, rtol=0, atol=1e-5)
+
+
+def test_compute_bg_batch():
+    rs = np.random.RandomState(42)
+    x = np.arange(64).reshape(-1, 1)
+    y = np.arange(80).reshape(1, -1)
+    images = []
+    for ii in range(3):
+        images.append(rs.normal(size=(64, 80)) * .01 + .003 * x * (ii + 1)
+                      - .002 * y + 1e-4 * x * y + 2e-5 * x**2 + .5 * ii)
+    images = np.array(images)
+    masks = rs.rand(*images.shape) > .3
+    for fit_profile in ["offset", "tilt", "poly2o"]:
+        for fit_offset in ["fit", "mean", "mode"]:
+            if fit_profile == "offset" and fit_offset == "fit":
+                continue
+            for from_masks in [None, masks]:
+                bgs = drymass.extractroi.compute_bg_batch(
+                    images=images,
+                    fit_offset=fit_offset,
+                    fit_profile=fit_profile,
+                    border_px=7,
+                    from_masks=from_masks)
+                for ii in range(len(images)):
+                    ref = qpimage.bg_estimate.estimate(
+                        data=images[ii],
+                        fit_offset=fit_offset,
+                        fit_profile=fit_profile,
+                        border_px=7,
+                        from_mask=None if from_masks is None else masks[ii])
+                    assert np.allclose(bgs[ii], ref, rtol=0, atol=1e-9)
+
+
+def test_cfgid_default():
+    # optional parameters must not change the default ROI identifier
+    _qpi, path, dout = setup_test_data(num=2)
+    path_rois = drymass.extract_roi(path, dir_out=dout, size_m=60e-6)
+    with qpimage.QPSeries(h5file=path_rois, h5mode="r") as qps:
+        # identifier of DryMass 0.12.0
+        assert qps.identifier == "None:c61ffb:full"
+    path_rois = drymass.extract_roi(path, dir_out=dout, size_m=60e-6,
+                                    float32=True)
+    with qpimage.QPSeries(h5file=path_rois, h5mode="r") as qps:
+        assert qps.identifier != "None:c61ffb:full"
+
+
+def test_fft_friendly():
+    radius = 30
+    pxsize = 1e-6
+    _qpi, path, dout = setup_test_data(radius=radius, pxsize=pxsize,
+                                       num=2)
+    path_out = drymass.extract_roi(path,
+                                   dir_out=dout,
+                                   size_m=2*radius*pxsize,
+                                   fft_friendly=True)
+    with qpimage.QPSeries(h5file=path_out, h5mode="r") as qpso:
+        assert len(qpso) == 2
+        for qpi in qpso:
+            # 60px object plus 2 * 40px padding (next ladder size)
+            assert qpi.shape == (192, 192)
+    # the option invalidates previous ROI data
+    _p, changed = drymass.extract_roi(path,
+                                      dir_out=dout,
+                                      size_m=2*radius*pxsize,
+                                      ret_changed=True)
+    assert changed
+
+
+def test_force_roi_same_as_slices():
+    """The fast path for `force_roi` must produce the same output"""
+    x = np.arange(200).reshape(-1, 1)
+    y = np.arange(200).reshape(1, -1)
+    bg = .3 + x * .002 - y * .001
+    _qpi, path, dout = setup_test_data(num=3, bg=bg, identifier="tfr")
+    bg_pha_kw = {"fit_offset": "mean",
+                 "fit_profile": "poly2o",
+                 "border_perc": 5,
+                 "border_px": 5}
+    kwargs = {"size_m": 60e-6,
+              "bg_pha_kw": bg_pha_kw,
+              "bg_pha_bin": "li",
+              "ignore_data": ["2"],
+              }
+    path_out1 = drymass.extract_roi(path,
+                                    dir_out=dout,
+                                    force_roi=((20, 150), (50, 170)),
+                                    **kwargs)
+    # use the slices file of the first run without the fast path
+    dout2 = tempfile.mkdtemp(prefix="drymass_test_roi_")
+    slout = pathlib.Path(dout) / drymass.extractroi.FILE_SLICES
+    shutil.copy(slout, dout2)
+    path_out2 = drymass.extract_roi(path,
+                                    dir_out=dout2,
+                                    search_enabled=False,
+                                    **kwargs)
+
+    def compare(name, obj):
+        obj2 = h5b[name]
+        assert dict(obj.attrs) == dict(obj2.attrs)
+        if isinstance(obj, h5py.Dataset):
+            assert obj.dtype == obj2.dtype
+            assert np.all(obj[()] == obj2[()])
+
+    with h5py.File(path_out1, "r") as h5a, h5py.File(path_out2, "r") as h5b:
+        assert len(h5a) == 2
+        assert "estimate_bg_from_mask" in h5a["qpi_1/phase"]
+        assert sorted(h5a.keys()) == sorted(h5b.keys())
+        h5a.visititems(compare)
+
+    tif1 = tifffile.imread(str(pathlib.Path(dout) / "roi_data.tif"))
+    tif2 = tifffile.imread(str(pathlib.Path(dout2) / "roi_data.tif"))
+    assert tif1.shape == tif2.shape
+    assert np.all(tif1 == tif2)
+
+
+def test_phase_only():
+    x = np.arange(200).reshape(-1, 1)
+    y = np.arange(200).reshape(1, -1)
+    bg = .3 + x * .002 - y * .001
+    _qpi, path, dout = setup_test_data(num=2, bg=bg, identifier="tpo")
+    kwargs = {"size_m": 60e-6,
+              "bg_pha_bin": "li",
+              }
+    path_out1, rmgr = drymass.extract_roi(path, dir_out=dout,
+                                          ret_roimgr=True, **kwargs)
+    dout2 = tempfile.mkdtemp(prefix="drymass_test_roi_")
+    path_out2 = drymass.extract_roi(path, dir_out=dout2, phase_only=True,
+                                    **kwargs)
+    # the fast path for `force_roi` must produce the same output
+    dout3 = tempfile.mkdtemp(prefix="drymass_test_roi_")
+    slx, sly = rmgr.rois[0].roi_slice
+    sx = slx.stop - slx.start
+    sy = sly.stop - sly.start
+    path_out3 = drymass.extract_roi(path, dir_out=dout3, phase_only=True,
+                                    force_roi=((slx.start, slx.stop),
+                                               (sly.start, sly.stop)),
+                                    **kwargs)
+    with qpimage.QPSeries(h5file=path_out1, h5mode="r") as qps1, \
+            qpimage.QPSeries(h5file=path_out2, h5mode="r") as qps2, \
+            qpimage.QPSeries(h5file=path_out3, h5mode="r") as qps3:
+        assert len(qps2) == len(qps3) == 2
+        for ii in range(2):
+            assert np.allclose(qps1[ii].pha, qps2[ii].pha, atol=1e-6)
+            assert np.allclose(qps2[ii].pha, qps3[ii].pha, atol=1e-6)
+            for qps in [qps2, qps3]:
+                raw = qps.h5["qpi_{}/amplitude/raw".format(ii)]
+                assert raw.id.get_storage_size() == 0
+                assert np.all(qps[ii].amp == 1)
+    for dd in [dout2, dout3]:
+        tif = tifffile.imread(str(pathlib.Path(dd) / "roi_data.tif"))
+        assert tif.shape == (2, sx, sy)
+
+
+def test_get_roi_qpimage():
+    size = 200
+    x = np.arange(size).reshape(-1, 1)
+    y = np.arange(size).reshape(1, -1)
+    pha = np.sin(x / 10) * np.cos(y / 7) + 2
+    amp = 1 + np.sin(y / 5) * np.cos(x / 9) * .1
+    qpi = qpimage.QPImage(data=(pha, amp),
+                          bg_data=(np.cos(x / 3) + y / 200 + 0 * x,
+                                   1 + x / 400 + 0 * y),
+                          which_data="phase,amplitude",
+                          meta_data={"pixel size": 1e-6})
+    qpi.compute_bg(which_data=["phase", "amplitude"],
+                   fit_offset="mean",
+                   fit_profile="tilt",
+                   border_px=5)
+    sl = (slice(20, 87), slice(130, 190))
+    qpi1 = qpi[sl]
+    qpi2 = drymass.extractroi.get_roi_qpimage(qpi, sl)
+    assert qpi2.shape == (67, 60)
+    assert np.allclose(qpi1.pha, qpi2.pha, rtol=0, atol=1e-14)
+    assert np.allclose(qpi1.amp, qpi2.amp, rtol=0, atol=1e-14)
+    assert np.allclose(qpi1.bg_pha, qpi2.bg_pha, rtol=0, atol=1e-14)
+    assert qpi1.meta == qpi2.meta
+
+
+def test_bg_correct_same_as_compute_bg():
+    radius = 30
+    pxsize = 1e-6
+    x = np.arange(200).reshape(-1, 1)
+    y = np.arange(200).reshape(1, -1)
+    bg = .3 + x * .002 - y * .001
+    qpi, path, dout = setup_test_data(radius=radius, pxsize=pxsize, bg=bg)
+    bg_pha_kw = {"fit_offset": "mean",
+                 "fit_profile": "poly2o",
+                 "border_perc": 5,
+                 "border_px": 5}
+    path_out, rmgr = drymass.extract_roi(
+        path,
+        dir_out=dout,
+        size_m=2*radius*pxsize,
+        bg_pha_kw=bg_pha_kw,
+        bg_pha_bin="li",
+        bg_pha_mask_radial_clearance=1.1,
+        ret_roimgr=True)
+
+    with qpimage.QPSeries(h5file=path_out, h5mode="r") as qpso:
+        qpi_roi = qpso.get_qpimage(0)
+        # reference
+        qpi_ref = qpi[rmgr.rois[0].roi_slice]
+        mask1 = drymass.threshold.image2mask(qpi_ref.pha,
+                                             value_or_method="li",
+                                             invert=True)
+        mask2 = qpi_roi.h5["phase"]["estimate_bg_from_mask"][:]
+        assert np.all(mask2 <= mask1)
+        qpi_ref.compute_bg(which_data="phase", from_mask=mask2, **bg_pha_kw)
+        assert np.allclose(qpi_roi.pha, qpi_ref.pha, rtol=0, atol=1e-6)
+        attrs = qpi_roi.h5["phase"]["bg_data"]["fit"].attrs
+        attrs_ref = qpi_ref.h5["phase"]["bg_data"]["fit"].attrs
+        for key in ["border_px", "fit_offset", "fit_profile"]:
+            assert attrs[key] == attrs_ref[key]
+
+
+def test_search_meta():
+    radius = 30
+    pxsize = 1e-6
+    cx = 80
+    cy = 120
+    _qpi, path, dout = setup_test_data(radius=radius, pxsize=pxsize,
+                                       cx=cx, cy=cy)
+    path_out, rmgr = drymass.extract_roi(path,
+                                         dir_out=dout,
+                                         size_m=2*radius*pxsize,
+                                         ret_roimgr=True)
+    sx, sy = rmgr.rois[0].roi_slice
+    with qpimage.QPSeries(h5file=path_out, h5mode="r") as qps:
+        roi_meta = drymass.extractroi.get_roi_meta(qps)
+        meta = roi_meta[qps[0]["identifier"]]
+    # relative to the ROI
+    assert np.allclose(meta["search center"], (cx - sx.start, cy - sy.start))
+    assert np.allclose(meta["search radius"], radius*pxsize, rtol=.01)
+    # no search geometry when the ROI is forced
+    dout2 = tempfile.mkdtemp(prefix="drymass_test_roi_")
+    path_out2 = drymass.extract_roi(path,
+                                    dir_out=dout2,
+                                    size_m=2*radius*pxsize,
+                                    force_roi=((sx.start, sx.stop),
+                                               (sy.start, sy.stop)))
+    with qpimage.QPSeries(h5file=path_out2, h5mode="r") as qps:
+        assert drymass.extractroi.get_roi_meta(qps) == {}
+
+
 def test_no_search():
     radius = 30
     pxsize = 1e-6
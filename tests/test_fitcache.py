@@ -0,0 +1,122 @@
+import os
+import tempfile
+
+import numpy as np
+import qpimage
+import qpsphere
+
+import drymass
+import drymass.fitcache
+from drymass.fitcache import SphereFitCache
+
+from test_analyze_sphere import setup_test_data
+
+
+def test_cache_reuse_across_datasets():
+    cache = SphereFitCache(path=tempfile.mkdtemp(prefix="drymass_cache_"))
+    _qpi, path, dout = setup_test_data(num=2)
+    _p, reused = drymass.analyze_sphere(path, dir_out=dout,
+                                        fit_cache=cache,
+                                        ret_reused=True)
+    # the two ROIs are identical
+    assert reused == 1
+    # same data in a different dataset (new output directory)
+    _qpi, path2, dout2 = setup_test_data(num=3)
+    p2, reused2 = drymass.analyze_sphere(path2, dir_out=dout2,
+                                         fit_cache=cache,
+                                         ret_reused=True)
+    assert reused2 == 3
+    with qpimage.QPSeries(h5file=p2, h5mode="r") as qps:
+        assert len(qps) == 3
+        assert qps[2]["identifier"] == "test_2:projection"
+        assert np.allclose(qps[2]["sim radius"], 30e-6, rtol=.05, atol=0)
+
+
+def test_cache_key():
+    qpi, _path, _dout = setup_test_data()
+    kw = {"r0": 10e-6,
+          "method": "image",
+          "model": "projection",
+          "edgekw": {},
+          "imagekw": {"max_iter": 10}}
+    key = SphereFitCache.get_key(qpi, **kw)
+    assert len(key) == 64
+    assert key == SphereFitCache.get_key(qpi.copy(), **kw)
+    kw["imagekw"] = {"max_iter": 10, "verbose": 1}
+    assert key == SphereFitCache.get_key(qpi, **kw)
+    kw["imagekw"] = {"max_iter": 11}
+    assert key != SphereFitCache.get_key(qpi, **kw)
+    # imagekw is not relevant for edge detection
+    kw["method"] = "edge"
+    assert (SphereFitCache.get_key(qpi, **kw)
+            == SphereFitCache.get_key(qpi, **dict(kw, imagekw={})))
+    # data
+    qpi2 = qpi.copy()
+    qpi2.set_bg_data(bg_data=.1 * np.ones(qpi.shape), which_data="phase")
+    assert (SphereFitCache.get_key(qpi, **kw)
+            != SphereFitCache.get_key(qpi2, **kw))
+
+
+def test_cache_size_overwrite():
+    qpi_sim = qpsphere.simulate(radius=5e-6,
+                                sphere_index=1.36,
+                                medium_index=1.335,
+                                wavelength=550e-9,
+                                grid_size=(40, 40),
+                                model="projection",
+                                pixel_size=1e-6)
+    cache = SphereFitCache(path=tempfile.mkdtemp(prefix="drymass_cache_"))
+    key = "{:064x}".format(1)
+    cache.set(key, qpi_sim)
+    cache.set(key, qpi_sim)
+    assert cache._size == os.path.getsize(cache._entry_path(key))
+
+
+def test_cache_key_version(monkeypatch):
+    qpi, _path, _dout = setup_test_data()
+    kw = {"r0": 10e-6,
+          "method": "edge",
+          "model": "projection",
+          "edgekw": {},
+          "imagekw": {}}
+    key = SphereFitCache.get_key(qpi, **kw)
+    # changes in the DryMass fit pipeline invalidate the cache
+    monkeypatch.setattr(drymass.fitcache, "version", "0.0.0")
+    assert key != SphereFitCache.get_key(qpi, **kw)
+
+
+def test_cache_lru_eviction():
+    qpi_sim = qpsphere.simulate(radius=5e-6,
+                                sphere_index=1.36,
+                                medium_index=1.335,
+                                wavelength=550e-9,
+                                grid_size=(40, 40),
+                                model="projection",
+                                pixel_size=1e-6)
+    cache = SphereFitCache(path=tempfile.mkdtemp(prefix="drymass_cache_"))
+    keys = ["{:064x}".format(ii) for ii in range(4)]
+    for ii, key in enumerate(keys):
+        cache.set(key, qpi_sim)
+        # well-defined modification times
+        path = cache._entry_path(key)
+        os.utime(path, (ii, ii))
+    size = os.path.getsize(cache._entry_path(keys[0]))
+    # use the first entry
+    assert cache.get(keys[0]) is not None
+    cache.max_size = 2.5 * size
+    cache.evict()
+    assert keys[0] in cache
+    assert keys[1] not in cache
+    assert keys[2] not in cache
+    assert keys[3] in cache
+    assert cache.get(keys[1]) is None
+    cache.clear()
+    assert keys[0] not in cache
+
+
+if __name__ == "__main__":
+    # Run all tests
+    loc = locals()
+    for key in list(loc.keys()):
+        if key.startswith("test_") and hasattr(loc[key], "__call__"):
+            loc[key]()
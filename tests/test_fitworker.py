@@ -0,0 +1,94 @@
+import time
+
+import numpy as np
+import pytest
+import qpsphere
+
+from drymass.anasphere import fit_sphere
+from drymass.fitworker import (SphereFitTimeoutError, SphereFitWorker,
+                               qpi_from_dict, qpi_to_dict)
+
+
+def setup_qpi():
+    qpi = qpsphere.simulate(radius=5e-6,
+                            sphere_index=1.36,
+                            medium_index=1.335,
+                            wavelength=550e-9,
+                            grid_size=(60, 60),
+                            model="projection",
+                            pixel_size=.5e-6)
+    qpi["identifier"] = "test"
+    return qpi
+
+
+def test_qpi_dict():
+    qpi = setup_qpi()
+    qpi.set_bg_data(bg_data=.1 * np.ones(qpi.shape), which_data="phase")
+    qpi2 = qpi_from_dict(qpi_to_dict(qpi))
+    assert np.allclose(qpi.pha, qpi2.pha, atol=1e-14, rtol=0)
+    assert np.allclose(qpi.amp, qpi2.amp, atol=1e-14, rtol=0)
+    assert np.allclose(qpi.bg_pha, qpi2.bg_pha, atol=1e-14, rtol=0)
+    assert qpi2["identifier"] == "test"
+    assert qpi2["sim radius"] == 5e-6
+
+
+def test_worker_fit():
+    qpi = setup_qpi()
+    n, r, c, qpi_sim = fit_sphere(qpi, r0=5e-6)
+    with SphereFitWorker(timeout=60) as worker:
+        for _ in range(2):
+            n2, r2, c2, qpi_sim2 = worker.fit_sphere(qpi, r0=5e-6)
+            assert n == n2
+            assert r == r2
+            assert np.all(c == c2)
+            assert np.allclose(qpi_sim.pha, qpi_sim2.pha, atol=1e-14, rtol=0)
+
+
+def test_worker_fit_error():
+    qpi = setup_qpi()
+    with SphereFitWorker(timeout=60) as worker:
+        with pytest.raises(ValueError, match="requires `model='projection'`"):
+            worker.fit_sphere(qpi, r0=5e-6, model="rytov",
+                              edge_fit={"edge center": (30, 30),
+                                        "edge radius": 5e-6})
+        # worker is still usable
+        worker.fit_sphere(qpi, r0=5e-6)
+
+
+def test_worker_fit_error_traceback():
+    qpi = setup_qpi()
+    with SphereFitWorker(timeout=60) as worker:
+        with pytest.raises(ValueError) as excinfo:
+            worker.fit_sphere(qpi, r0=5e-6, model="rytov",
+                              edge_fit={"edge center": (30, 30),
+                                        "edge radius": 5e-6})
+    msg = str(excinfo.value)
+    assert msg.startswith("`method='edge'` requires `model='projection'`")
+    # the traceback of the worker process is included
+    assert "Traceback of the fit worker" in msg
+    assert "anasphere.py" in msg
+    assert "in fit_sphere" in msg
+
+
+def test_worker_timeout():
+    qpi = setup_qpi()
+    worker = SphereFitWorker(timeout=.01)
+    t0 = time.perf_counter()
+    with pytest.raises(SphereFitTimeoutError):
+        worker.fit_sphere(qpi, r0=5e-6, method="image", model="rytov")
+    assert time.perf_counter() - t0 < 5
+    assert worker._proc is None
+    # worker is restarted
+    worker.timeout = 60
+    n, _r, _c, _qpi_sim = worker.fit_sphere(qpi, r0=5e-6)
+    assert np.allclose(n, 1.36, atol=.01, rtol=0)
+    worker.close()
+    assert worker._proc is None
+
+
+if __name__ == "__main__":
+    # Run all tests
+    loc = locals()
+    for key in list(loc.keys()):
+        if key.startswith("test_") and hasattr(loc[key], "__call__"):
+            loc[key]()
@@ -0,0 +1,68 @@
+import numpy as np
+import qpimage
+import qpsphere
+
+from drymass import quality
+
+
+def simulate(centers, radius=6e-6, size=80):
+    pha = 0
+    for center in centers:
+        qpi = qpsphere.simulate(radius=radius,
+                                sphere_index=1.36,
+                                medium_index=1.335,
+                                wavelength=550e-9,
+                                grid_size=(size, size),
+                                model="projection",
+                                pixel_size=.5e-6,
+                                center=center)
+        pha = pha + qpi.pha
+    return qpimage.QPImage(data=pha, which_data="phase", meta_data=qpi.meta)
+
+
+def test_check_roi_quality():
+    metrics = {"contrast": 1,
+               "circularity": np.nan,
+               "symmetry": .5,
+               "border margin": -1,
+               }
+    assert quality.check_roi_quality(metrics) is None
+    assert quality.check_roi_quality(metrics, min_contrast=.5) is None
+    assert quality.check_roi_quality(metrics, min_contrast=2) == "contrast"
+    # invalid metrics are always rejected
+    assert quality.check_roi_quality(metrics,
+                                     min_circularity=0) == "circularity"
+    reason = quality.check_roi_quality(metrics,
+                                       min_symmetry=.8,
+                                       min_border_margin=0)
+    assert reason == "symmetry+border_margin"
+
+
+def test_compute_roi_quality():
+    good = quality.compute_roi_quality(simulate([(40, 40)]), r0=6e-6)
+    assert set(good.keys()) == set(quality.QUALITY_METRICS)
+    assert good["contrast"] > 1
+    assert good["circularity"] > .95
+    assert good["symmetry"] > .9
+    assert np.allclose(good["border margin"], 40 - 1 - 12, atol=1)
+    # doublet
+    doublet = quality.compute_roi_quality(simulate([(40, 28), (40, 52)]),
+                                          r0=6e-6)
+    assert doublet["symmetry"] < .5
+    # clipped by the ROI border
+    clipped = quality.compute_roi_quality(simulate([(40, 72)]), r0=6e-6)
+    assert clipped["border margin"] < 0
+    # background only
+    rng = np.random.default_rng(42)
+    noise = qpimage.QPImage(data=rng.normal(0, .05, (80, 80)),
+                            which_data="phase",
+                            meta_data={"pixel size": .5e-6})
+    assert quality.compute_roi_quality(noise, r0=6e-6)["contrast"] < .2
+
+
+if __name__ == "__main__":
+    # Run all tests
+    loc = locals()
+    for key in list(loc.keys()):
+        if key.startswith("test_") and hasattr(loc[key], "__call__"):
+            loc[key]()
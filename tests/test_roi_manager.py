@@ -47,6 +47,27 @@ def test_save_load():
         assert rmg2.get_from_image_index(ii) == rmg.get_from_image_index(ii)
 
 
+def test_save_load_search_geometry():
+    rmg = roi.ROIManager(identifier="test")
+    rmg.add((slice(4, 10), slice(5, 10)), 1, 1, "test_1",
+            search_center=(7.123, 7.5), search_diameter=4.5)
+    rmg.add((slice(14, 20), slice(5, 10)), 1, 2, "test_2")
+
+    tdir = tempfile.mkdtemp(prefix="test_drymass_roi_manager_")
+    path = pathlib.Path(tdir) / "test_roi.txt"
+    rmg.save(path)
+
+    rmg2 = roi.ROIManager(identifier="test")
+    rmg2.load(path)
+    roi1, roi2 = rmg2.get_from_image_index(1)
+    assert roi1.roi_slice == (slice(4, 10), slice(5, 10))
+    assert roi1.search_center == (7.12, 7.5)
+    assert roi1.search_diameter == 4.5
+    # ROIs without search geometry (e.g. files of previous versions)
+    assert roi2.search_center is None
+    assert roi2.search_diameter is None
+
+
 def test_valueerror():
     try:
         roi.ROIManager(identifier=2)
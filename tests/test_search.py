@@ -49,6 +49,26 @@ def test_bg_overlap():
     assert len(slices2) == 0
 
 
+def test_geometry():
+    size = 200
+    x = np.arange(size).reshape(-1, 1)
+    y = np.arange(size).reshape(1, -1)
+    cx = 80
+    cy = 120
+    radius = 30
+    r = np.sqrt((x - cx)**2 + (y - cy)**2)
+    image = (r < radius) * 1.3
+    qpi = qpimage.QPImage(data=image,
+                          which_data="phase",
+                          meta_data={"pixel size": 1e-6})
+    slices, geometry = search.search_phase_objects(qpi=qpi,
+                                                   size_m=50e-6,
+                                                   ret_geometry=True)
+    assert len(slices) == len(geometry) == 1
+    assert np.allclose(geometry[0]["center"], (cx, cy))
+    assert np.allclose(geometry[0]["diameter"], 2 * radius, atol=.2, rtol=0)
+
+
 def test_padding():
     size = 200
     x = np.arange(size).reshape(-1, 1)
@@ -89,6 +109,110 @@ def test_padding():
     assert slice3[1].start == 0
 
 
+def test_float32():
+    size = 200
+    x = np.arange(size).reshape(-1, 1)
+    y = np.arange(size).reshape(1, -1)
+    r = np.sqrt((x - 80)**2 + (y - 120)**2)
+    image = (r < 30) * 1.3 + .3 + x * .002
+    bg64 = search.approx_bg(image)
+    bg32 = search.approx_bg(image.astype(np.float32))
+    assert bg32.dtype == np.float32
+    assert np.allclose(bg64, bg32, rtol=0, atol=1e-5)
+    qpi = qpimage.QPImage(data=image,
+                          which_data="phase",
+                          meta_data={"pixel size": 1e-6})
+    kw = {"qpi": qpi, "size_m": 60e-6, "ret_geometry": True}
+    assert (search.search_phase_objects(**kw)
+            == search.search_phase_objects(float32=True, **kw))
+
+
+def test_fft_size():
+    assert search.fft_size(1) == 1
+    assert search.fft_size(227) == 240
+    assert search.fft_size(240) == 240
+    assert search.fft_size(227, larger=False) == 225
+    assert search.fft_size(7, larger=False) == 6
+
+
+def test_fft_ladder_size():
+    sizes = [search.fft_ladder_size(n) for n in range(1, 1025)]
+    assert sorted(set(sizes)) == [1, 2, 3, 4, 6, 8, 12, 16, 24, 32, 48, 64,
+                                  96, 128, 192, 256, 384, 512, 768, 1024]
+    assert search.fft_ladder_size(96) == 96
+    assert search.fft_ladder_size(96.5) == 128
+    assert search.fft_ladder_size(129) == 192
+    for n in range(1, 1025):
+        assert search.fft_ladder_size(n) >= n
+
+
+def test_fft_friendly():
+    size = 200
+    x = np.arange(size).reshape(-1, 1)
+    y = np.arange(size).reshape(1, -1)
+    cx = 80
+    cy = 120
+    radius = 30
+    r = np.sqrt((x - cx)**2 + (y - cy)**2)
+    image = (r < radius) * 1.3
+    qpi = qpimage.QPImage(data=image,
+                          which_data="phase",
+                          meta_data={"pixel size": 1e-6})
+    [sl] = search.search_phase_objects(qpi=qpi,
+                                       size_m=2 * radius * 1e-6,
+                                       pad_border=20,
+                                       fft_friendly=True)
+    # 60px object plus 2 * 20px padding (next ladder size is 128)
+    assert sl[0].stop - sl[0].start == 128
+    assert sl[1].stop - sl[1].start == 128
+    assert sl[0].start == 16
+    assert sl[1].start == 56
+    # ROI is shifted into the image
+    [sl] = search.search_phase_objects(qpi=qpi,
+                                       size_m=2 * radius * 1e-6,
+                                       pad_border=60,
+                                       fft_friendly=True)
+    assert sl[0].stop - sl[0].start == 192
+    assert sl[1].stop - sl[1].start == 192
+    assert sl[0].start == 0
+    assert sl[1].start == 8
+    # ROI is cropped to the image size
+    [sl] = search.search_phase_objects(qpi=qpi,
+                                       size_m=2 * radius * 1e-6,
+                                       pad_border=80,
+                                       fft_friendly=True)
+    assert sl[0] == slice(0, 200)
+    assert sl[1] == slice(0, 200)
+
+
+def test_fft_friendly_population():
+    """Objects of varying size share only a few ROI shapes"""
+    size = 800
+    x = np.arange(size).reshape(-1, 1)
+    y = np.arange(size).reshape(1, -1)
+    image = np.zeros((size, size))
+    rs = np.random.RandomState(47)
+    radii = rs.uniform(18, 32, size=16)
+    for ii, radius in enumerate(radii):
+        cx = 100 + 200 * (ii // 4)
+        cy = 100 + 200 * (ii % 4)
+        image[np.sqrt((x - cx)**2 + (y - cy)**2) < radius] = 1.3
+    qpi = qpimage.QPImage(data=image,
+                          which_data="phase",
+                          meta_data={"pixel size": 1e-6})
+    kw = {"qpi": qpi, "size_m": 50e-6, "pad_border": 20}
+    slices = search.search_phase_objects(**kw)
+    assert len(slices) == 16
+    # without `fft_friendly`, (almost) all ROIs have a different shape
+    shapes = [(s0.stop - s0.start, s1.stop - s1.start) for s0, s1 in slices]
+    assert len(set(shapes)) > 8
+    slices = search.search_phase_objects(fft_friendly=True, **kw)
+    assert len(slices) == 16
+    shapes = [(s0.stop - s0.start, s1.stop - s1.start) for s0, s1 in slices]
+    assert set(shapes) <= {(96, 96), (128, 128)}
+    assert len(set(shapes)) == 2
+
+
 def test_threshold_float():
     size = 200
     image = np.zeros((size, size), dtype=float)
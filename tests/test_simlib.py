@@ -0,0 +1,131 @@
+import tempfile
+
+import numpy as np
+import qpimage
+import qpsphere
+
+import drymass
+from drymass.simlib import SphereSimLibrary, radial_profile
+
+
+def setup_library():
+    return SphereSimLibrary(path=tempfile.mkdtemp(prefix="drymass_simlib_"),
+                            radii_rel=np.linspace(.5, 1.5, 11),
+                            delta_indices=np.linspace(.01, .05, 5))
+
+
+def test_analyze_sphere_with_library():
+    qpi = qpsphere.simulate(radius=7e-6,
+                            sphere_index=1.355,
+                            medium_index=1.335,
+                            wavelength=550e-9,
+                            grid_size=(80, 80),
+                            model="projection",
+                            pixel_size=.5e-6,
+                            center=(40.2, 38.9))
+    path = tempfile.mktemp(suffix=".h5", prefix="drymass_test_simlib")
+    dout = tempfile.mkdtemp(prefix="drymass_test_simlib_")
+    with qpimage.QPSeries(h5file=path, identifier="abc:def:ghi") as qps:
+        qps.add_qpimage(qpi, identifier="test_0")
+    lib = setup_library()
+    drymass.analyze_sphere(path, dir_out=dout, r0=6e-6, method="image",
+                           imagekw={"max_iter": 5}, sim_library=lib)
+    assert len(list(lib.path.glob("*.npz"))) == 1
+    stat = drymass.anasphere.load_statistics(dout)
+    assert np.allclose(stat["radius_um"], 7, atol=.1, rtol=0)
+    assert np.allclose(stat["index"], 1.355, atol=1e-3, rtol=0)
+
+
+def test_initial_guess():
+    qpi = qpsphere.simulate(radius=6e-6,
+                            sphere_index=1.365,
+                            medium_index=1.335,
+                            wavelength=550e-9,
+                            grid_size=(80, 80),
+                            model="projection",
+                            pixel_size=.5e-6,
+                            center=(38.5, 41.2))
+    lib = setup_library()
+    init = lib.initial_guess(qpi, r0=6e-6, model="projection")
+    assert np.allclose(init["radius"], 6e-6)
+    assert np.allclose(init["index"], 1.365)
+    assert np.allclose(init["center"], (38.5, 41.2), atol=.1, rtol=0)
+    init2 = lib.initial_guess(qpi, r0=6e-6, model="projection",
+                              center=(38.5, 41.2))
+    assert init2["center"] == (38.5, 41.2)
+    # library is loaded from disk
+    lib2 = SphereSimLibrary(path=lib.path,
+                            radii_rel=lib.radii_rel,
+                            delta_indices=lib.delta_indices)
+
+    def not_computed(*args, **kwargs):
+        assert False, "library should be loaded from disk"
+
+    lib2._compute_library = not_computed
+    assert lib2.initial_guess(qpi, r0=6e-6, model="projection") == init
+    # a different instrument profile requires a new library
+    assert lib.get_key("projection", 550e-9, .5e-6, 1.335, 6e-6) \
+        != lib.get_key("projection", 550e-9, .5e-6, 1.333, 6e-6)
+
+
+def test_initial_guess_poor_match():
+    lib = setup_library()
+    kw = {"radius": 6e-6,
+          "medium_index": 1.335,
+          "wavelength": 550e-9,
+          "grid_size": (80, 80),
+          "model": "projection",
+          "pixel_size": .5e-6}
+    # negative contrast is not covered by the library
+    qpi = qpsphere.simulate(sphere_index=1.31, **kw)
+    assert lib.initial_guess(qpi, r0=6e-6, model="projection") is None
+    # refractive index far below the library
+    qpi = qpsphere.simulate(sphere_index=1.337, **kw)
+    assert lib.initial_guess(qpi, r0=6e-6, model="projection") is None
+    # no phase contrast at all
+    qpi = qpsphere.simulate(sphere_index=1.335, **kw)
+    assert lib.initial_guess(qpi, r0=6e-6, model="projection") is None
+    # a good match is not rejected
+    qpi = qpsphere.simulate(sphere_index=1.355, **kw)
+    assert lib.initial_guess(qpi, r0=6e-6, model="projection",
+                             min_match=.99) is not None
+
+
+def test_analyze_sphere_with_library_negative_contrast():
+    """Objects that do not match the library are fitted nevertheless"""
+    qpi = qpsphere.simulate(radius=7e-6,
+                            sphere_index=1.32,
+                            medium_index=1.335,
+                            wavelength=550e-9,
+                            grid_size=(80, 80),
+                            model="projection",
+                            pixel_size=.5e-6,
+                            center=(40.2, 38.9))
+    path = tempfile.mktemp(suffix=".h5", prefix="drymass_test_simlib")
+    dout = tempfile.mkdtemp(prefix="drymass_test_simlib_")
+    with qpimage.QPSeries(h5file=path, identifier="abc:def:ghi") as qps:
+        qps.add_qpimage(qpi, identifier="test_0")
+    lib = setup_library()
+    drymass.analyze_sphere(path, dir_out=dout, r0=6e-6, method="image",
+                           imagekw={"max_iter": 5}, sim_library=lib)
+    stat = drymass.anasphere.load_statistics(dout)
+    assert np.allclose(stat["radius_um"], 7, atol=.2, rtol=0)
+    assert np.allclose(stat["index"], 1.32, atol=2e-3, rtol=0)
+
+
+def test_radial_profile():
+    image = np.zeros((11, 11))
+    image[5, 5] = 2
+    image[5, 6] = 1
+    image[4, 5] = 3
+    profile, counts = radial_profile(image, (5, 5), 3)
+    assert np.allclose(profile, [2, .5, 0])
+    assert np.all(counts == [1, 8, 12])
+
+
+if __name__ == "__main__":
+    # Run all tests
+    loc = locals()
+    for key in list(loc.keys()):
+        if key.startswith("test_") and hasattr(loc[key], "__call__"):
+            loc[key]()